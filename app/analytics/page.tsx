@@ -3,7 +3,7 @@
 import { useEffect, useState } from "react";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { AreaChart } from "@tremor/react";
-import { supabase } from "@/lib/supabase";
+import { getSystemStatsHistory, supabase } from "@/lib/supabase";
 
 interface GeminiDailyStats {
   date: string;
@@ -16,9 +16,18 @@ interface TopTrack {
   plays: number;
 }
 
+interface SystemLoadPoint {
+  time: string;
+  "CPU avg": number;
+  "CPU p95": number;
+  "RSS avg": number;
+  "RSS p95": number;
+}
+
 export default function AnalyticsPage() {
   const [geminiData, setGeminiData] = useState<GeminiDailyStats[]>([]);
   const [topTracks, setTopTracks] = useState<TopTrack[]>([]);
+  const [systemLoad, setSystemLoad] = useState<SystemLoadPoint[]>([]);
   const [loading, setLoading] = useState(true);
   const [debugInfo, setDebugInfo] = useState<string>("");
 
@@ -52,7 +61,8 @@ export default function AnalyticsPage() {
             if (!dailyStats[date]) {
               dailyStats[date] = { requests: 0, tokens: 0 };
             }
-            dailyStats[date].requests += 1;
+            // 集計行は1行に複数リクエスト分が入っている
+            dailyStats[date].requests += record.request_count ?? 1;
             dailyStats[date].tokens += record.total_tokens || 0;
           });
 
@@ -96,6 +106,23 @@ export default function AnalyticsPage() {
 
           setTopTracks(sortedTracks);
         }
+
+        // システム負荷（過去24時間、1時間ごとのロールアップ）
+        const oneDayAgo = new Date(Date.now() - 24 * 60 * 60 * 1000);
+        try {
+          const history = await getSystemStatsHistory("1h", oneDayAgo);
+          setSystemLoad(
+            (history || []).map((row: any) => ({
+              time: new Date(row.bucket_start).toLocaleTimeString([], { hour: "2-digit", minute: "2-digit" }),
+              "CPU avg": Number(row.cpu_usage_avg ?? 0),
+              "CPU p95": Number(row.cpu_usage_p95 ?? 0),
+              "RSS avg": Number(row.memory_rss_avg ?? 0),
+              "RSS p95": Number(row.memory_rss_p95 ?? 0),
+            }))
+          );
+        } catch (historyError) {
+          console.error("System stats history error:", historyError);
+        }
       } catch (error) {
         console.error("Error fetching analytics:", error);
         setDebugInfo(`Exception: ${error instanceof Error ? error.message : "Unknown error"}`);
@@ -156,6 +183,42 @@ export default function AnalyticsPage() {
         </CardContent>
       </Card>
 
+      <Card>
+        <CardHeader>
+          <CardTitle>System Load (Last 24 Hours)</CardTitle>
+        </CardHeader>
+        <CardContent>
+          {systemLoad.length > 0 ? (
+            <div className="space-y-6">
+              <AreaChart
+                className="h-56"
+                data={systemLoad}
+                index="time"
+                categories={["CPU avg", "CPU p95"]}
+                colors={["blue", "rose"]}
+                valueFormatter={(value) => `${value.toFixed(1)}%`}
+                showLegend={true}
+                showGridLines={true}
+              />
+              <AreaChart
+                className="h-56"
+                data={systemLoad}
+                index="time"
+                categories={["RSS avg", "RSS p95"]}
+                colors={["emerald", "amber"]}
+                valueFormatter={(value) => `${value.toFixed(0)} MB`}
+                showLegend={true}
+                showGridLines={true}
+              />
+            </div>
+          ) : (
+            <div className="h-56 flex items-center justify-center text-slate-500">
+              データ受信待ち...
+            </div>
+          )}
+        </CardContent>
+      </Card>
+
       <Card>
         <CardHeader>
           <CardTitle>Top Played Tracks</CardTitle>
@@ -14,12 +14,16 @@ interface SystemStats {
   ping_lavalink: number | null;
 }
 
+// Botは再生中のセッションを定期的に更新する。これより古い行は落ちたプロセスの残りとして表示しない
+const SESSION_TTL_MS = 5 * 60 * 1000;
+
 interface ActiveSession {
   guild_id: string;
   track_title: string | null;
   position_ms: number | null;
   duration_ms: number | null;
   is_playing: boolean | null;
+  updated_at: string | null;
 }
 
 export default function DashboardPage() {
@@ -65,7 +69,8 @@ export default function DashboardPage() {
       try {
         const { data, error } = await supabase
           .from("active_sessions")
-          .select("*");
+          .select("*")
+          .gte("updated_at", new Date(Date.now() - SESSION_TTL_MS).toISOString());
 
         if (error) {
           console.error("Error fetching sessions:", error);
@@ -192,6 +197,7 @@ export default function DashboardPage() {
                     positionMs={session.position_ms}
                     durationMs={session.duration_ms}
                     isPlaying={session.is_playing}
+                    updatedAt={session.updated_at}
                   />
                 ))}
               </div>
@@ -0,0 +1,200 @@
+"""
+active_sessions 差分同期
+ギルドごとに最後に書き込んだ状態を保持し、変更されたフィールドだけをまとめてUPSERTする
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+SESSION_FIELDS = (
+    "track_title",
+    "position_ms",
+    "duration_ms",
+    "is_playing",
+    "voice_members_count"
+)
+
+
+class ActiveSessionSync:
+    """active_sessions の書き込みを差分化・合体・デバウンスするクラス
+
+    - 前回書き込んだ値と同じフィールドは送らない
+    - 再生中の position_ms は updated_at からダッシュボード側で推定できるため、
+      推定値とのずれが position_tolerance_ms を超えたとき、または
+      heartbeat 秒ごとにだけ変更として扱う
+    - 書き込む行には必ず updated_at を付け、推定の基準がずれないよう position_ms も付ける
+    - 変更が無くても heartbeat 秒ごとに updated_at を更新する（生存確認。
+      更新が止まった行は prune_stale_active_sessions で削除される）
+    - 同じ列構成の行は1回の複数行UPSERTにまとめる
+    - debounce 秒以内の連続した状態変化（一時停止→再開など）は最終状態だけを書き込む
+    """
+
+    def __init__(
+        self,
+        upsert_fn: Callable[[List[Dict]], Awaitable],
+        debounce: float = 1.5,
+        position_tolerance_ms: int = 5000,
+        heartbeat: float = 60.0
+    ):
+        """
+        Args:
+            upsert_fn: 行のリストを受け取り active_sessions に一括UPSERTする非同期関数
+            debounce: 状態変化を書き込むまでの待機時間（秒）
+            position_tolerance_ms: 推定位置とのずれがこれ以下なら position_ms を送らない
+            heartbeat: 変更が無くても行を書き込む間隔（秒）
+        """
+        self.upsert_fn = upsert_fn
+        self.debounce = debounce
+        self.position_tolerance_ms = position_tolerance_ms
+        self.heartbeat = heartbeat
+
+        # guild_id -> 最後に書き込んだフィールド
+        self._shadow: Dict[str, Dict] = {}
+        # guild_id -> 最後に行を書き込んだ時刻（monotonic）
+        self._written_at: Dict[str, float] = {}
+        # guild_id -> (書き込み待ちのフィールド, 最終変更時刻)
+        self._pending: Dict[str, tuple] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_lock = asyncio.Lock()
+
+        self.stats = {
+            "updates": 0,
+            "rows_written": 0,
+            "upserts": 0,
+            "skipped": 0,
+            "failures": 0
+        }
+
+    # ==========================================
+    # 状態の登録
+    # ==========================================
+    def update(self, guild_id: str, **fields):
+        """ギルドの最新状態を登録（書き込みはデバウンス後にまとめて行う）"""
+        state = {key: value for key, value in fields.items() if key in SESSION_FIELDS}
+        previous = self._pending.get(guild_id)
+        if previous:
+            state = {**previous[0], **state}
+        self._pending[guild_id] = (state, time.monotonic())
+        self.stats["updates"] += 1
+        self._schedule_flush()
+
+    async def forget(self, guild_id: str):
+        """セッション削除時に差分の基準をリセット
+
+        実行中のフラッシュが終わるのを待ってから外すので、この後に行を削除すれば
+        古い状態が書き戻されることはない。
+        """
+        async with self._flush_lock:
+            self._shadow.pop(guild_id, None)
+            self._written_at.pop(guild_id, None)
+            self._pending.pop(guild_id, None)
+
+    def _schedule_flush(self):
+        """イベントループ上ならデバウンス後のフラッシュを1回だけ予約"""
+        if self._flush_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._flush_handle = loop.call_later(
+            self.debounce, lambda: loop.create_task(self._scheduled_flush())
+        )
+
+    async def _scheduled_flush(self):
+        self._flush_handle = None
+        await self.flush()
+        if self._pending:
+            self._schedule_flush()
+
+    # ==========================================
+    # 差分計算
+    # ==========================================
+    def _diff(self, guild_id: str, state: Dict, now: float) -> Dict:
+        """前回書き込んだ状態との差分を計算"""
+        shadow = self._shadow.get(guild_id)
+        if shadow is None:
+            return dict(state)
+
+        changes = {key: value for key, value in state.items() if shadow.get(key) != value}
+
+        if "position_ms" in changes:
+            written_at = self._written_at.get(guild_id, now)
+            elapsed = now - written_at
+            expected = shadow.get("position_ms") or 0
+            if shadow.get("is_playing"):
+                expected += int(elapsed * 1000)
+            drift = abs((state["position_ms"] or 0) - expected)
+            if drift <= self.position_tolerance_ms and elapsed < self.heartbeat:
+                del changes["position_ms"]
+
+        # 行を書き込むときは updated_at と組になる位置も書き込む（推定の基準）
+        if (changes or self._heartbeat_due(guild_id, now)) and "position_ms" in state:
+            changes["position_ms"] = state["position_ms"]
+
+        return changes
+
+    def _heartbeat_due(self, guild_id: str, now: float) -> bool:
+        return now - self._written_at.get(guild_id, now) >= self.heartbeat
+
+    # ==========================================
+    # 書き込み
+    # ==========================================
+    async def flush(self, force: bool = False) -> int:
+        """デバウンス済みの変更をまとめてUPSERT。書き込んだ行数を返す"""
+        async with self._flush_lock:
+            now = time.monotonic()
+            ready = {
+                guild_id: state
+                for guild_id, (state, changed_at) in self._pending.items()
+                if force or now - changed_at >= self.debounce
+            }
+            if not ready:
+                return 0
+
+            timestamp = datetime.now(timezone.utc).isoformat()
+            groups: Dict[tuple, List[Dict]] = {}
+            written: Dict[str, Dict] = {}
+            for guild_id, state in ready.items():
+                changes = self._diff(guild_id, state, now)
+                if not changes and not self._heartbeat_due(guild_id, now):
+                    self.stats["skipped"] += 1
+                    self._pending.pop(guild_id, None)
+                    continue
+                row = {"guild_id": guild_id, **changes, "updated_at": timestamp}
+                groups.setdefault(tuple(sorted(row)), []).append(row)
+                written[guild_id] = changes
+
+            rows_written = 0
+            for rows in groups.values():
+                try:
+                    await self.upsert_fn(rows)
+                except Exception as e:
+                    self.stats["failures"] += 1
+                    print(f"❌ Failed to sync {len(rows)} active sessions: {e}")
+                    continue
+
+                self.stats["upserts"] += 1
+                rows_written += len(rows)
+                for row in rows:
+                    guild_id = row["guild_id"]
+                    changes = written[guild_id]
+                    self._shadow.setdefault(guild_id, {}).update(changes)
+                    self._written_at[guild_id] = now
+                    # 書き込み中に新しい変更が来ていなければ保留から外す
+                    pending = self._pending.get(guild_id)
+                    if pending and pending[0] is ready[guild_id]:
+                        del self._pending[guild_id]
+
+            self.stats["rows_written"] += rows_written
+            return rows_written
+
+    def get_stats(self) -> Dict:
+        """書き込み統計を取得"""
+        return {
+            **self.stats,
+            "tracked_guilds": len(self._shadow),
+            "pending_guilds": len(self._pending)
+        }
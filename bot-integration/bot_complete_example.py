@@ -5,22 +5,42 @@ Discord Bot - 完全な実装例
 
 import discord
 from discord.ext import commands, tasks
+import asyncio
 import psutil
 import time
 import os
+from collections import deque
+from itertools import chain
 from dotenv import load_dotenv
 
 # 新しいSupabaseクライアントをインポート
+# 非同期版を使用してイベントループをブロックしない
 from supabase_client_updated import (
-    send_system_stats,
-    log_conversation,
-    log_music_play,
-    log_music_history,
-    log_gemini_usage,
-    update_active_session,
-    remove_active_session,
-    log_bot_event
+    send_system_stats_async,
+    prune_system_stats_async,
+    log_conversation_async,
+    log_music_play_async,
+    log_music_history_async,
+    log_gemini_usage_async,
+    get_recent_gemini_usage_async,
+    queue_active_session_update,
+    flush_active_sessions_async,
+    prune_stale_active_sessions_async,
+    remove_active_session_async,
+    log_bot_event_async,
+    start_telemetry,
+    close_telemetry
 )
+from conversation_memory import ConversationMemory
+from gemini_scheduler import DeadlineExceeded, GeminiScheduler
+from lyrics_prefetcher import LyricsPrefetcher
+from multi_lyrics_api import lyrics_api
+from playlist_manager import get_playlist_tracks_async
+from rate_limiter import GeminiRateLimiter, RateLimitExceeded, estimate_tokens
+from response_cache import ResponseCache, SQLiteResponseStore
+from session_registry import SessionRegistry
+from stream_renderer import StreamingMessage, split_message
+from system_sampler import SystemSampler
 
 load_dotenv()
 
@@ -28,11 +48,73 @@ load_dotenv()
 intents = discord.Intents.default()
 intents.message_content = True
 intents.voice_states = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+
+
+class Bot(commands.Bot):
+    async def close(self):
+        """切断する前に、歌詞の先読みとHTTP接続プールをこのイベントループ上で閉じる"""
+        await lyrics_prefetcher.close()
+        await lyrics_api.close()
+        await super().close()
+
+
+bot = Bot(command_prefix='!', intents=intents)
 
 # Bot起動時刻を記録
 bot.start_time = time.time()
 
+# ギルドごとの再生セッション（イベントで更新、変化が無くても定期的に生存確認を送る）
+sessions = SessionRegistry(heartbeat=float(os.getenv("SESSION_HEARTBEAT", "30")))
+
+# ギルドごとの再生待ちの曲（{"track_title", "artist", "track_url", "duration_ms", "requested_by", "requested_by_id"}）
+music_queues = {}
+
+# システム統計サンプラー（別スレッドで1秒ごとに計測）
+sampler = SystemSampler(interval=1.0, window_seconds=300, latency_fn=lambda: bot.latency)
+
+# Geminiの設定（キャッシュキーにも含まれる）
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-pro")
+GEMINI_SETTINGS = {"temperature": float(os.getenv("GEMINI_TEMPERATURE", "0.7"))}
+
+# !ask の応答キャッシュ（GEMINI_CACHE_PATH を指定すると再起動後も保持）
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("GEMINI_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("GEMINI_CACHE_TTL", "3600")),
+    store=SQLiteResponseStore(os.getenv("GEMINI_CACHE_PATH")) if os.getenv("GEMINI_CACHE_PATH") else None,
+    disabled_guilds=[g for g in os.getenv("GEMINI_CACHE_DISABLED_GUILDS", "").split(",") if g]
+)
+
+# ユーザー・ギルドごとのトークン上限（ウィンドウあたりのモデルトークン数）
+rate_limiter = GeminiRateLimiter(
+    user_limit=int(os.getenv("GEMINI_USER_TOKEN_LIMIT", "20000")),
+    guild_limit=int(os.getenv("GEMINI_GUILD_TOKEN_LIMIT", "200000")),
+    window_seconds=float(os.getenv("GEMINI_RATE_WINDOW", "3600")),
+    max_wait=float(os.getenv("GEMINI_RATE_MAX_WAIT", "10"))
+)
+# 応答の長さは事前にわからないので、この分を見込んで確保し、完了後に精算する
+GEMINI_COMPLETION_RESERVE = int(os.getenv("GEMINI_COMPLETION_RESERVE", "512"))
+
+# チャンネル×ユーザーごとの直近の会話（追いかけの質問に文脈を付ける）
+# summarize_fn を渡すと、上限を超えた古いやり取りを捨てずに要約に畳み込む
+conversation_memory = ConversationMemory(
+    max_tokens=int(os.getenv("GEMINI_MEMORY_TOKENS", "2000")),
+    max_entries=int(os.getenv("GEMINI_MEMORY_CONVERSATIONS", "5000")),
+    idle_ttl=float(os.getenv("GEMINI_MEMORY_IDLE_TTL", "3600"))
+)
+
+# モデル呼び出しの同時実行数とギルド間の公平な順番待ち
+gemini_scheduler = GeminiScheduler(
+    max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "4")),
+    default_deadline=float(os.getenv("GEMINI_QUEUE_DEADLINE", "60"))
+)
+
+# 次に再生される曲の歌詞の先読み（ユーザーからの歌詞検索を優先）
+lyrics_prefetcher = LyricsPrefetcher(
+    lyrics_api,
+    lookahead=int(os.getenv("LYRICS_PREFETCH_COUNT", "3")),
+    concurrency=int(os.getenv("LYRICS_PREFETCH_CONCURRENCY", "2"))
+)
+
 
 # ==========================================
 # Bot起動時
@@ -41,14 +123,34 @@ bot.start_time = time.time()
 async def on_ready():
     print(f'✅ Logged in as {bot.user}')
     
+    # ログ送信・スプール再送のスレッドを開始（前回の未送信分をすぐに再送）
+    start_telemetry()
+    
     # 起動ログを記録
-    log_bot_event("info", f"Bot started: {bot.user}")
+    await log_bot_event_async("info", f"Bot started: {bot.user}")
+    
+    # 直近の使用量からレート制限の残量を復元（再接続時は行わない）
+    if not rate_limiter.seeded:
+        rate_limiter.seed(await get_recent_gemini_usage_async(rate_limiter.window_seconds))
+    
+    # サンプラーを開始（イベントループの遅延も計測）
+    sampler.loop = asyncio.get_running_loop()
+    sampler.start()
     
     # システム統計タスクを開始
     system_stats_task.start()
     
     # アクティブセッション更新タスクを開始
     active_session_task.start()
+    
+    # 古いシステム統計の削除タスクを開始
+    stats_retention_task.start()
+    
+    # 更新の止まったアクティブセッション（落ちたプロセスの行）の削除タスクを開始
+    stale_session_task.start()
+    
+    # 歌詞の先読みを開始
+    lyrics_prefetcher.start()
 
 
 # ==========================================
@@ -56,23 +158,18 @@ async def on_ready():
 # ==========================================
 @tasks.loop(minutes=5)
 async def system_stats_task():
-    """5分ごとにシステム統計を送信"""
+    """5分ごとにシステム統計（5分間の集計値）を送信"""
     try:
-        # CPU使用率
-        cpu_usage = psutil.cpu_percent(interval=1)
-        
-        # メモリ情報
-        memory = psutil.virtual_memory()
-        ram_usage = memory.percent
-        
-        # プロセス情報
-        process = psutil.Process()
-        memory_info = process.memory_info()
-        memory_rss = memory_info.rss / (1024 * 1024)  # MB
-        memory_heap = memory_info.vms / (1024 * 1024)  # MB
+        # サンプラーの5分ウィンドウ集計（イベントループはブロックしない）
+        summary = sampler.summary()
+        if summary["sample_count"] == 0:
+            return
         
-        # Ping
-        ping_gateway = round(bot.latency * 1000)  # ms
+        cpu_usage = summary["cpu_usage"]["avg"]
+        ram_usage = summary["ram_usage"]["avg"]
+        memory_rss = summary["memory_rss"]["avg"]  # MB
+        memory_heap = summary["memory_heap"]["avg"]  # MB
+        ping_gateway = round(summary["ping_gateway"]["avg"])  # ms
         
         # サーバー数
         guild_count = len(bot.guilds)
@@ -81,7 +178,7 @@ async def system_stats_task():
         uptime = int(time.time() - bot.start_time)
         
         # 送信
-        send_system_stats(
+        await send_system_stats_async(
             cpu_usage=cpu_usage,
             ram_usage=ram_usage,
             memory_rss=memory_rss,
@@ -91,89 +188,305 @@ async def system_stats_task():
             server_count=guild_count,
             guild_count=guild_count,
             uptime=uptime,
-            status='online'
+            status='online',
+            window={**sampler.window_columns(), **gemini_scheduler.window_columns()}
         )
         
         print(f"✅ System stats sent: CPU={cpu_usage:.1f}%, RAM={ram_usage:.1f}%")
         
     except Exception as e:
         print(f"❌ Error in system stats task: {e}")
-        log_bot_event("error", f"System stats task error: {e}")
+        await log_bot_event_async("error", f"System stats task error: {e}")
 
 
 # ==========================================
-# アクティブセッション更新タスク（10秒ごと）
+# システム統計の保持期間タスク（1時間ごと）
 # ==========================================
-@tasks.loop(seconds=10)
+@tasks.loop(hours=1)
+async def stats_retention_task():
+    """保持期間を過ぎた system_stats を小分けに削除（グラフはロールアップを参照）"""
+    try:
+        await prune_system_stats_async()
+    except Exception as e:
+        print(f"❌ Error in stats retention task: {e}")
+
+
+# ==========================================
+# 古いアクティブセッションの削除タスク（1分ごと）
+# ==========================================
+@tasks.loop(minutes=1)
+async def stale_session_task():
+    """生存確認が途絶えたセッションを削除（クラッシュしたプロセスが残した行など）"""
+    try:
+        await prune_stale_active_sessions_async()
+    except Exception as e:
+        print(f"❌ Error in stale session task: {e}")
+
+
+# ==========================================
+# アクティブセッション更新タスク（2秒ごと）
+# ==========================================
+@tasks.loop(seconds=2)
 async def active_session_task():
-    """10秒ごとにアクティブセッションを更新"""
+    """状態が変わったギルド（と生存確認の時期が来たギルド）をアクティブセッションに反映"""
     try:
-        for guild in bot.guilds:
-            # ボイスチャンネルをチェック
-            for voice_client in bot.voice_clients:
-                if voice_client.guild.id == guild.id and voice_client.is_playing():
-                    # 現在再生中の曲情報を取得（実装に応じて調整）
-                    # この例では仮のデータを使用
-                    track_title = "Current Track"  # 実際の曲名を取得
-                    position_ms = 0  # 実際の再生位置を取得
-                    duration_ms = 180000  # 実際の曲の長さを取得
-                    
-                    # ボイスチャンネルのメンバー数
-                    voice_channel = voice_client.channel
-                    voice_members_count = len([m for m in voice_channel.members if not m.bot])
-                    
-                    # アクティブセッションを更新
-                    update_active_session(
-                        guild_id=str(guild.id),
-                        track_title=track_title,
-                        position_ms=position_ms,
-                        duration_ms=duration_ms,
-                        is_playing=True,
-                        voice_members_count=voice_members_count
-                    )
+        for session in sessions.pop_dirty():
+            # 変更があったフィールドだけ送信される
+            queue_active_session_update(session.guild_id, **session.to_fields())
+        
+        # 変更のあったギルドをまとめて1回のUPSERTで書き込む
+        await flush_active_sessions_async()
                     
     except Exception as e:
         print(f"❌ Error in active session task: {e}")
 
 
+# ==========================================
+# ボイス状態の変化
+# ==========================================
+@bot.event
+async def on_voice_state_update(member, before, after):
+    """リスナー数を差分で更新（チャンネルのメンバーを毎回数えない）"""
+    if member.id == bot.user.id:
+        guild_id = str(member.guild.id)
+        if after.channel is None and sessions.get(guild_id):
+            await end_playback(guild_id)
+        elif after.channel is not None and before.channel != after.channel:
+            sessions.on_bot_moved(guild_id, after.channel)
+        return
+    
+    sessions.on_voice_state_update(member, before, after)
+
+
 # ==========================================
 # Gemini会話コマンド
 # ==========================================
+async def stream_gemini_response(question, usage, history=None):
+    """Gemini APIの応答をチャンクごとに返す（実装に応じて調整）
+
+    history は過去の会話（contents 形式）で、質問の前に渡す。
+    生成が終わった時点で usage にトークン使用量を書き込む。
+    google-generativeai なら generate_content_async(..., stream=True) の各チャンクの
+    text を返し、最後に usage_metadata を usage に移す。
+    """
+    # この例では仮の応答を少しずつ返す
+    response = f"これは「{question}」への応答です。"
+    for start in range(0, len(response), 8):
+        await asyncio.sleep(0.2)
+        yield response[start:start + 8]
+    usage.update({
+        "prompt_tokens": 100,  # 実際の値に置き換え
+        "completion_tokens": 200,  # 実際の値に置き換え
+        "total_tokens": 300  # 実際の値に置き換え
+    })
+
+
 @bot.command(name='ask')
 async def ask_gemini(ctx, *, question):
-    """Gemini APIに質問する"""
+    """Gemini APIに質問する（生成途中の応答をメッセージの編集で表示）"""
     try:
-        await ctx.send("🤔 考え中...")
+        guild_id = str(ctx.guild.id)
+        history = conversation_memory.history(ctx.channel.id, ctx.author.id)
+        
+        # 同じ質問への応答がキャッシュにあればモデルを呼ばずに返す
+        # （会話の途中の質問は文脈によって答えが変わるのでキャッシュしない）
+        response = None
+        if not history:
+            response = await response_cache.get(guild_id, question, GEMINI_MODEL, GEMINI_SETTINGS)
+        cached = response is not None
+        
+        if cached:
+            for part in split_message(f"💬 {response}"):
+                await ctx.send(part)
+        else:
+            # モデルを呼ぶ前に使用量の上限を確認（少し待てば空く場合は待つ）
+            prompt_tokens = estimate_tokens(question) + conversation_memory.token_count(ctx.channel.id, ctx.author.id)
+            try:
+                reservation = await rate_limiter.acquire(
+                    ctx.author.id,
+                    guild_id,
+                    prompt_tokens + GEMINI_COMPLETION_RESERVE
+                )
+            except RateLimitExceeded as e:
+                scope = "あなた" if e.scope == "user" else "このサーバー"
+                await ctx.send(f"⏳ {scope}の利用上限に達しました。{e.retry_after:.0f}秒後に再度お試しください")
+                return
+            
+            usage = {}
+            notice = None
+            stream = None
+            # 確保したトークンは、この先でどこで失敗・キャンセルされても必ず精算する
+            try:
+                placeholder = await ctx.send("🤔 考え中...")
+                
+                # 編集はレート制限に合わせてまとめられ、2000文字を超えると次のメッセージに続く
+                stream = StreamingMessage(placeholder, ctx.send, prefix="💬 ")
+                try:
+                    # 実行枠の順番を待つ（混雑時は他のギルドと交互に実行される）
+                    async with gemini_scheduler.slot(guild_id):
+                        async for chunk in stream_gemini_response(question, usage, history):
+                            await stream.append(chunk)
+                    response = await stream.finish()
+                except DeadlineExceeded:
+                    notice = "⌛ 混雑しているため応答できませんでした。しばらくしてから再度お試しください"
+                except Exception as e:
+                    notice = "❌ 応答の生成中にエラーが発生しました"
+                    await log_bot_event_async("error", f"Gemini stream error: {e}")
+                finally:
+                    # 失敗・キャンセル時もカーソルと「考え中」の表示を残さない
+                    if not stream.finished:
+                        await stream.abort(notice or "❌ 応答を完了できませんでした")
+            finally:
+                # 実際の使用量で精算（途中で失敗した場合は受け取った分から見積もる）
+                used = usage.get("total_tokens")
+                if used is None:
+                    used = prompt_tokens + estimate_tokens(stream.text) if stream and stream.text else 0
+                rate_limiter.settle(reservation, used)
+            
+            if notice is not None:
+                return
+            
+            if not history:
+                await response_cache.put(guild_id, question, GEMINI_MODEL, response, GEMINI_SETTINGS)
+            
+            # Gemini使用統計を記録（キャッシュヒット時はトークンを消費しないので記録しない）
+            await log_gemini_usage_async(
+                guild_id=guild_id,
+                user_id=str(ctx.author.id),
+                prompt_tokens=usage.get("prompt_tokens", 0),
+                completion_tokens=usage.get("completion_tokens", 0),
+                total_tokens=usage.get("total_tokens", 0),
+                model=GEMINI_MODEL
+            )
         
-        # Gemini APIで応答を取得（実装に応じて調整）
-        # この例では仮の応答を使用
-        response = f"これは「{question}」への応答です。"
+        # 次の質問の文脈として保持
+        await conversation_memory.add_exchange(ctx.channel.id, ctx.author.id, question, response)
         
-        # 会話ログを記録
-        log_conversation(
+        # 会話ログを記録（ストリーミングでも完成した応答を1回だけ）
+        await log_conversation_async(
             user_id=str(ctx.author.id),
             user_name=ctx.author.name,
             prompt=question,
             response=response
         )
         
-        # Gemini使用統計を記録（実際のトークン数を使用）
-        log_gemini_usage(
-            guild_id=str(ctx.guild.id),
-            user_id=str(ctx.author.id),
-            prompt_tokens=100,  # 実際の値に置き換え
-            completion_tokens=200,  # 実際の値に置き換え
-            total_tokens=300,  # 実際の値に置き換え
-            model="gemini-pro"
-        )
-        
-        await ctx.send(f"💬 {response}")
-        
-        print(f"✅ Conversation logged: {ctx.author.name}")
+        print(f"✅ Conversation logged: {ctx.author.name}{' (cached)' if cached else ''}")
         
     except Exception as e:
         await ctx.send(f"❌ エラーが発生しました: {e}")
-        log_bot_event("error", f"Ask command error: {e}")
+        await log_bot_event_async("error", f"Ask command error: {e}")
+
+
+@bot.command(name='forget')
+async def forget_conversation(ctx):
+    """このチャンネルでの会話の文脈をリセットする"""
+    conversation_memory.forget(ctx.channel.id, ctx.author.id)
+    await ctx.send("🧹 会話の文脈をリセットしました")
+
+
+@bot.command(name='askcache')
+@commands.has_permissions(manage_guild=True)
+async def ask_cache(ctx, mode: str = None):
+    """!ask の応答キャッシュをこのサーバーで有効/無効にする（引数なしで統計を表示）"""
+    guild_id = str(ctx.guild.id)
+    
+    if mode in ("on", "off"):
+        response_cache.set_enabled(guild_id, mode == "on")
+        await ctx.send(f"🗄️ 応答キャッシュを{'有効' if mode == 'on' else '無効'}にしました")
+        return
+    
+    stats = response_cache.get_stats()
+    await ctx.send(
+        f"🗄️ 応答キャッシュ: {'有効' if response_cache.is_enabled(guild_id) else '無効'}\n"
+        f"ヒット: {stats['hits']} / ミス: {stats['misses']} "
+        f"(ヒット率 {stats['hit_rate'] * 100:.1f}%), 件数: {stats['entries']}"
+    )
+
+
+# ==========================================
+# 再生キュー
+# ==========================================
+async def start_next_track(guild, voice_channel):
+    """キューの先頭の曲を再生し、続く曲の歌詞を先読みする（キューが空なら再生を終える）"""
+    guild_id = str(guild.id)
+    queue = music_queues.get(guild_id)
+    if not queue:
+        await end_playback(guild_id)
+        return None
+    track = queue.popleft()
+    
+    # 音楽ログを記録（シンプル版）
+    await log_music_play_async(
+        guild_id=guild_id,
+        song_title=track["track_title"],
+        requested_by=track["requested_by"],
+        requested_by_id=track["requested_by_id"]
+    )
+    
+    # 音楽履歴を記録（詳細版）
+    await log_music_history_async(
+        guild_id=guild_id,
+        track_title=track["track_title"],
+        track_url=track["track_url"],
+        duration_ms=track["duration_ms"],
+        requested_by=track["requested_by"],
+        requested_by_id=track["requested_by_id"],
+        artist=track.get("artist")
+    )
+    
+    # セッションを開始（次のティックでアクティブセッションに反映）
+    sessions.start(guild_id, voice_channel, track["track_title"], track["duration_ms"])
+    
+    # 再生する曲と、キュー（プレイリストの続きを含む）で次に来る曲の歌詞を先読み
+    lyrics_prefetcher.prefetch(guild_id, chain([track], queue))
+    
+    # 実際の再生（実装に応じて調整）
+    # guild.voice_client.play(source, after=lambda error: track_finished(guild_id))
+    
+    print(f"✅ Music play logged: {track['track_title']}")
+    return track
+
+
+def track_finished(guild_id):
+    """voice_client.play() の after から呼ぶ（音声スレッドからイベントループに戻す）"""
+    asyncio.run_coroutine_threadsafe(on_track_end(guild_id), bot.loop)
+
+
+async def on_track_end(guild_id):
+    """曲が終わったら次の曲へ（キューが空なら再生を終える）"""
+    sessions.end_track(str(guild_id))
+    guild = bot.get_guild(int(guild_id))
+    voice_client = guild.voice_client if guild else None
+    if voice_client is None or voice_client.channel is None:
+        await end_playback(guild_id)
+        return
+    await start_next_track(guild, voice_client.channel)
+
+
+async def end_playback(guild_id):
+    """再生を終えたギルドの後片付け（キュー・セッション・歌詞の先読み）"""
+    guild_id = str(guild_id)
+    music_queues.pop(guild_id, None)
+    sessions.stop(guild_id)
+    lyrics_prefetcher.forget(guild_id)
+    await remove_active_session_async(guild_id)
+
+
+async def enqueue_tracks(ctx, tracks):
+    """曲をキューに追加し、何も再生していなければ再生を始める"""
+    if not ctx.voice_client:
+        await ctx.author.voice.channel.connect()
+    
+    guild_id = str(ctx.guild.id)
+    queue = music_queues.setdefault(guild_id, deque())
+    queue.extend(tracks)
+    
+    if sessions.get(guild_id) is None:
+        return await start_next_track(ctx.guild, ctx.voice_client.channel)
+    
+    # 再生中ならキューの先頭から先読みし直す
+    lyrics_prefetcher.prefetch(guild_id, queue)
+    return None
 
 
 # ==========================================
@@ -181,59 +494,87 @@ async def ask_gemini(ctx, *, question):
 # ==========================================
 @bot.command(name='play')
 async def play_music(ctx, *, query):
-    """音楽を再生する"""
+    """音楽を再生する（再生中ならキューに追加）"""
     try:
         # ボイスチャンネルに接続
         if not ctx.author.voice:
             await ctx.send("❌ ボイスチャンネルに接続してください")
             return
         
-        voice_channel = ctx.author.voice.channel
-        
-        if not ctx.voice_client:
-            await voice_channel.connect()
-        
         # 曲を検索（実装に応じて調整）
         # この例では仮のデータを使用
-        track_title = f"Search: {query}"
-        track_url = "https://example.com/track"
-        duration_ms = 180000  # 3分
+        track = {
+            "track_title": f"Search: {query}",
+            "artist": None,
+            "track_url": "https://example.com/track",
+            "duration_ms": 180000,  # 3分
+            "requested_by": ctx.author.name,
+            "requested_by_id": str(ctx.author.id)
+        }
         
-        # 音楽ログを記録（シンプル版）
-        log_music_play(
-            guild_id=str(ctx.guild.id),
-            song_title=track_title,
-            requested_by=ctx.author.name,
-            requested_by_id=str(ctx.author.id)
-        )
+        if await enqueue_tracks(ctx, [track]):
+            await ctx.send(f"🎵 再生中: {track['track_title']}")
+        else:
+            await ctx.send(f"📝 キューに追加: {track['track_title']}")
         
-        # 音楽履歴を記録（詳細版）
-        log_music_history(
-            guild_id=str(ctx.guild.id),
-            track_title=track_title,
-            track_url=track_url,
-            duration_ms=duration_ms,
-            requested_by=ctx.author.name,
-            requested_by_id=str(ctx.author.id)
-        )
+    except Exception as e:
+        await ctx.send(f"❌ エラーが発生しました: {e}")
+        await log_bot_event_async("error", f"Play command error: {e}")
+
+
+@bot.command(name='playlist_play')
+async def play_playlist(ctx, playlist_id: str):
+    """プレイリストの曲をキューに追加して再生する"""
+    try:
+        if not ctx.author.voice:
+            await ctx.send("❌ ボイスチャンネルに接続してください")
+            return
         
-        # アクティブセッションを更新
-        update_active_session(
-            guild_id=str(ctx.guild.id),
-            track_title=track_title,
-            position_ms=0,
-            duration_ms=duration_ms,
-            is_playing=True,
-            voice_members_count=len([m for m in voice_channel.members if not m.bot])
+        rows = await get_playlist_tracks_async(playlist_id)
+        if not rows:
+            await ctx.send("📝 プレイリストに曲がありません")
+            return
+        
+        tracks = [
+            {
+                "track_title": row["track_title"],
+                "artist": row.get("artist"),
+                "track_url": row["track_url"],
+                "duration_ms": row.get("duration_ms") or 0,
+                "requested_by": ctx.author.name,
+                "requested_by_id": str(ctx.author.id)
+            }
+            for row in rows
+        ]
+        track = await enqueue_tracks(ctx, tracks)
+        await ctx.send(
+            f"🎵 プレイリストの{len(tracks)}曲をキューに追加しました"
+            + (f"\n再生中: {track['track_title']}" if track else "")
         )
         
-        await ctx.send(f"🎵 再生中: {track_title}")
+    except Exception as e:
+        await ctx.send(f"❌ エラーが発生しました: {e}")
+        await log_bot_event_async("error", f"Playlist play command error: {e}")
+
+
+@bot.command(name='skip')
+async def skip_music(ctx):
+    """次の曲へ"""
+    try:
+        if not ctx.voice_client or sessions.get(str(ctx.guild.id)) is None:
+            await ctx.send("❌ 再生中の音楽がありません")
+            return
         
-        print(f"✅ Music play logged: {track_title}")
+        if ctx.voice_client.is_playing() or ctx.voice_client.is_paused():
+            # after コールバックから on_track_end が呼ばれる
+            ctx.voice_client.stop()
+        else:
+            await on_track_end(str(ctx.guild.id))
+        await ctx.send("⏭️ スキップしました")
         
     except Exception as e:
         await ctx.send(f"❌ エラーが発生しました: {e}")
-        log_bot_event("error", f"Play command error: {e}")
+        await log_bot_event_async("error", f"Skip command error: {e}")
 
 
 # ==========================================
@@ -244,8 +585,8 @@ async def stop_music(ctx):
     """音楽を停止する"""
     try:
         if ctx.voice_client:
-            # アクティブセッションを削除
-            remove_active_session(str(ctx.guild.id))
+            # キュー・アクティブセッション・歌詞の先読みを片付ける
+            await end_playback(ctx.guild.id)
             
             await ctx.voice_client.disconnect()
             await ctx.send("⏹️ 停止しました")
@@ -256,7 +597,7 @@ async def stop_music(ctx):
             
     except Exception as e:
         await ctx.send(f"❌ エラーが発生しました: {e}")
-        log_bot_event("error", f"Stop command error: {e}")
+        await log_bot_event_async("error", f"Stop command error: {e}")
 
 
 # ==========================================
@@ -269,15 +610,8 @@ async def pause_music(ctx):
         if ctx.voice_client and ctx.voice_client.is_playing():
             ctx.voice_client.pause()
             
-            # アクティブセッションを更新（一時停止状態）
-            update_active_session(
-                guild_id=str(ctx.guild.id),
-                track_title="Paused",
-                position_ms=0,
-                duration_ms=0,
-                is_playing=False,
-                voice_members_count=len([m for m in ctx.author.voice.channel.members if not m.bot])
-            )
+            # セッションを一時停止状態に
+            sessions.pause(str(ctx.guild.id))
             
             await ctx.send("⏸️ 一時停止しました")
             
@@ -286,7 +620,7 @@ async def pause_music(ctx):
             
     except Exception as e:
         await ctx.send(f"❌ エラーが発生しました: {e}")
-        log_bot_event("error", f"Pause command error: {e}")
+        await log_bot_event_async("error", f"Pause command error: {e}")
 
 
 # ==========================================
@@ -299,15 +633,8 @@ async def resume_music(ctx):
         if ctx.voice_client and ctx.voice_client.is_paused():
             ctx.voice_client.resume()
             
-            # アクティブセッションを更新（再生状態）
-            update_active_session(
-                guild_id=str(ctx.guild.id),
-                track_title="Resumed",
-                position_ms=0,
-                duration_ms=0,
-                is_playing=True,
-                voice_members_count=len([m for m in ctx.author.voice.channel.members if not m.bot])
-            )
+            # セッションを再生状態に
+            sessions.resume(str(ctx.guild.id))
             
             await ctx.send("▶️ 再開しました")
             
@@ -316,7 +643,7 @@ async def resume_music(ctx):
             
     except Exception as e:
         await ctx.send(f"❌ エラーが発生しました: {e}")
-        log_bot_event("error", f"Resume command error: {e}")
+        await log_bot_event_async("error", f"Resume command error: {e}")
 
 
 # ==========================================
@@ -326,8 +653,14 @@ async def resume_music(ctx):
 async def bot_status(ctx):
     """Botのステータスを表示"""
     try:
-        cpu_usage = psutil.cpu_percent(interval=1)
-        memory = psutil.virtual_memory()
+        # サンプラーの最新値を使用（待ち時間なし）
+        sample = sampler.latest()
+        if sample:
+            cpu_usage = sample["cpu_usage"]
+            ram_usage = sample["ram_usage"]
+        else:
+            cpu_usage = psutil.cpu_percent(interval=None)
+            ram_usage = psutil.virtual_memory().percent
         uptime = int(time.time() - bot.start_time)
         
         uptime_hours = uptime // 3600
@@ -335,7 +668,7 @@ async def bot_status(ctx):
         
         embed = discord.Embed(title="🤖 Bot Status", color=discord.Color.blue())
         embed.add_field(name="CPU", value=f"{cpu_usage:.1f}%", inline=True)
-        embed.add_field(name="RAM", value=f"{memory.percent:.1f}%", inline=True)
+        embed.add_field(name="RAM", value=f"{ram_usage:.1f}%", inline=True)
         embed.add_field(name="Ping", value=f"{round(bot.latency * 1000)}ms", inline=True)
         embed.add_field(name="Servers", value=f"{len(bot.guilds)}", inline=True)
         embed.add_field(name="Uptime", value=f"{uptime_hours}h {uptime_minutes}m", inline=True)
@@ -355,7 +688,7 @@ async def on_command_error(ctx, error):
     error_message = str(error)
     
     # エラーログを記録
-    log_bot_event("error", f"Command error in {ctx.command}: {error_message}")
+    await log_bot_event_async("error", f"Command error in {ctx.command}: {error_message}")
     
     await ctx.send(f"❌ エラー: {error_message}")
 
@@ -371,4 +704,9 @@ if __name__ == "__main__":
         exit(1)
     
     print("🚀 Starting bot...")
-    bot.run(token)
+    try:
+        bot.run(token)
+    finally:
+        # キューに残っているログを送信してから終了
+        sampler.stop()
+        close_telemetry()
@@ -7,24 +7,47 @@ import discord
 from discord.ext import commands, tasks
 import psutil
 import os
-from supabase_client import SupabaseDashboard
+from supabase_client_updated import (
+    send_system_stats_async,
+    log_gemini_usage_async,
+    log_music_history_async,
+    update_active_session_async,
+    remove_active_session_async,
+    log_bot_event_async,
+    start_telemetry,
+    create_command_consumer,
+    create_command_dispatcher
+)
 
 # Bot設定
 intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix="/", intents=intents)
 
-# Supabaseダッシュボードクライアント
-dashboard = SupabaseDashboard()
+# ダッシュボードからのコマンド（on_readyで開始）
+command_consumer = None
+command_dispatcher = None
 
 
 @bot.event
 async def on_ready():
     print(f"Bot logged in as {bot.user}")
-    await dashboard.add_bot_log("info", f"Bot started: {bot.user}")
+    start_telemetry()
+    await log_bot_event_async("info", f"Bot started: {bot.user}")
     
     # システム統計の定期送信を開始
     update_system_stats.start()
+    
+    # ダッシュボードコマンドの購読を開始（INSERTを即時受信）
+    # 確保したコマンドはギルドごとの順序を保って並行実行
+    global command_consumer, command_dispatcher
+    if command_consumer is None:
+        command_dispatcher = create_command_dispatcher(execute_dashboard_command)
+        command_consumer = create_command_consumer(
+            command_dispatcher.submit, capacity=command_dispatcher.capacity
+        )
+        if command_consumer:
+            command_consumer.start()
 
 
 @tasks.loop(seconds=30)
@@ -44,12 +67,14 @@ async def update_system_stats():
         ping_gateway = int(bot.latency * 1000)  # ms
         ping_lavalink = 0  # Lavalinkを使用している場合は実際のPingを取得
         
-        await dashboard.update_system_stats(
+        await send_system_stats_async(
             cpu_usage=cpu_usage,
-            ram_rss=ram_rss,
-            ram_heap=ram_heap,
+            ram_usage=psutil.virtual_memory().percent,
+            memory_rss=ram_rss,
+            memory_heap=ram_heap,
             ping_gateway=ping_gateway,
-            ping_lavalink=ping_lavalink
+            ping_lavalink=ping_lavalink,
+            guild_count=len(bot.guilds)
         )
     except Exception as e:
         print(f"Error updating system stats: {e}")
@@ -63,7 +88,7 @@ async def chat_command(ctx, *, message: str):
         # response = await gemini_client.generate(message)
         
         # 使用統計を記録
-        await dashboard.log_gemini_usage(
+        await log_gemini_usage_async(
             guild_id=str(ctx.guild.id),
             user_id=str(ctx.author.id),
             prompt_tokens=len(message.split()),  # 簡易的な計算
@@ -75,7 +100,7 @@ async def chat_command(ctx, *, message: str):
         await ctx.send("Response from Gemini API")
         
     except Exception as e:
-        await dashboard.add_bot_log("error", f"Chat command error: {e}")
+        await log_bot_event_async("error", f"Chat command error: {e}")
         await ctx.send("エラーが発生しました")
 
 
@@ -89,7 +114,7 @@ async def play_command(ctx, *, query: str):
         duration_ms = 180000
         
         # アクティブセッションを更新
-        await dashboard.update_active_session(
+        await update_active_session_async(
             guild_id=str(ctx.guild.id),
             track_title=track_title,
             position_ms=0,
@@ -98,19 +123,20 @@ async def play_command(ctx, *, query: str):
         )
         
         # 再生履歴を記録
-        await dashboard.log_music_play(
+        await log_music_history_async(
             guild_id=str(ctx.guild.id),
             track_title=track_title,
             track_url=track_url,
             duration_ms=duration_ms,
-            requested_by=str(ctx.author.id)
+            requested_by=ctx.author.name,
+            requested_by_id=str(ctx.author.id)
         )
         
-        await dashboard.add_bot_log("info", f"Playing: {track_title}")
+        await log_bot_event_async("info", f"Playing: {track_title}")
         await ctx.send(f"再生中: {track_title}")
         
     except Exception as e:
-        await dashboard.add_bot_log("error", f"Play command error: {e}")
+        await log_bot_event_async("error", f"Play command error: {e}")
         await ctx.send("エラーが発生しました")
 
 
@@ -121,7 +147,7 @@ async def pause_command(ctx):
         # 再生を一時停止（実装は省略）
         
         # アクティブセッションを更新
-        await dashboard.update_active_session(
+        await update_active_session_async(
             guild_id=str(ctx.guild.id),
             is_playing=False
         )
@@ -129,7 +155,7 @@ async def pause_command(ctx):
         await ctx.send("一時停止しました")
         
     except Exception as e:
-        await dashboard.add_bot_log("error", f"Pause command error: {e}")
+        await log_bot_event_async("error", f"Pause command error: {e}")
         await ctx.send("エラーが発生しました")
 
 
@@ -140,69 +166,51 @@ async def stop_command(ctx):
         # 再生を停止（実装は省略）
         
         # アクティブセッションを削除
-        await dashboard.remove_active_session(str(ctx.guild.id))
+        await remove_active_session_async(str(ctx.guild.id))
         
-        await dashboard.add_bot_log("info", f"Stopped playback in guild {ctx.guild.id}")
+        await log_bot_event_async("info", f"Stopped playback in guild {ctx.guild.id}")
         await ctx.send("停止しました")
         
     except Exception as e:
-        await dashboard.add_bot_log("error", f"Stop command error: {e}")
+        await log_bot_event_async("error", f"Stop command error: {e}")
         await ctx.send("エラーが発生しました")
 
 
-@tasks.loop(seconds=5)
-async def check_dashboard_commands():
-    """ダッシュボードからのコマンドをチェック"""
+async def execute_dashboard_command(cmd):
+    """ダッシュボードからのコマンドを実行
+
+    ステータス（completed / failed）はディスパッチャーがまとめて書き込む。
+    例外を送出すると failed として記録される。
+    """
+    command = cmd.get("command") or cmd.get("command_type")
+    payload = cmd.get("payload") or {}
+    guild_id = payload.get("guild_id")
+    
     try:
-        commands = await dashboard.get_pending_commands()
-        
-        for cmd in commands:
-            command_id = cmd["id"]
-            command = cmd["command"]
-            payload = cmd["payload"]
+        if command == "pause":
+            # 一時停止処理
+            await update_active_session_async(guild_id, is_playing=False)
+            
+        elif command == "resume":
+            # 再開処理
+            await update_active_session_async(guild_id, is_playing=True)
             
-            # コマンドを処理中に設定
-            await dashboard.update_command_status(command_id, "processing")
+        elif command == "skip":
+            # スキップ処理
+            pass
             
-            try:
-                # コマンドを実行
-                if command == "pause":
-                    guild_id = payload.get("guild_id")
-                    # 一時停止処理
-                    await dashboard.update_active_session(guild_id, is_playing=False)
-                    
-                elif command == "resume":
-                    guild_id = payload.get("guild_id")
-                    # 再開処理
-                    await dashboard.update_active_session(guild_id, is_playing=True)
-                    
-                elif command == "skip":
-                    guild_id = payload.get("guild_id")
-                    # スキップ処理
-                    pass
-                
-                # 完了に設定
-                await dashboard.update_command_status(command_id, "completed")
-                
-            except Exception as e:
-                # 失敗に設定
-                await dashboard.update_command_status(command_id, "failed")
-                await dashboard.add_bot_log("error", f"Command execution error: {e}")
-                
     except Exception as e:
-        print(f"Error checking dashboard commands: {e}")
+        await log_bot_event_async("error", f"Command execution error: {e}")
+        raise
 
 
 @bot.event
 async def on_command_error(ctx, error):
     """エラーハンドリング"""
-    await dashboard.add_bot_log("error", f"Command error: {error}")
+    await log_bot_event_async("error", f"Command error: {error}")
 
 
 if __name__ == "__main__":
-    # コマンドチェックタスクを開始
-    check_dashboard_commands.start()
-    
     # Botを起動
     token = os.getenv("DISCORD_TOKEN")
     if not token:
@@ -5,12 +5,12 @@ Discord Bot - Playlist コマンド実装例
 import discord
 from discord.ext import commands
 from playlist_manager import (
-    create_playlist,
-    add_track_to_playlist,
-    get_user_playlists,
-    get_playlist_tracks,
-    delete_playlist,
-    delete_track
+    create_playlist_async,
+    add_track_to_playlist_async,
+    get_user_playlists_async,
+    get_playlist_tracks_async,
+    delete_playlist_async,
+    delete_track_async
 )
 
 # Botの設定（既存のBotに追加）
@@ -27,7 +27,7 @@ async def create_user_playlist(ctx, playlist_name: str, *, description: str = No
     使用例: !playlist_create "My Playlist" This is my favorite songs
     """
     try:
-        playlist = create_playlist(
+        playlist = await create_playlist_async(
             user_id=str(ctx.author.id),
             user_name=ctx.author.name,
             playlist_name=playlist_name,
@@ -63,7 +63,7 @@ async def list_user_playlists(ctx):
     使用例: !playlist_list
     """
     try:
-        playlists = get_user_playlists(str(ctx.author.id))
+        playlists = await get_user_playlists_async(str(ctx.author.id))
         
         if not playlists:
             await ctx.send("📝 プレイリストがありません")
@@ -76,7 +76,7 @@ async def list_user_playlists(ctx):
         )
         
         for playlist in playlists[:10]:  # 最大10個まで表示
-            tracks = get_playlist_tracks(playlist['id'])
+            tracks = await get_playlist_tracks_async(playlist['id'])
             embed.add_field(
                 name=f"📁 {playlist['playlist_name']}",
                 value=f"ID: `{playlist['id']}`\n曲数: {len(tracks)}曲",
@@ -99,7 +99,7 @@ async def add_track_to_user_playlist(ctx, playlist_id: str, track_url: str, *, t
     使用例: !playlist_add <playlist_id> <url> Song Title
     """
     try:
-        track = add_track_to_playlist(
+        track = await add_track_to_playlist_async(
             playlist_id=playlist_id,
             track_title=track_title,
             track_url=track_url,
@@ -135,7 +135,7 @@ async def show_playlist_tracks(ctx, playlist_id: str):
     使用例: !playlist_show <playlist_id>
     """
     try:
-        tracks = get_playlist_tracks(playlist_id)
+        tracks = await get_playlist_tracks_async(playlist_id)
         
         if not tracks:
             await ctx.send("📝 このプレイリストには曲がありません")
@@ -190,7 +190,7 @@ async def delete_user_playlist(ctx, playlist_id: str):
             return
         
         # 削除実行
-        success = delete_playlist(playlist_id)
+        success = await delete_playlist_async(playlist_id)
         
         if success:
             await ctx.send("✅ プレイリストを削除しました")
@@ -211,7 +211,7 @@ async def remove_track_from_playlist(ctx, track_id: str):
     使用例: !playlist_remove <track_id>
     """
     try:
-        success = delete_track(track_id)
+        success = await delete_track_async(track_id)
         
         if success:
             await ctx.send("✅ 曲を削除しました")
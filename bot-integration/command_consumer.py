@@ -0,0 +1,296 @@
+"""
+command_queue のプッシュ型コンシューマー
+Supabase Realtime でINSERTを受け取り、購読が切れている間だけポーリングに切り替える
+"""
+
+import asyncio
+import json
+import random
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+
+
+# ==========================================
+# イベントソース
+# ==========================================
+class RealtimeCommandSource:
+    """Supabase Realtime（Phoenixチャンネル）で command_queue のINSERTを購読"""
+
+    def __init__(
+        self,
+        url: str,
+        key: str,
+        table: str = "command_queue",
+        schema: str = "public",
+        heartbeat_interval: float = 25.0
+    ):
+        ws_base = url.rstrip("/").replace("https://", "wss://").replace("http://", "ws://")
+        self.ws_url = f"{ws_base}/realtime/v1/websocket"
+        self.key = key
+        self.table = table
+        self.schema = schema
+        self.heartbeat_interval = heartbeat_interval
+        self._ref = 0
+
+    def _next_ref(self) -> str:
+        self._ref += 1
+        return str(self._ref)
+
+    async def _heartbeat(self, ws):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            await ws.send_json({
+                "topic": "phoenix",
+                "event": "heartbeat",
+                "payload": {},
+                "ref": self._next_ref()
+            })
+
+    async def subscribe(self, on_subscribed: Callable[[], Awaitable]) -> AsyncIterator[Dict]:
+        """INSERTされた行を順に返す。接続が切れたら例外で終了する
+
+        チャンネルへの参加が完了した時点で on_subscribed を呼ぶ。
+        """
+        topic = f"realtime:{self.schema}:{self.table}"
+        params = {"apikey": self.key, "vsn": "1.0.0"}
+
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(self.ws_url, params=params, heartbeat=None) as ws:
+                join_ref = self._next_ref()
+                await ws.send_json({
+                    "topic": topic,
+                    "event": "phx_join",
+                    "payload": {
+                        "config": {
+                            "postgres_changes": [
+                                {"event": "INSERT", "schema": self.schema, "table": self.table}
+                            ]
+                        },
+                        "access_token": self.key
+                    },
+                    "ref": join_ref
+                })
+
+                heartbeat = asyncio.create_task(self._heartbeat(ws))
+                try:
+                    async for message in ws:
+                        if message.type != aiohttp.WSMsgType.TEXT:
+                            break
+                        data = json.loads(message.data)
+                        event = data.get("event")
+                        payload = data.get("payload") or {}
+
+                        if event == "phx_reply" and data.get("ref") == join_ref:
+                            if payload.get("status") != "ok":
+                                raise ConnectionError(f"Realtime join failed: {payload}")
+                            await on_subscribed()
+                        elif event == "postgres_changes":
+                            record = (payload.get("data") or {}).get("record")
+                            if record:
+                                yield record
+                        elif event == "INSERT":
+                            record = payload.get("record")
+                            if record:
+                                yield record
+                        elif event in ("phx_error", "phx_close"):
+                            break
+                finally:
+                    heartbeat.cancel()
+
+        raise ConnectionError("Realtime connection closed")
+
+
+class LocalCommandSource:
+    """テスト用のローカル代替ソース（Realtimeの代わりに publish() で行を流す）"""
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.connected = True
+
+    def publish(self, record: Dict):
+        """INSERTイベントを発生させる"""
+        self._queue.put_nowait(record)
+
+    def disconnect(self):
+        """購読の切断をシミュレート"""
+        self.connected = False
+        self._queue.put_nowait(None)
+
+    def reconnect(self):
+        self.connected = True
+
+    async def subscribe(self, on_subscribed: Callable[[], Awaitable]) -> AsyncIterator[Dict]:
+        if not self.connected:
+            raise ConnectionError("Local source is disconnected")
+        await on_subscribed()
+        while True:
+            record = await self._queue.get()
+            if record is None:
+                raise ConnectionError("Local source disconnected")
+            yield record
+
+
+# ==========================================
+# コンシューマー
+# ==========================================
+class CommandConsumer:
+    """command_queue のコマンドを確保（claim）してハンドラーに渡すコンシューマー
+
+    購読で受け取ったINSERTは「新しいコマンドがある」という合図としてだけ使い、
+    実際の行は claim_pending で原子的に確保する。複数のBotプロセスが同じ
+    INSERTを受け取っても、1つのコマンドを処理するのは確保できた1プロセスだけになる。
+
+    購読が落ちている間は claim_pending をポーリングする。ポーリング間隔は
+    コマンドが無い間は倍々に伸び、見つかると最短に戻る。購読中も
+    reclaim_interval ごとに確保を行い、期限切れのリースを回収する。
+
+    capacity を渡すと、すぐに実行を始められる件数までしか確保しない
+    （確保したまま待たせてリースを切らさないため）。空きが無い間は
+    min_poll_interval ごとに空きを確認する。
+    """
+
+    def __init__(
+        self,
+        source,
+        claim_pending: Callable[[int], Awaitable[List[Dict]]],
+        handler: Callable[[Dict], Awaitable],
+        batch_size: int = 10,
+        capacity: Optional[Callable[[], int]] = None,
+        min_poll_interval: float = 1.0,
+        max_poll_interval: float = 30.0,
+        reclaim_interval: float = 60.0,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 60.0
+    ):
+        """
+        Args:
+            source: subscribe() で行を返すイベントソース
+            claim_pending: 最大 limit 件のコマンドを確保して返す非同期関数
+            handler: 確保済みの1コマンドを処理する非同期関数
+            batch_size: 1回に確保する最大件数（返った件数が limit 未満なら取り切ったと判断）
+            capacity: すぐに実行を始められる件数を返す関数（例: CommandDispatcher.capacity）
+        """
+        self.source = source
+        self.claim_pending = claim_pending
+        self.handler = handler
+        self.batch_size = batch_size
+        self.capacity = capacity
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.reclaim_interval = reclaim_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self.subscribed = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self._delay = reconnect_delay
+        self._tasks: List[asyncio.Task] = []
+        # 空きが無くて確保を打ち切ったか
+        self._saturated = False
+
+        self.stats = {
+            "notifications": 0,
+            "claims": 0,
+            "claimed": 0,
+            "saturated": 0,
+            "reconnects": 0
+        }
+
+    # ==========================================
+    # ライフサイクル
+    # ==========================================
+    def start(self):
+        """購読ループと確保ループを開始"""
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._subscription_loop()),
+            asyncio.create_task(self._claim_loop())
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ==========================================
+    # 処理
+    # ==========================================
+    async def _dispatch(self, command: Dict):
+        try:
+            await self.handler(command)
+        except Exception as e:
+            print(f"❌ Command handler error: {e}")
+
+    async def _drain(self) -> int:
+        """確保できる限りコマンドを確保して処理"""
+        total = 0
+        self._saturated = False
+        while True:
+            limit = self.batch_size
+            if self.capacity is not None:
+                limit = min(limit, self.capacity())
+                if limit <= 0:
+                    self._saturated = True
+                    self.stats["saturated"] += 1
+                    return total
+            commands = await self.claim_pending(limit)
+            self.stats["claims"] += 1
+            self.stats["claimed"] += len(commands)
+            total += len(commands)
+            for command in commands:
+                await self._dispatch(command)
+            if len(commands) < limit:
+                return total
+
+    async def _on_subscribed(self):
+        """購読開始時: 切断中に追加された行を回収するために確保ループを起こす"""
+        self.subscribed.set()
+        self._delay = self.reconnect_delay
+        self._wakeup.set()
+
+    async def _subscription_loop(self):
+        while True:
+            try:
+                async for _record in self.source.subscribe(self._on_subscribed):
+                    # 連続したINSERTは1回の確保にまとめられる
+                    self.stats["notifications"] += 1
+                    self._wakeup.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.subscribed.is_set():
+                    print(f"⚠️ Command subscription lost, falling back to polling: {e}")
+            self.subscribed.clear()
+            self._wakeup.set()
+            self.stats["reconnects"] += 1
+
+            await asyncio.sleep(random.uniform(self._delay / 2, self._delay))
+            self._delay = min(self.max_reconnect_delay, self._delay * 2)
+
+    async def _claim_loop(self):
+        interval = self.min_poll_interval
+        while True:
+            if self._saturated:
+                # 空きができたらすぐに残りを確保する
+                timeout = self.min_poll_interval
+            else:
+                timeout = self.reclaim_interval if self.subscribed.is_set() else interval
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                found = await self._drain()
+            except Exception as e:
+                print(f"❌ Failed to claim commands: {e}")
+                found = 0
+
+            if found or self.subscribed.is_set():
+                interval = self.min_poll_interval
+            else:
+                interval = min(self.max_poll_interval, interval * 2)
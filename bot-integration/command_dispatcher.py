@@ -0,0 +1,234 @@
+"""
+ダッシュボードコマンドの並行ディスパッチャー
+ギルド間は並行に、同じギルド内は受け取った順に実行し、ステータス更新はまとめて書き込む
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+FINAL_STATUSES = ("completed", "failed")
+
+
+class CommandDispatcher:
+    """ギルドごとの順序を保ちながらコマンドを並行実行するディスパッチャー
+
+    - ギルドごとにキューとワーカーを1つ持ち、同じギルドのコマンドは直列に実行
+    - 全体の同時実行数は max_concurrency で制限
+    - processing / completed / failed の遷移はバッファに溜め、flush_interval ごとに
+      1回の一括更新で書き込む
+    - 確保済みコマンドのリースは、待機中・実行中の間 renew_leases_fn でまとめて延長する。
+      延長できなかった（他のプロセスに再確保された・期限が切れた）コマンドは実行しない
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Dict], Awaitable],
+        flush_status_fn: Callable[[List[Dict]], Awaitable],
+        max_concurrency: int = 8,
+        max_pending: int = 100,
+        flush_interval: float = 0.5,
+        renew_leases_fn: Optional[Callable[[List[str]], Awaitable[List[str]]]] = None,
+        lease_seconds: float = 60.0
+    ):
+        """
+        Args:
+            handler: 1コマンドを実行する非同期関数。戻り値は result 列に保存、例外なら failed
+            flush_status_fn: [{"id", "status", "result", "error"}, ...] を一括更新する非同期関数
+            max_concurrency: 全ギルド合計の同時実行数
+            max_pending: 未完了コマンドの上限（超えると submit が待つ）
+            flush_interval: ステータスを書き込む間隔（秒）
+            renew_leases_fn: コマンドIDのリストのリースを延長し、延長できたIDを返す非同期関数
+            lease_seconds: 確保時・延長時のリースの長さ（秒）
+        """
+        self.handler = handler
+        self.flush_status_fn = flush_status_fn
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.renew_leases_fn = renew_leases_fn
+        self.lease_seconds = lease_seconds
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._queues: Dict[str, deque] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._pending = 0
+        self._capacity = asyncio.Condition()
+        self._status_buffer: Dict[str, Dict] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        # command_id -> リースの期限（time.monotonic() 基準、確保したプロセス側の見積もり）
+        self._leases: Dict[str, float] = {}
+
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "status_flushes": 0,
+            "status_rows": 0,
+            "max_in_flight": 0,
+            "lease_renewals": 0,
+            "lease_expired": 0
+        }
+
+    # ==========================================
+    # 投入
+    # ==========================================
+    @staticmethod
+    def guild_key(command: Dict) -> str:
+        """順序を保つ単位（payload の guild_id、無ければ共通キュー）"""
+        payload = command.get("payload") or {}
+        return str(payload.get("guild_id") or "_global")
+
+    def capacity(self) -> int:
+        """すぐに実行を始められるコマンド数（確保する件数の上限に使う）"""
+        return max(0, min(self.max_concurrency, self.max_pending) - self._pending)
+
+    async def submit(self, command: Dict):
+        """コマンドをギルドのキューに追加（実行完了は待たない）"""
+        if command.get("status") == "processing":
+            # 確保した直後に呼ばれる前提で、リースの期限をここから数える
+            self._leases[str(command["id"])] = time.monotonic() + self.lease_seconds
+        async with self._capacity:
+            await self._capacity.wait_for(lambda: self._pending < self.max_pending)
+            self._pending += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self._pending)
+
+        self.stats["submitted"] += 1
+        if command.get("status", "pending") == "pending":
+            self._record_status(command["id"], "processing")
+
+        key = self.guild_key(command)
+        self._queues.setdefault(key, deque()).append(command)
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._guild_worker(key))
+        self._ensure_flusher()
+
+    async def _guild_worker(self, key: str):
+        queue = self._queues[key]
+        try:
+            while queue:
+                command = queue.popleft()
+                async with self._semaphore:
+                    if self._lease_lost(command):
+                        # 他のプロセスが再確保している可能性があるので実行しない
+                        self.stats["lease_expired"] += 1
+                        self._status_buffer.pop(str(command["id"]), None)
+                        print(f"⚠️ Command {command['id']} lease expired before it started, skipping")
+                    else:
+                        await self._execute(command)
+                    self._leases.pop(str(command["id"]), None)
+                async with self._capacity:
+                    self._pending -= 1
+                    self._capacity.notify_all()
+        finally:
+            del self._workers[key]
+            if not queue:
+                self._queues.pop(key, None)
+
+    async def _execute(self, command: Dict):
+        started = time.perf_counter()
+        try:
+            result = await self.handler(command)
+        except Exception as e:
+            self.stats["failed"] += 1
+            self._record_status(command["id"], "failed", error=str(e))
+            print(f"❌ Command {command['id']} failed after {time.perf_counter() - started:.2f}s: {e}")
+            return
+
+        self.stats["completed"] += 1
+        self._record_status(
+            command["id"], "completed", result=str(result) if result is not None else None
+        )
+
+    # ==========================================
+    # リース
+    # ==========================================
+    def _lease_lost(self, command: Dict) -> bool:
+        deadline = self._leases.get(str(command["id"]))
+        return deadline is not None and deadline <= time.monotonic()
+
+    async def renew_leases(self) -> int:
+        """期限の半分を過ぎたリースをまとめて延長し、延長できた件数を返す"""
+        if not self.renew_leases_fn:
+            return 0
+        now = time.monotonic()
+        due = [
+            command_id for command_id, deadline in self._leases.items()
+            if now < deadline < now + self.lease_seconds / 2
+        ]
+        if not due:
+            return 0
+        try:
+            renewed = {str(command_id) for command_id in await self.renew_leases_fn(due)}
+        except Exception as e:
+            print(f"❌ Failed to renew {len(due)} command leases: {e}")
+            return 0
+
+        deadline = now + self.lease_seconds
+        for command_id in due:
+            if command_id not in self._leases:
+                continue
+            # 延長できなかったものは失効扱い（実行前なら捨てられる）
+            self._leases[command_id] = deadline if command_id in renewed else 0.0
+        self.stats["lease_renewals"] += len(renewed)
+        return len(renewed)
+
+    # ==========================================
+    # ステータスのバッファリング
+    # ==========================================
+    def _record_status(self, command_id, status: str, result=None, error=None):
+        """同じコマンドの遷移は最新のものだけを残す"""
+        self._status_buffer[str(command_id)] = {
+            "id": str(command_id),
+            "status": status,
+            "result": result,
+            "error": error
+        }
+
+    def _ensure_flusher(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while self._status_buffer or self._workers:
+            await asyncio.sleep(self.flush_interval)
+            await self.renew_leases()
+            await self.flush_statuses()
+
+    async def flush_statuses(self) -> int:
+        """バッファ済みのステータス更新を1回で書き込む"""
+        if not self._status_buffer:
+            return 0
+        updates = list(self._status_buffer.values())
+        self._status_buffer = {}
+        try:
+            await self.flush_status_fn(updates)
+        except Exception as e:
+            print(f"❌ Failed to flush {len(updates)} command statuses: {e}")
+            # 失敗分は戻す（その間に来た新しい遷移を優先）
+            for update in updates:
+                self._status_buffer.setdefault(update["id"], update)
+            return 0
+
+        self.stats["status_flushes"] += 1
+        self.stats["status_rows"] += len(updates)
+        return len(updates)
+
+    # ==========================================
+    # 終了
+    # ==========================================
+    async def drain(self):
+        """実行中・待機中のコマンドをすべて完了させ、ステータスを書き込む"""
+        while self._workers:
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
+        await self.flush_statuses()
+
+    def get_stats(self) -> Dict:
+        return {
+            **self.stats,
+            "in_flight": self._pending,
+            "active_guilds": len(self._workers),
+            "leased": len(self._leases),
+            "buffered_statuses": len(self._status_buffer)
+        }
@@ -0,0 +1,180 @@
+"""
+Geminiの会話メモリ
+チャンネル・ユーザーごとの直近の会話をトークン上限付きで保持し、
+追いかけの質問にデータベースを読まずに文脈を付ける
+"""
+
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from rate_limiter import estimate_tokens
+
+
+class _Conversation:
+    __slots__ = ("turns", "tokens", "summary", "summary_tokens", "last_used")
+
+    def __init__(self):
+        # (role, text, tokens)
+        self.turns: deque = deque()
+        self.tokens = 0
+        self.summary = ""
+        self.summary_tokens = 0
+        self.last_used = time.monotonic()
+
+
+class ConversationMemory:
+    """トークン上限付きの会話バッファ（LRUで件数も制限）
+
+    1会話の合計（要約 + 残っているターン）が max_tokens を超えると古いターンから
+    取り除く。summarize_fn があれば取り除いたターンを要約に畳み込み、無ければ捨てる。
+    会話の数が max_entries を超えると、最も長く使われていない会話から破棄する。
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 2000,
+        max_entries: int = 5000,
+        idle_ttl: float = 3600.0,
+        per_user: bool = True,
+        summarize_fn: Optional[Callable[[str, List[Tuple[str, str]]], Awaitable[str]]] = None
+    ):
+        """
+        Args:
+            max_tokens: 1会話あたりのトークン上限（要約を含む）
+            max_entries: 保持する会話の最大数
+            idle_ttl: これより長く使われていない会話は破棄（秒）
+            per_user: True ならチャンネル×ユーザー、False ならチャンネル単位で会話を分ける
+            summarize_fn: (これまでの要約, [(role, text), ...]) から新しい要約を返す非同期関数
+        """
+        self.max_tokens = max_tokens
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.per_user = per_user
+        self.summarize_fn = summarize_fn
+        # 要約が上限の大半を占めないようにする
+        self.max_summary_tokens = max_tokens // 4
+
+        self._conversations: "OrderedDict[Tuple, _Conversation]" = OrderedDict()
+        self.stats = {"evicted_turns": 0, "summarized_turns": 0, "evicted_conversations": 0}
+
+    def key(self, channel_id, user_id) -> Tuple:
+        return (str(channel_id), str(user_id)) if self.per_user else (str(channel_id),)
+
+    # ==========================================
+    # 参照
+    # ==========================================
+    def _get(self, key: Tuple) -> Optional[_Conversation]:
+        conversation = self._conversations.get(key)
+        if conversation is None:
+            return None
+        if time.monotonic() - conversation.last_used > self.idle_ttl:
+            del self._conversations[key]
+            self.stats["evicted_conversations"] += 1
+            return None
+        return conversation
+
+    def history(self, channel_id, user_id) -> List[Dict]:
+        """モデルに渡す過去の会話（Geminiの contents 形式）"""
+        conversation = self._get(self.key(channel_id, user_id))
+        if conversation is None:
+            return []
+
+        contents = []
+        if conversation.summary:
+            contents.append({"role": "user", "parts": [f"これまでの会話の要約: {conversation.summary}"]})
+            contents.append({"role": "model", "parts": ["了解しました。"]})
+        contents.extend({"role": role, "parts": [text]} for role, text, _ in conversation.turns)
+        return contents
+
+    def token_count(self, channel_id, user_id) -> int:
+        """history() に含まれるトークン数（レート制限の見積もり用）"""
+        conversation = self._get(self.key(channel_id, user_id))
+        return conversation.tokens + conversation.summary_tokens if conversation else 0
+
+    # ==========================================
+    # 追加・削除
+    # ==========================================
+    async def add_exchange(self, channel_id, user_id, question: str, answer: str):
+        """質問と応答の1往復を追加し、上限を超えた古いターンを整理"""
+        key = self.key(channel_id, user_id)
+        conversation = self._get(key)
+        if conversation is None:
+            conversation = self._conversations[key] = _Conversation()
+            self._evict_lru()
+
+        conversation.last_used = time.monotonic()
+        self._conversations.move_to_end(key)
+        for role, text in (("user", question), ("model", answer)):
+            tokens = estimate_tokens(text)
+            conversation.turns.append((role, text, tokens))
+            conversation.tokens += tokens
+
+        await self._trim(conversation)
+
+    async def _trim(self, conversation: _Conversation):
+        evicted = []
+        # 最新の1往復は必ず残す
+        while (
+            conversation.tokens + conversation.summary_tokens > self.max_tokens
+            and len(conversation.turns) > 2
+        ):
+            role, text, tokens = conversation.turns.popleft()
+            conversation.tokens -= tokens
+            evicted.append((role, text))
+
+        # 最新の1往復だけで上限を超える場合は、古い方（質問）から末尾を切り詰める
+        while conversation.tokens + conversation.summary_tokens > self.max_tokens and conversation.turns:
+            role, text, tokens = conversation.turns.popleft()
+            conversation.tokens -= tokens
+            budget = self.max_tokens - conversation.summary_tokens - conversation.tokens
+            if budget <= 0:
+                evicted.append((role, text))
+                continue
+            text = text[:budget * 2]
+            while estimate_tokens(text) > budget:
+                text = text[:len(text) * 3 // 4]
+            conversation.turns.appendleft((role, text, estimate_tokens(text)))
+            conversation.tokens += estimate_tokens(text)
+            break
+
+        if not evicted:
+            return
+        self.stats["evicted_turns"] += len(evicted)
+
+        if self.summarize_fn is None:
+            return
+        try:
+            summary = await self.summarize_fn(conversation.summary, evicted)
+        except Exception as e:
+            print(f"⚠️ Conversation summarization failed: {e}")
+            return
+        # 要約が長すぎる場合は切り詰める
+        while summary and estimate_tokens(summary) > self.max_summary_tokens:
+            summary = summary[:len(summary) * 3 // 4]
+        conversation.summary = summary
+        conversation.summary_tokens = estimate_tokens(summary) if summary else 0
+        self.stats["summarized_turns"] += len(evicted)
+
+    def _evict_lru(self):
+        now = time.monotonic()
+        while self._conversations:
+            key, oldest = next(iter(self._conversations.items()))
+            if len(self._conversations) <= self.max_entries and now - oldest.last_used <= self.idle_ttl:
+                break
+            del self._conversations[key]
+            self.stats["evicted_conversations"] += 1
+
+    def forget(self, channel_id, user_id):
+        """会話をリセット"""
+        self._conversations.pop(self.key(channel_id, user_id), None)
+
+    # ==========================================
+    # 統計情報
+    # ==========================================
+    def get_stats(self) -> Dict:
+        return {
+            **self.stats,
+            "conversations": len(self._conversations),
+            "tokens": sum(c.tokens + c.summary_tokens for c in self._conversations.values())
+        }
@@ -0,0 +1,188 @@
+"""
+Geminiリクエストのスケジューラー
+全体の同時実行数を制限し、待機中のリクエストはギルドごとの重み付きラウンドロビンで
+公平に実行枠へ割り当てる。期限を過ぎたリクエストは実行せずに破棄する
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from metrics import Histogram
+
+
+class DeadlineExceeded(Exception):
+    """期限までに実行枠が割り当てられなかった"""
+
+
+class _Ticket:
+    __slots__ = ("guild_id", "priority", "seq", "deadline", "enqueued_at", "granted_at", "future")
+
+    def __init__(self, guild_id: str, priority: int, seq: int, deadline: float, future: asyncio.Future):
+        self.guild_id = guild_id
+        self.priority = priority
+        self.seq = seq
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+        self.granted_at = 0.0
+        self.future = future
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        # 同じギルド内では優先度（小さいほど先）→ 到着順
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class GeminiScheduler:
+    """ギルド間で公平にモデル呼び出しの実行枠を配るスケジューラー
+
+    - 実行中のリクエストは最大 max_concurrency 件
+    - 待機中のギルドを順番に回り、各ギルドから weight 件ずつ取り出す
+      （大きなギルドの連投が小さなギルドを待たせ続けない）
+    - 割り当て時点で期限切れ・キャンセル済みのリクエストは捨てる
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        default_deadline: float = 60.0,
+        weights: Optional[Dict[str, int]] = None
+    ):
+        """
+        Args:
+            max_concurrency: 全ギルド合計の同時実行数
+            default_deadline: 実行枠を待つ最大時間（秒）
+            weights: ギルドIDごとの重み（1巡で取り出す件数、既定は1）
+        """
+        self.max_concurrency = max_concurrency
+        self.default_deadline = default_deadline
+        self.weights = {str(k): v for k, v in (weights or {}).items()}
+
+        self._queues: Dict[str, List[_Ticket]] = {}
+        self._ring: deque = deque()
+        self._credit = 0
+        self._running = 0
+        self._seq = itertools.count()
+
+        self.queue_wait_ms = Histogram()
+        self.service_time_ms = Histogram()
+        self.stats = {"submitted": 0, "granted": 0, "expired": 0, "abandoned": 0}
+
+    # ==========================================
+    # 実行枠
+    # ==========================================
+    @asynccontextmanager
+    async def slot(self, guild_id, priority: int = 0, deadline: Optional[float] = None):
+        """実行枠を待って確保し、ブロックを抜けたら解放する
+
+        Raises:
+            DeadlineExceeded: deadline 秒以内に順番が来なかった場合
+        """
+        ticket = await self._acquire(str(guild_id), priority, deadline or self.default_deadline)
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    async def _acquire(self, guild_id: str, priority: int, deadline: float) -> _Ticket:
+        future = asyncio.get_running_loop().create_future()
+        ticket = _Ticket(guild_id, priority, next(self._seq), time.monotonic() + deadline, future)
+        self.stats["submitted"] += 1
+
+        queue = self._queues.get(guild_id)
+        if queue is None:
+            queue = self._queues[guild_id] = []
+            self._ring.append(guild_id)
+        heapq.heappush(queue, ticket)
+        self._pump()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=deadline)
+        except DeadlineExceeded:
+            # 割り当ての時点で期限を過ぎていた（イベントループの遅延など）
+            self.stats["expired"] += 1
+            raise
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # 期限と同時に割り当てられていた場合は枠を返す
+                self._release(ticket, served=False)
+            else:
+                future.cancel()
+            if isinstance(e, asyncio.CancelledError):
+                self.stats["abandoned"] += 1
+                raise
+            self.stats["expired"] += 1
+            raise DeadlineExceeded(f"No Gemini slot within {deadline:.0f}s") from None
+        return ticket
+
+    def _release(self, ticket: _Ticket, served: bool = True):
+        self._running -= 1
+        if served:
+            self.service_time_ms.observe((time.monotonic() - ticket.granted_at) * 1000)
+        self._pump()
+
+    def _pump(self):
+        """空いている枠を待機中のギルドに順番に割り当てる"""
+        while self._running < self.max_concurrency and self._ring:
+            guild_id = self._ring[0]
+            queue = self._queues[guild_id]
+            ticket = heapq.heappop(queue)
+
+            if self._credit == 0:
+                self._credit = self.weights.get(guild_id, 1)
+            self._credit -= 1
+            if not queue:
+                del self._queues[guild_id]
+                self._ring.popleft()
+                self._credit = 0
+            elif self._credit == 0:
+                self._ring.rotate(-1)
+
+            # 待っている側が既に諦めた（期限切れ・キャンセル）リクエストは実行しない
+            if ticket.future.done():
+                continue
+            if time.monotonic() >= ticket.deadline:
+                # キャンセルではなく期限切れとして待っている側に伝える
+                ticket.future.set_exception(DeadlineExceeded("Gemini slot deadline passed while queued"))
+                continue
+
+            self._running += 1
+            ticket.granted_at = time.monotonic()
+            self.queue_wait_ms.observe((ticket.granted_at - ticket.enqueued_at) * 1000)
+            self.stats["granted"] += 1
+            ticket.future.set_result(None)
+
+    # ==========================================
+    # 統計情報
+    # ==========================================
+    @property
+    def queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def get_stats(self) -> Dict:
+        return {
+            **self.stats,
+            "running": self._running,
+            "queued": self.queued,
+            "waiting_guilds": len(self._ring),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            "service_time_ms": self.service_time_ms.snapshot()
+        }
+
+    def window_columns(self) -> Dict:
+        """前回以降の待ち時間・処理時間を system_stats の列に展開し、ヒストグラムをリセット"""
+        wait, service = self.queue_wait_ms.snapshot(), self.service_time_ms.snapshot()
+        self.queue_wait_ms.reset()
+        self.service_time_ms.reset()
+        return {
+            "gemini_requests": service["count"],
+            "gemini_queue_wait_p50": wait["p50"],
+            "gemini_queue_wait_p95": wait["p95"],
+            "gemini_queue_wait_max": wait["max"],
+            "gemini_service_p50": service["p50"],
+            "gemini_service_p95": service["p95"],
+            "gemini_service_max": service["max"]
+        }
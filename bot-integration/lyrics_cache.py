@@ -0,0 +1,75 @@
+"""
+歌詞キャッシュ
+バイト数で上限を設けたメモリ上のLRUと、SQLiteの永続層の2段構成（本体は tiered_cache）。
+見つからなかった曲も短いTTLで記録し（ネガティブキャッシュ）、毎回APIを叩かないようにする
+"""
+
+from typing import Dict, Optional, Tuple
+
+from tiered_cache import SQLiteStore, TieredCache
+
+Key = Tuple[str, str]
+
+
+class SQLiteLyricsStore(SQLiteStore):
+    """歌詞キャッシュの永続層（payload が NULL の行は「歌詞なし」）"""
+
+    def __init__(self, path: str):
+        super().__init__(path, table="lyrics_cache")
+
+
+def _store_key(key: Key) -> str:
+    # 正規化済みの (曲名, アーティスト) を1つの文字列に
+    return "\x1f".join(key)
+
+
+class LyricsCache:
+    """2層（メモリLRU → SQLite）の歌詞キャッシュ
+
+    get() は (ヒットしたか, 結果) を返す。ネガティブキャッシュのヒットは (True, None)。
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl: float = 7 * 86400.0,
+        negative_ttl: float = 6 * 3600.0,
+        store: Optional[SQLiteLyricsStore] = None
+    ):
+        """
+        Args:
+            max_bytes: メモリ層に保持する歌詞の合計バイト数
+            ttl: 見つかった歌詞の有効期間（秒）
+            negative_ttl: 見つからなかった結果の有効期間（秒）
+            store: 永続層（None ならメモリのみ）
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._cache = TieredCache(max_bytes=max_bytes, store=store, label="Lyrics cache")
+        self.stats = {"negative_hits": 0}
+
+    # ==========================================
+    # 参照・保存
+    # ==========================================
+    async def get(self, key: Key) -> Tuple[bool, Optional[Dict]]:
+        hit, result = await self._cache.get(_store_key(key))
+        if hit and result is None:
+            self.stats["negative_hits"] += 1
+        return hit, result
+
+    async def put(self, key: Key, result: Optional[Dict]):
+        """結果を保存（None は「歌詞なし」として短いTTLで保存）"""
+        ttl = self.ttl if result is not None else self.negative_ttl
+        await self._cache.put(_store_key(key), result, ttl)
+
+    # ==========================================
+    # 統計情報
+    # ==========================================
+    def get_stats(self) -> Dict:
+        return {
+            **self._cache.get_stats(),
+            **self.stats,
+            "max_bytes": self.max_bytes,
+            "hit_rate": f"{self._cache.hit_rate * 100:.1f}%"
+        }
@@ -0,0 +1,176 @@
+"""
+歌詞ページのHTML抽出
+レスポンス本文をチャンクごとに読みながら解析し、歌詞のコンテナが閉じた時点で読むのをやめる。
+入れ子の <div> も深さを数えて正しく扱う
+"""
+
+import codecs
+import re
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+
+# 改行として扱うブロック要素
+_BLOCK_TAGS = {"div", "p", "li", "h1", "h2", "h3", "h4", "h5", "h6"}
+
+
+class _LyricsExtractor(HTMLParser):
+    """歌詞コンテナ内のテキストを集めるパーサーの共通部分
+
+    <div> の深さを数え、コンテナが開いた深さまで戻ったらコンテナを閉じる。
+    done が True になったら、それ以降の本文は読まなくてよい。
+    """
+
+    # <br> を改行にするか（本文に改行が含まれているサイトでは False）
+    br_newline = True
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.done = False
+        self._depth = 0
+        # 開いているコンテナの深さ（コンテナの外では None）
+        self._container_depth: Optional[int] = None
+        # テキストを無視する要素の深さ（広告・注釈など）
+        self._skip_depth: Optional[int] = None
+        self._parts: List[str] = []
+
+    # ==========================================
+    # サブクラスで決める部分
+    # ==========================================
+    def opens_container(self, attrs: List[Tuple[str, Optional[str]]]) -> bool:
+        """この <div> が歌詞コンテナか"""
+        return False
+
+    def skips(self, attrs: List[Tuple[str, Optional[str]]]) -> bool:
+        """コンテナ内のこの <div> のテキストを無視するか"""
+        return False
+
+    def container_closed(self):
+        """コンテナが閉じたときに呼ばれる（既定では読み終わり）"""
+        self.done = True
+
+    # ==========================================
+    # HTMLParser
+    # ==========================================
+    @property
+    def capturing(self) -> bool:
+        return self._container_depth is not None and self._skip_depth is None
+
+    def open_container(self):
+        """現在の位置からコンテナを開始（<div> 以外の目印で始まるサイト用）"""
+        if self._container_depth is None:
+            self._container_depth = self._depth
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == "br":
+            if self.capturing and self.br_newline:
+                self._parts.append("\n")
+            return
+        if tag in _BLOCK_TAGS and self.capturing:
+            self._parts.append("\n")
+        if tag != "div":
+            return
+        self._depth += 1
+        if self._container_depth is None:
+            if self.opens_container(attrs):
+                self._container_depth = self._depth - 1
+        elif self._skip_depth is None and self.skips(attrs):
+            self._skip_depth = self._depth - 1
+
+    def handle_endtag(self, tag):
+        if self.done:
+            return
+        if tag in _BLOCK_TAGS and self.capturing:
+            self._parts.append("\n")
+        if tag != "div" or self._depth == 0:
+            return
+        self._depth -= 1
+        if self._skip_depth is not None and self._depth <= self._skip_depth:
+            self._skip_depth = None
+        if self._container_depth is not None and self._depth <= self._container_depth:
+            self._container_depth = None
+            self._parts.append("\n")
+            self.container_closed()
+
+    def handle_data(self, data):
+        if self.capturing and not self.done:
+            self._parts.append(data)
+
+    # ==========================================
+    # 結果
+    # ==========================================
+    def text(self) -> Optional[str]:
+        lines = [line.strip() for line in "".join(self._parts).splitlines()]
+        # 段落の区切り（空行1つ）は残す
+        text = re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+        return text or None
+
+
+class GeniusLyricsExtractor(_LyricsExtractor):
+    """Genius: data-lyrics-container の <div>（複数）を集める
+
+    コンテナは同じ親要素の中に並んでいるので、最初のコンテナの親が閉じたら読み終わり。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._parent_depth: Optional[int] = None
+
+    def opens_container(self, attrs):
+        if not any(name == "data-lyrics-container" for name, _ in attrs):
+            return False
+        if self._parent_depth is None:
+            self._parent_depth = self._depth - 1
+        return True
+
+    def skips(self, attrs):
+        return any(name == "data-exclude-from-selection" for name, _ in attrs)
+
+    def container_closed(self):
+        pass
+
+    def handle_endtag(self, tag):
+        super().handle_endtag(tag)
+        if tag == "div" and self._parent_depth is not None and self._depth < self._parent_depth:
+            self.done = True
+
+
+class AZLyricsExtractor(_LyricsExtractor):
+    """AZLyrics: 「Usage of azlyrics.com content」のコメントを含む <div> の本文"""
+
+    br_newline = False
+
+    def handle_comment(self, data):
+        if self.done:
+            return
+        if "Usage of azlyrics.com content" in data:
+            self.open_container()
+        elif "MxM banner" in data and self._container_depth is not None:
+            self.done = True
+
+
+async def read_lyrics(
+    response,
+    extractor: _LyricsExtractor,
+    max_bytes: int = 2 * 1024 * 1024,
+    chunk_size: int = 16 * 1024
+) -> Tuple[Optional[str], int]:
+    """aiohttp のレスポンス本文をチャンクごとに解析し、(歌詞, 読んだバイト数) を返す
+
+    歌詞コンテナが閉じた時点、または max_bytes を読んだ時点で読むのをやめる。
+    """
+    try:
+        decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    received = 0
+    async for chunk in response.content.iter_chunked(chunk_size):
+        received += len(chunk)
+        extractor.feed(decoder.decode(chunk))
+        if extractor.done or received >= max_bytes:
+            break
+    else:
+        extractor.feed(decoder.decode(b"", final=True))
+    extractor.close()
+    return extractor.text(), received
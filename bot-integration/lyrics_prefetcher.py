@@ -0,0 +1,140 @@
+"""
+歌詞の先読み
+再生キュー（プレイリストの続きを含む）の次の数曲の歌詞をバックグラウンドで取得してキャッシュに入れておき、
+曲が始まったときに歌詞をすぐ表示できるようにする
+"""
+
+import asyncio
+import logging
+from typing import Dict, Iterable, Set, Tuple
+
+from multi_lyrics_api import MultiLyricsAPI, normalize_track_key
+
+logger = logging.getLogger(__name__)
+
+
+class LyricsPrefetcher:
+    """次に再生される曲の歌詞を少数のワーカーで先読みする
+
+    - 同時に先読みするのは concurrency 曲まで
+    - ユーザーからの検索が実行中の間は次の先読みを始めない（MultiLyricsAPI.wait_idle）
+    - ギルドのキューが変わって不要になった曲は、取り出した時点で捨てる
+    """
+
+    def __init__(
+        self,
+        lyrics_api: MultiLyricsAPI,
+        lookahead: int = 3,
+        concurrency: int = 2,
+        max_pending: int = 500
+    ):
+        """
+        Args:
+            lookahead: 1ギルドあたり先読みする曲数
+            concurrency: 同時に先読みする曲数
+            max_pending: 待機中の先読みの上限（超えた分は捨てる）
+        """
+        self.lyrics_api = lyrics_api
+        self.lookahead = lookahead
+        self.concurrency = concurrency
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        # guild_id -> 先読みしたい曲のキー（最後に prefetch() で渡されたもの）
+        self._wanted: Dict[str, Set[Tuple[str, str]]] = {}
+        # キューに入っている・取得中の (guild_id, キー)
+        self._pending: Set[Tuple[str, Tuple[str, str]]] = set()
+        self._workers = []
+
+        self.stats = {"queued": 0, "fetched": 0, "found": 0, "stale": 0, "dropped": 0, "failed": 0}
+
+    # ==========================================
+    # 開始・停止
+    # ==========================================
+    def start(self):
+        """ワーカーを起動（イベントループ上で呼ぶ）"""
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        print(f"✅ Lyrics prefetcher started (workers={self.concurrency}, lookahead={self.lookahead})")
+
+    async def close(self):
+        """ワーカーを止める（待機中の先読みは捨てる）"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # ==========================================
+    # 先読みの登録
+    # ==========================================
+    def prefetch(self, guild_id, tracks: Iterable) -> int:
+        """ギルドで次に再生される曲を登録し、先頭 lookahead 曲を先読みする
+
+        Args:
+            tracks: 再生順の曲。{"track_title", "artist"} の辞書か (曲名, アーティスト) のタプル
+
+        Returns:
+            新しく先読みに入れた曲数
+        """
+        guild_id = str(guild_id)
+        wanted: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        for track in tracks:
+            if len(wanted) >= self.lookahead:
+                break
+            if isinstance(track, dict):
+                title, artist = track.get("track_title") or "", track.get("artist") or ""
+            else:
+                title, artist = track
+            if title:
+                wanted.setdefault(normalize_track_key(title, artist), (title, artist))
+
+        # 前回登録した曲のうち、今回含まれないものは取り出した時点で捨てられる
+        self._wanted[guild_id] = set(wanted)
+        queued = 0
+        for key, (title, artist) in wanted.items():
+            if (guild_id, key) in self._pending:
+                continue
+            try:
+                self._queue.put_nowait((guild_id, key, title, artist))
+            except asyncio.QueueFull:
+                self.stats["dropped"] += 1
+                break
+            self._pending.add((guild_id, key))
+            queued += 1
+        self.stats["queued"] += queued
+        return queued
+
+    def forget(self, guild_id):
+        """ギルドの先読みを取りやめる（再生終了時など）"""
+        self._wanted.pop(str(guild_id), None)
+
+    # ==========================================
+    # ワーカー
+    # ==========================================
+    async def _worker(self):
+        while True:
+            guild_id, key, title, artist = await self._queue.get()
+            try:
+                if key not in self._wanted.get(guild_id, ()):
+                    self.stats["stale"] += 1
+                    continue
+                # ユーザーからの検索を優先する
+                await self.lyrics_api.wait_idle()
+                result = await self.lyrics_api.fetch_lyrics(title, artist, background=True)
+                self.stats["fetched"] += 1
+                if result:
+                    self.stats["found"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.warning(f"⚠️ Lyrics prefetch failed: {title}: {e}")
+            finally:
+                self._pending.discard((guild_id, key))
+                self._queue.task_done()
+
+    # ==========================================
+    # 統計情報
+    # ==========================================
+    def get_stats(self) -> Dict:
+        return {**self.stats, "pending": self._queue.qsize(), "guilds": len(self._wanted)}
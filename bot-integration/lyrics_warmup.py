@@ -0,0 +1,306 @@
+"""
+歌詞キャッシュの一括ウォームアップ
+playlist_tracks / music_history の曲をページ単位で読み込み、正規化した曲名・アーティストで
+重複を除いてから歌詞を検索して LYRICS_CACHE_PATH のキャッシュに入れる。
+進捗はチェックポイント（SQLite）に記録し、中断しても続きから再開できる。
+タイムアウトなどで結果が確定しなかった曲は記録せず、次回の実行で検索し直す
+（artist 列は database-telemetry-schema.sql で追加する）
+
+使い方:
+    python lyrics_warmup.py --source music_history --source playlist_tracks \\
+        --concurrency 4 --rate lrclib=5 --rate genius=1
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from multi_lyrics_api import NoProviderAvailable, ProviderError, lyrics_api, normalize_track_key
+from supabase_rest import SupabaseREST
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ("music_history", "playlist_tracks")
+
+# 結果が確定しなかった（次回やり直す）ことを表す値
+RETRY = object()
+
+# done() の1クエリで調べる曲数（1曲につき2パラメータ）
+_DONE_CHUNK = 249
+
+
+class WarmupCheckpoint:
+    """ウォームアップの進捗（テーブルごとの読み込み位置と、処理済みの曲）"""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cursors (source TEXT PRIMARY KEY, last_id TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            " title TEXT NOT NULL,"
+            " artist TEXT NOT NULL,"
+            " found INTEGER NOT NULL,"
+            " source TEXT,"
+            " PRIMARY KEY (title, artist))"
+        )
+        self._conn.commit()
+
+    def cursor(self, source: str) -> Optional[str]:
+        row = self._conn.execute("SELECT last_id FROM cursors WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def done(self, keys: List[Tuple[str, str]]) -> set:
+        """keys のうち処理済みのもの"""
+        done = set()
+        # 1つのクエリのパラメータ数を古いSQLiteの上限（999）未満に抑える
+        for i in range(0, len(keys), _DONE_CHUNK):
+            chunk = keys[i:i + _DONE_CHUNK]
+            where = " OR ".join(["(title = ? AND artist = ?)"] * len(chunk))
+            params = [part for key in chunk for part in key]
+            done.update(self._conn.execute(f"SELECT title, artist FROM tracks WHERE {where}", params))
+        return done
+
+    def commit_page(
+        self,
+        source: str,
+        last_id: Optional[str],
+        results: List[Tuple[Tuple[str, str], Optional[str]]]
+    ):
+        """1ページ分の結果と読み込み位置を1トランザクションで保存（last_id が None なら位置は進めない）
+
+        results の provider が None の曲は「歌詞なし」として記録する（確定した結果だけを渡す）。
+        """
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tracks (title, artist, found, source) VALUES (?, ?, ?, ?)",
+                [(*key, provider is not None, provider) for key, provider in results]
+            )
+            if last_id is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cursors (source, last_id) VALUES (?, ?)", (source, last_id)
+                )
+
+    def reset(self):
+        with self._conn:
+            self._conn.execute("DELETE FROM cursors")
+            self._conn.execute("DELETE FROM tracks")
+
+    def close(self):
+        self._conn.close()
+
+
+class LyricsWarmup:
+    """ページ単位で曲を読み込み、上限付きの並列度で歌詞を検索する"""
+
+    def __init__(
+        self,
+        rest: SupabaseREST,
+        checkpoint: WarmupCheckpoint,
+        concurrency: int = 4,
+        page_size: int = 500,
+        report_interval: float = 30.0
+    ):
+        self.rest = rest
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.report_interval = report_interval
+
+        self.stats = {
+            "rows": 0, "duplicates": 0, "skipped": 0,
+            "looked_up": 0, "found": 0, "missing": 0, "retry": 0
+        }
+        # 全プロバイダーが停止中になったら、残りは次回に回す
+        self._unavailable = False
+        self._started = 0.0
+        self._last_report = 0.0
+
+    # ==========================================
+    # 曲の読み込み
+    # ==========================================
+    async def _pages(self, source: str):
+        """id 順のキーセットページングで (最後のid, 行) を返す（前回の続きから）"""
+        last_id = self.checkpoint.cursor(source)
+        while True:
+            params = {"select": "id,track_title,artist", "order": "id.asc", "limit": str(self.page_size)}
+            if last_id:
+                params["id"] = f"gt.{last_id}"
+            rows = await self.rest.select(source, params)
+            if not rows:
+                return
+            last_id = rows[-1]["id"]
+            yield last_id, rows
+
+    # ==========================================
+    # 実行
+    # ==========================================
+    async def run(self, sources: List[str], limit: Optional[int] = None):
+        self._started = self._last_report = time.monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        for source in sources:
+            print(f"🎵 Warming up lyrics from {source}")
+            # やり直す曲を含むページより先には読み込み位置を進めない
+            hold_cursor = False
+            async for last_id, rows in self._pages(source):
+                self.stats["rows"] += len(rows)
+
+                # ページ内の重複を除き、処理済みの曲を飛ばす
+                tracks: Dict[Tuple[str, str], Tuple[str, str]] = {}
+                for row in rows:
+                    title = row.get("track_title") or ""
+                    artist = row.get("artist") or ""
+                    key = normalize_track_key(title, artist)
+                    if not key[0]:
+                        continue
+                    if key in tracks:
+                        self.stats["duplicates"] += 1
+                    else:
+                        tracks[key] = (title, artist)
+                done = await asyncio.to_thread(self.checkpoint.done, list(tracks))
+                self.stats["skipped"] += len(done)
+                todo = [(key, track) for key, track in tracks.items() if key not in done]
+                complete = True
+                if limit is not None and len(todo) > limit - self.stats["looked_up"]:
+                    # ページの途中で止まる場合は、次回このページから再開する
+                    todo = todo[:max(0, limit - self.stats["looked_up"])]
+                    complete = False
+
+                results = await asyncio.gather(
+                    *(self._lookup(semaphore, key, title, artist) for key, (title, artist) in todo)
+                )
+                settled = [(key, provider) for key, provider in results if provider is not RETRY]
+                if len(settled) < len(results):
+                    hold_cursor = True
+                await asyncio.to_thread(
+                    self.checkpoint.commit_page,
+                    source,
+                    last_id if complete and not hold_cursor else None,
+                    settled
+                )
+                self._report()
+
+                if self._unavailable:
+                    print("⏸️ All lyrics providers are unavailable; run again later to resume")
+                    return
+                if limit is not None and self.stats["looked_up"] >= limit:
+                    print(f"⏹️ Reached limit of {limit} lookups")
+                    return
+
+    async def _lookup(self, semaphore: asyncio.Semaphore, key: Tuple[str, str], title: str, artist: str):
+        """(キー, 見つかったプロバイダー名 / None / RETRY) を返す
+
+        None は全プロバイダーが「見つからない」と答えた場合だけ。一時的な失敗や、
+        ブレーカーが開いていて試せなかったプロバイダーがある場合は ProviderError になる。
+        """
+        async with semaphore:
+            if self._unavailable:
+                return key, RETRY
+            try:
+                result = await lyrics_api.fetch_lyrics(title, artist, background=True, raise_errors=True)
+            except NoProviderAvailable:
+                self._unavailable = True
+                self.stats["retry"] += 1
+                return key, RETRY
+            except ProviderError:
+                # 一時的な失敗は「歌詞なし」として記録しない
+                self.stats["retry"] += 1
+                return key, RETRY
+
+        self.stats["looked_up"] += 1
+        self.stats["found" if result else "missing"] += 1
+        return key, (result["source"] if result else None)
+
+    # ==========================================
+    # スループット
+    # ==========================================
+    def _report(self, final: bool = False):
+        now = time.monotonic()
+        if not final and now - self._last_report < self.report_interval:
+            return
+        self._last_report = now
+        elapsed = max(now - self._started, 1e-9)
+        print(
+            f"{'✅' if final else '📊'} {self.stats['looked_up']} lookups in {elapsed:.0f}s "
+            f"({self.stats['looked_up'] / elapsed:.2f} tracks/s, {self.stats['rows'] / elapsed:.1f} rows/s), "
+            f"found={self.stats['found']}, missing={self.stats['missing']}, retry={self.stats['retry']}, "
+            f"skipped={self.stats['skipped']}, duplicates={self.stats['duplicates']}"
+        )
+
+    def report(self):
+        """最終結果とプロバイダーごとの統計を表示"""
+        self._report(final=True)
+        for name, stats in lyrics_api.get_stats().items():
+            if stats["latency_p50_ms"] is None:
+                print(f"  {name}: {stats['success']}/{stats['total']} ({stats['success_rate']}), state={stats['state']}")
+                continue
+            print(
+                f"  {name}: {stats['success']}/{stats['total']} ({stats['success_rate']}), "
+                f"p50={stats['latency_p50_ms']}ms, p95={stats['latency_p95_ms']}ms, state={stats['state']}"
+            )
+        print(f"  cache: {lyrics_api.get_cache_stats()}")
+
+
+# ==========================================
+# コマンドライン
+# ==========================================
+def _parse_rate(value: str) -> Tuple[str, float]:
+    name, _, rate = value.partition("=")
+    if not rate:
+        raise argparse.ArgumentTypeError(f"Expected provider=rate, got {value}")
+    return name.strip(), float(rate)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="歌詞キャッシュの一括ウォームアップ")
+    parser.add_argument("--source", action="append", choices=SOURCES, help="読み込むテーブル（複数指定可）")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時に検索する曲数")
+    parser.add_argument("--page-size", type=int, default=500, help="1回に読み込む行数")
+    parser.add_argument("--rate", action="append", type=_parse_rate, default=[],
+                        help="プロバイダーごとの1秒あたりの上限（例: lrclib=5）")
+    parser.add_argument("--mode", choices=("sequential", "hedged", "parallel"), default="sequential",
+                        help="プロバイダーの試し方（既定は呼び出し回数が最も少ない sequential）")
+    parser.add_argument("--limit", type=int, help="検索する曲数の上限")
+    parser.add_argument("--checkpoint", default=os.getenv("LYRICS_WARMUP_CHECKPOINT", "lyrics_warmup.db"))
+    parser.add_argument("--reset", action="store_true", help="進捗を消して最初からやり直す")
+    args = parser.parse_args()
+
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+    if not supabase_url or not supabase_key:
+        print("❌ Supabase credentials not found")
+        return
+
+    lyrics_api.mode = args.mode
+    if args.rate:
+        lyrics_api.set_rate_limits(dict(args.rate))
+
+    checkpoint = WarmupCheckpoint(args.checkpoint)
+    if args.reset:
+        checkpoint.reset()
+    rest = SupabaseREST(supabase_url, supabase_key)
+    warmup = LyricsWarmup(rest, checkpoint, concurrency=args.concurrency, page_size=args.page_size)
+
+    try:
+        await warmup.run(args.source or list(SOURCES), limit=args.limit)
+    finally:
+        warmup.report()
+        checkpoint.close()
+        await lyrics_api.close()
+        await asyncio.to_thread(rest.close)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main())
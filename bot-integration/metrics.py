@@ -0,0 +1,78 @@
+"""
+テレメトリ用の集計ヘルパー
+"""
+
+import bisect
+import math
+from typing import Dict, Iterable, List, Optional
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """ソート済みでない値のリストから q パーセンタイル（0-100）を求める（nearest-rank法）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values: Iterable[float]) -> Dict[str, Optional[float]]:
+    """min / avg / max / p95 を計算"""
+    values = [v for v in values if v is not None]
+    if not values:
+        return {"min": None, "avg": None, "max": None, "p95": None}
+    return {
+        "min": min(values),
+        "avg": sum(values) / len(values),
+        "max": max(values),
+        "p95": percentile(values, 95)
+    }
+
+
+# 遅延ヒストグラムの既定の境界（ミリ秒）
+LATENCY_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class Histogram:
+    """固定境界のヒストグラム（値を保持せず、メモリは境界の数だけ）"""
+
+    def __init__(self, bounds=LATENCY_BOUNDS_MS):
+        self.bounds = tuple(bounds)
+        self.reset()
+
+    def reset(self):
+        # 最後の要素は最大の境界を超えた値
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = None
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """q パーセンタイル（0-100）が入るビンの上端（実際の最大値は超えない）"""
+        if not self.count:
+            return None
+        target = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                if index == len(self.bounds):
+                    return self.max
+                return min(self.bounds[index], self.max)
+        return self.max
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.count,
+            "avg": (self.total / self.count) if self.count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "max": self.max,
+            "buckets": dict(zip([*map(str, self.bounds), "+Inf"], self.counts))
+        }
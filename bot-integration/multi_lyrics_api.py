@@ -7,46 +7,194 @@ import aiohttp
 import asyncio
 import re
 import os
-from typing import Optional, Dict, List
+import time
+import unicodedata
+from typing import Optional, Dict, List, Tuple
 import logging
 
+from lyrics_cache import LyricsCache, SQLiteLyricsStore
+from lyrics_html import AZLyricsExtractor, GeniusLyricsExtractor, read_lyrics
+from provider_health import ProviderHealth
+from rate_limiter import TokenBucket
+from synced_lyrics import SyncedLyrics, parse_lrc
+
 logger = logging.getLogger(__name__)
 
 # API設定
 GENIUS_API_TOKEN = os.getenv("GENIUS_API_TOKEN", "")
 MUSIXMATCH_API_KEY = os.getenv("MUSIXMATCH_API_KEY", "")
 
+# 歌詞キャッシュ設定（LYRICS_CACHE_PATH を空にするとメモリのみ）
+LYRICS_CACHE_PATH = os.getenv("LYRICS_CACHE_PATH", "lyrics_cache.db")
+LYRICS_CACHE_MAX_BYTES = int(os.getenv("LYRICS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+LYRICS_CACHE_TTL = float(os.getenv("LYRICS_CACHE_TTL", str(7 * 86400)))
+LYRICS_CACHE_NEGATIVE_TTL = float(os.getenv("LYRICS_CACHE_NEGATIVE_TTL", str(6 * 3600)))
+
+# プロバイダーの試し方
+#   sequential: 優先順に1つずつ（失敗したら次）
+#   hedged:     優先順に開始し、LYRICS_HEDGE_DELAY 秒応答が無ければ次も並行して開始
+#   parallel:   全プロバイダーを同時に開始
+LYRICS_FETCH_MODE = os.getenv("LYRICS_FETCH_MODE", "hedged")
+LYRICS_HEDGE_DELAY = float(os.getenv("LYRICS_HEDGE_DELAY", "1.5"))
+# 直近の応答時間と成功率から、成功までの期待時間が短い順にプロバイダーを開始する
+LYRICS_ADAPTIVE_ORDER = os.getenv("LYRICS_ADAPTIVE_ORDER", "true").lower() in ("1", "true", "yes")
+# スクレイピングするページの本文をこれ以上読まない（バイト）
+LYRICS_HTML_MAX_BYTES = int(os.getenv("LYRICS_HTML_MAX_BYTES", str(2 * 1024 * 1024)))
+# HTTP接続プール（全体・ホストごとの同時接続数、keep-alive、DNSキャッシュ）とタイムアウト（秒）
+LYRICS_HTTP_POOL_SIZE = int(os.getenv("LYRICS_HTTP_POOL_SIZE", "50"))
+LYRICS_HTTP_PER_HOST = int(os.getenv("LYRICS_HTTP_PER_HOST", "8"))
+LYRICS_HTTP_KEEPALIVE = float(os.getenv("LYRICS_HTTP_KEEPALIVE", "30"))
+LYRICS_HTTP_DNS_TTL = int(os.getenv("LYRICS_HTTP_DNS_TTL", "300"))
+LYRICS_HTTP_TIMEOUT = aiohttp.ClientTimeout(
+    total=float(os.getenv("LYRICS_HTTP_TOTAL_TIMEOUT", "10")),
+    connect=float(os.getenv("LYRICS_HTTP_CONNECT_TIMEOUT", "3")),
+    sock_read=float(os.getenv("LYRICS_HTTP_READ_TIMEOUT", "8"))
+)
+# プロバイダーごとの1秒あたりの呼び出し上限（例: "lrclib=5,genius=1"、未指定は無制限）
+LYRICS_PROVIDER_RATE_LIMITS = {
+    name.strip(): float(rate)
+    for name, _, rate in (p.partition("=") for p in os.getenv("LYRICS_PROVIDER_RATE_LIMITS", "").split(","))
+    if name.strip() and rate
+}
+LYRICS_PROVIDER_PRIORITY = [
+    p.strip() for p in os.getenv("LYRICS_PROVIDER_PRIORITY", "lrclib,genius,musixmatch,azlyrics").split(",")
+    if p.strip()
+]
+
+
+def normalize_track_key(track_title: str, artist: str = "") -> Tuple[str, str]:
+    """同じ曲を同じキーにまとめるための正規化（全角半角・大小文字・空白を揃える）"""
+    def _normalize(text: str) -> str:
+        text = unicodedata.normalize("NFKC", text or "").casefold()
+        return " ".join(text.split())
+    return _normalize(track_title), _normalize(artist)
+
+
+class NoProviderAvailable(Exception):
+    """全プロバイダーのサーキットブレーカーが開いている"""
+
+
+class ProviderError(Exception):
+    """プロバイダーの一時的な失敗（タイムアウト・HTTPエラー・例外）。「歌詞なし」とは区別する"""
+
 
 class MultiLyricsAPI:
     """複数の歌詞APIを統合したクラス"""
     
-    def __init__(self):
-        self.session = None
+    def __init__(
+        self,
+        cache: Optional[LyricsCache] = None,
+        mode: str = "hedged",
+        hedge_delay: float = 1.5,
+        priority: Optional[List[str]] = None,
+        adaptive: bool = True,
+        html_max_bytes: int = 2 * 1024 * 1024,
+        rate_limits: Optional[Dict[str, float]] = None,
+        pool_size: int = 50,
+        per_host_limit: int = 8,
+        keepalive_timeout: float = 30.0,
+        dns_ttl: int = 300,
+        timeout: Optional[aiohttp.ClientTimeout] = None
+    ):
+        """
+        Args:
+            cache: 歌詞キャッシュ（None ならキャッシュしない）
+            mode: "sequential" / "hedged" / "parallel"
+            hedge_delay: hedged で次のプロバイダーを追加で開始するまでの秒数。
+                優先度の低い結果が先に届いた場合に、より優先度の高い結果を待つ時間でもある
+            priority: プロバイダーの優先順（複数成功した場合にどれを採用するか）
+            adaptive: True なら開始する順番を成功までの期待時間で並べ替える
+            html_max_bytes: スクレイピングで読む本文の上限（バイト）
+            rate_limits: プロバイダー名 -> 1秒あたりの呼び出し上限
+            pool_size: 全体の同時接続数
+            per_host_limit: 1ホストあたりの同時接続数
+            keepalive_timeout: 使い終わった接続を再利用のために残しておく秒数
+            dns_ttl: DNSの解決結果をキャッシュする秒数
+            timeout: リクエストのタイムアウト（接続・読み込み・全体）
+        """
+        if mode not in ("sequential", "hedged", "parallel"):
+            raise ValueError(f"Unknown lyrics fetch mode: {mode}")
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.pool_size = pool_size
+        self.per_host_limit = per_host_limit
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        self.timeout = timeout or aiohttp.ClientTimeout(total=10, connect=3, sock_read=8)
+        self.cache = cache
+        self.mode = mode
+        self.hedge_delay = hedge_delay
+        self.providers = {
+            "lrclib": self._try_lrclib,
+            "genius": self._try_genius,
+            "musixmatch": self._try_musixmatch,
+            "azlyrics": self._try_azlyrics
+        }
+        self.priority = [p for p in (priority or list(self.providers)) if p in self.providers]
+        self.adaptive = adaptive
+        self.html_max_bytes = html_max_bytes
+        # 応答時間・成功率・サーキットブレーカー
+        self.health = {name: ProviderHealth(name) for name in self.providers}
+        self._rate_buckets: Dict[str, TokenBucket] = {}
+        self.set_rate_limits(rate_limits or {})
         self.api_stats = {
             "lrclib": {"success": 0, "fail": 0},
             "genius": {"success": 0, "fail": 0},
             "musixmatch": {"success": 0, "fail": 0},
             "azlyrics": {"success": 0, "fail": 0}
         }
+        # 同じ曲の同時検索は1つにまとめる（正規化キー -> 実行中のタスク）
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.lookup_stats = {"lookups": 0, "background": 0, "coalesced": 0, "hedged": 0, "cancelled": 0, "throttled": 0}
+        # 実行中のユーザーからの検索（0 になると _idle がセットされる）
+        self._interactive = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.html_stats = {"pages": 0, "bytes_read": 0, "stopped_early": 0, "truncated": 0}
     
-    async def get_session(self):
-        """HTTPセッションを取得"""
-        if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession()
+    async def get_session(self) -> aiohttp.ClientSession:
+        """接続プール付きのHTTPセッションを取得（全プロバイダーで共有）"""
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed or self._session_loop is not loop:
+            # 別のイベントループで作られたセッションは使えない（再起動後など）
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.per_host_limit,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_ttl
+            )
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._session_loop = loop
         return self.session
     
     async def close(self):
-        """セッションをクローズ"""
-        if self.session and not self.session.closed:
+        """セッションをクローズ（接続プールも閉じる）"""
+        if self.session and not self.session.closed and self._session_loop is asyncio.get_running_loop():
             await self.session.close()
+        self.session = None
+        self._session_loop = None
     
     # ==========================================
     # メイン関数: 全APIを試行
     # ==========================================
-    async def fetch_lyrics(self, track_title: str, artist: str = "") -> Optional[Dict]:
+    async def fetch_lyrics(
+        self,
+        track_title: str,
+        artist: str = "",
+        background: bool = False,
+        raise_errors: bool = False
+    ) -> Optional[Dict]:
         """
         複数のAPIを順番に試して歌詞を取得
         
+        同じ曲（正規化した曲名・アーティスト）の検索が実行中なら、新しく
+        APIを呼ばずにその結果を待つ。
+        
+        Args:
+            background: 先読みなどの優先度の低い検索（wait_idle() の判定に数えない）
+            raise_errors: 一時的な失敗で見つからなかった場合に None ではなく
+                NoProviderAvailable / ProviderError を送出する（「歌詞なし」と区別したい呼び出し元用）
+        
         Returns:
             {
                 "lyrics": str,
@@ -55,77 +203,271 @@ class MultiLyricsAPI:
                 "plain": str     # プレーンテキスト
             }
         """
-        logger.info(f"🔍 Searching lyrics for: {track_title} - {artist}")
+        if background:
+            self.lookup_stats["background"] += 1
+            return await self._lookup(track_title, artist, raise_errors)
+        
+        self._interactive += 1
+        self._idle.clear()
+        try:
+            return await self._lookup(track_title, artist, raise_errors)
+        finally:
+            self._interactive -= 1
+            if self._interactive == 0:
+                self._idle.set()
+    
+    async def wait_idle(self):
+        """ユーザーからの検索が実行中でなくなるまで待つ（優先度の低い処理用）"""
+        await self._idle.wait()
+    
+    async def _lookup(self, track_title: str, artist: str, raise_errors: bool = False) -> Optional[Dict]:
+        """キャッシュ → 実行中の同じ検索 → APIの順に歌詞を探す"""
+        self.lookup_stats["lookups"] += 1
+        key = normalize_track_key(track_title, artist)
         
-        # 1. LRCLIB (タイムスタンプ付き歌詞)
-        result = await self._try_lrclib(track_title, artist)
-        if result:
-            return result
+        # キャッシュ（「歌詞なし」も含む）にあればAPIを呼ばない
+        if self.cache:
+            hit, result = await self.cache.get(key)
+            if hit:
+                return result
         
-        # 2. Genius (高品質な歌詞)
-        result = await self._try_genius(track_title, artist)
-        if result:
-            return result
+        task = self._inflight.get(key)
+        if task is not None:
+            self.lookup_stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._fetch_and_cache(key, track_title, artist))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
         
-        # 3. Musixmatch (多言語対応)
-        result = await self._try_musixmatch(track_title, artist)
-        if result:
-            return result
+        # 待っている1人がキャンセルしても、他の待機者のための検索は続ける
+        try:
+            return await asyncio.shield(task)
+        except (NoProviderAvailable, ProviderError):
+            if raise_errors:
+                raise
+            return None
+    
+    async def _fetch_and_cache(self, key: Tuple[str, str], track_title: str, artist: str) -> Optional[Dict]:
+        """APIで検索し、結果をキャッシュに保存
+        
+        「歌詞なし」をキャッシュするのは、試したプロバイダーがすべて「見つからない」と
+        答えた場合だけ。一時的な失敗が含まれる場合はキャッシュせずに例外を送出する。
+        """
+        try:
+            result = await self._fetch_from_providers(track_title, artist)
+        except NoProviderAvailable:
+            logger.warning(f"⚠️ All lyrics providers are unavailable: {track_title}")
+            raise
+        except ProviderError as e:
+            logger.warning(f"⚠️ Lyrics lookup incomplete: {track_title}: {e}")
+            raise
+        if self.cache:
+            await self.cache.put(key, result)
+        return result
+    
+    async def _fetch_from_providers(self, track_title: str, artist: str) -> Optional[Dict]:
+        """優先順にプロバイダーを試す（mode に応じて並行に開始する）
+        
+        成功した結果のうち最も優先度の高いものを返す。優先度の低い結果が先に届いた場合は、
+        実行中のより優先度の高いプロバイダーを hedge_delay 秒だけ待つ。
+        残りのリクエストはキャンセルする。
+        見つからず、試したプロバイダーのどれかが失敗していた、またはブレーカーが開いていて
+        試せなかったプロバイダーがある場合は ProviderError を送出する。
+        """
+        logger.info(f"🔍 Searching lyrics for: {track_title} - {artist}")
         
-        # 4. AZLyrics (フォールバック)
-        result = await self._try_azlyrics(track_title, artist)
-        if result:
-            return result
+        order = self.provider_order()
+        rank = {name: index for index, name in enumerate(self.priority)}
+        pending: Dict[asyncio.Task, str] = {}
+        results: Dict[str, Dict] = {}
+        errors: List[str] = []
+        # ブレーカーが開いていて呼ばなかったプロバイダー
+        skipped: List[str] = [name for name in self.priority if name not in order]
+        next_index = 0
         
+        def launch() -> bool:
+            """次に呼べるプロバイダーを開始（ブレーカーが開いているものは飛ばす）"""
+            nonlocal next_index
+            while next_index < len(order):
+                name = order[next_index]
+                next_index += 1
+                if self.health[name].allow():
+                    pending[asyncio.ensure_future(self._call_provider(name, track_title, artist))] = name
+                    return True
+                skipped.append(name)
+            return False
+        
+        try:
+            if not launch():
+                raise NoProviderAvailable()
+            while self.mode == "parallel" and launch():
+                pass
+            
+            while pending:
+                hedge = self.mode == "hedged" and next_index < len(order)
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self.hedge_delay if hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # 応答が遅いので次のプロバイダーも並行して開始
+                    self.lookup_stats["hedged"] += 1
+                    launch()
+                    continue
+                
+                failed = 0
+                for task in done:
+                    name = pending.pop(task)
+                    if task.cancelled() or task.exception() is not None:
+                        errors.append(name)
+                        failed += 1
+                    elif task.result():
+                        results[name] = task.result()
+                    else:
+                        failed += 1
+                
+                if results:
+                    best = min(results, key=rank.get)
+                    higher = [t for t, name in pending.items() if rank[name] < rank[best]]
+                    if higher:
+                        # より優先度の高い結果を少しだけ待つ
+                        await asyncio.wait(higher, timeout=self.hedge_delay)
+                        for task in higher:
+                            if task.done():
+                                name = pending.pop(task)
+                                if not task.cancelled() and task.exception() is None and task.result():
+                                    results[name] = task.result()
+                        best = min(results, key=rank.get)
+                    return results[best]
+                
+                # 失敗した分は待たずに次のプロバイダーを開始
+                for _ in range(failed):
+                    if next_index < len(order):
+                        launch()
+        finally:
+            for task in pending:
+                task.cancel()
+                self.lookup_stats["cancelled"] += 1
+        
+        if errors or skipped:
+            # 一時的な失敗・試せなかったプロバイダーがあるので「歌詞なし」とは言い切れない
+            raise ProviderError(
+                f"failed: {', '.join(errors) or '-'}, skipped: {', '.join(skipped) or '-'}"
+            )
         logger.warning(f"❌ No lyrics found for: {track_title}")
         return None
     
+    def provider_order(self) -> List[str]:
+        """開始する順番（adaptive なら成功までの期待時間が短い順、同じなら優先順）"""
+        candidates = [name for name in self.priority if self.health[name].available()]
+        if not self.adaptive:
+            return candidates
+        rank = {name: index for index, name in enumerate(self.priority)}
+        return sorted(candidates, key=lambda name: (self.health[name].expected_time_ms(), rank[name]))
+    
+    def set_rate_limits(self, rate_limits: Dict[str, float]):
+        """プロバイダーごとの1秒あたりの呼び出し上限を設定（1秒分までのバーストを許す）"""
+        self._rate_buckets = {
+            name: TokenBucket(max(1.0, rate), rate)
+            for name, rate in rate_limits.items()
+            if name in self.providers and rate > 0
+        }
+    
+    async def _throttle(self, name: str):
+        """呼び出し上限に達していれば空くまで待つ（先に差し引くので到着順に通る）"""
+        bucket = self._rate_buckets.get(name)
+        if bucket is None:
+            return
+        bucket.refill(time.monotonic())
+        wait = bucket.wait_time(1)
+        bucket.tokens -= 1
+        if wait > 0:
+            self.lookup_stats["throttled"] += 1
+            await asyncio.sleep(wait)
+    
+    async def _call_provider(self, name: str, track_title: str, artist: str) -> Optional[Dict]:
+        """プロバイダーを呼び、応答時間と結果を記録
+        
+        歌詞が見つからなかった（None）のは正常な応答として記録し、サーキットブレーカーの
+        連続失敗には数えない。タイムアウト・HTTPエラー・例外は ProviderError にして送出する。
+        """
+        started = time.perf_counter()
+        try:
+            await self._throttle(name)
+            started = time.perf_counter()
+            result = await self.providers[name](track_title, artist)
+        except asyncio.CancelledError:
+            self.health[name].cancelled()
+            raise
+        except Exception as e:
+            self.api_stats[name]["fail"] += 1
+            self.health[name].record_failure((time.perf_counter() - started) * 1000)
+            if isinstance(e, asyncio.TimeoutError):
+                logger.warning(f"⏱️ {name} timeout")
+                raise ProviderError(f"{name} timeout") from e
+            logger.error(f"❌ {name} error: {e}")
+            if isinstance(e, ProviderError):
+                raise
+            raise ProviderError(f"{name}: {e}") from e
+        self.health[name].record(bool(result), (time.perf_counter() - started) * 1000)
+        return result
+    
+    @staticmethod
+    def _found(response) -> bool:
+        """200 なら True、404 なら「歌詞なし」で False、それ以外は一時的な失敗として送出"""
+        if response.status == 200:
+            return True
+        if response.status == 404:
+            return False
+        raise ProviderError(f"HTTP {response.status}")
+    
     # ==========================================
     # 1. LRCLIB API
     # ==========================================
     async def _try_lrclib(self, track_title: str, artist: str) -> Optional[Dict]:
         """LRCLIB APIで歌詞を取得（タイムスタンプ付き）"""
-        try:
-            session = await self.get_session()
-            
-            # クエリを作成
-            params = {
-                "track_name": track_title,
-                "artist_name": artist
-            }
-            
-            url = "https://lrclib.net/api/get"
-            async with session.get(url, params=params, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    
-                    # タイムスタンプ付き歌詞
-                    synced_lyrics = data.get("syncedLyrics")
-                    plain_lyrics = data.get("plainLyrics")
-                    
-                    if synced_lyrics or plain_lyrics:
-                        self.api_stats["lrclib"]["success"] += 1
-                        logger.info("✅ Found lyrics on LRCLIB")
-                        
-                        return {
-                            "lyrics": synced_lyrics or plain_lyrics,
-                            "source": "lrclib",
-                            "synced": bool(synced_lyrics),
-                            "plain": plain_lyrics or synced_lyrics
-                        }
+        session = await self.get_session()
+        
+        # クエリを作成
+        params = {
+            "track_name": track_title,
+            "artist_name": artist
+        }
+        
+        url = "https://lrclib.net/api/get"
+        async with session.get(url, params=params) as response:
+            if self._found(response):
+                data = await response.json()
                 
-                logger.debug(f"LRCLIB returned {response.status}")
-                self.api_stats["lrclib"]["fail"] += 1
+                # タイムスタンプ付き歌詞（時刻付きの行が1つも無ければ使わない）
+                synced_lyrics = data.get("syncedLyrics")
+                plain_lyrics = data.get("plainLyrics")
+                if synced_lyrics and not len(parse_lrc(synced_lyrics)):
+                    synced_lyrics = None
                 
-        except asyncio.TimeoutError:
-            logger.warning("⏱️ LRCLIB timeout")
-            self.api_stats["lrclib"]["fail"] += 1
-        except Exception as e:
-            logger.error(f"❌ LRCLIB error: {e}")
+                if synced_lyrics or plain_lyrics:
+                    self.api_stats["lrclib"]["success"] += 1
+                    logger.info("✅ Found lyrics on LRCLIB")
+                    
+                    return {
+                        "lyrics": synced_lyrics or plain_lyrics,
+                        "source": "lrclib",
+                        "synced": bool(synced_lyrics),
+                        "plain": plain_lyrics or synced_lyrics
+                    }
+            
+            logger.debug(f"LRCLIB returned {response.status}")
             self.api_stats["lrclib"]["fail"] += 1
         
         return None
     
+    def synced_lyrics(self, result: Optional[Dict]) -> Optional[SyncedLyrics]:
+        """fetch_lyrics() の結果から、再生位置で引けるインデックスを取得（同期歌詞でなければ None）"""
+        if not result or not result.get("synced"):
+            return None
+        return parse_lrc(result["lyrics"])
+    
     # ==========================================
     # 2. Genius API
     # ==========================================
@@ -135,82 +477,46 @@ class MultiLyricsAPI:
             logger.debug("Genius API token not set")
             return None
         
-        try:
-            session = await self.get_session()
+        session = await self.get_session()
+        
+        # 曲を検索
+        search_url = "https://api.genius.com/search"
+        headers = {"Authorization": f"Bearer {GENIUS_API_TOKEN}"}
+        params = {"q": f"{track_title} {artist}"}
+        
+        async with session.get(search_url, headers=headers, params=params) as response:
+            if not self._found(response):
+                self.api_stats["genius"]["fail"] += 1
+                return None
             
-            # 曲を検索
-            search_url = "https://api.genius.com/search"
-            headers = {"Authorization": f"Bearer {GENIUS_API_TOKEN}"}
-            params = {"q": f"{track_title} {artist}"}
+            data = await response.json()
+            hits = data.get("response", {}).get("hits", [])
             
-            async with session.get(search_url, headers=headers, params=params, timeout=10) as response:
-                if response.status != 200:
-                    self.api_stats["genius"]["fail"] += 1
-                    return None
-                
-                data = await response.json()
-                hits = data.get("response", {}).get("hits", [])
-                
-                if not hits:
-                    self.api_stats["genius"]["fail"] += 1
-                    return None
-                
-                # 最初の結果を使用
-                song_url = hits[0]["result"]["url"]
-                
-                # 歌詞ページをスクレイピング（簡易版）
-                async with session.get(song_url, timeout=10) as lyrics_response:
-                    if lyrics_response.status == 200:
-                        html = await lyrics_response.text()
-                        
-                        # 歌詞を抽出（簡易的な方法）
-                        # 実際にはBeautifulSoupなどを使用することを推奨
-                        lyrics = self._extract_genius_lyrics(html)
-                        
-                        if lyrics:
-                            self.api_stats["genius"]["success"] += 1
-                            logger.info("✅ Found lyrics on Genius")
-                            
-                            return {
-                                "lyrics": lyrics,
-                                "source": "genius",
-                                "synced": False,
-                                "plain": lyrics
-                            }
-            
-            self.api_stats["genius"]["fail"] += 1
+            if not hits:
+                self.api_stats["genius"]["fail"] += 1
+                return None
             
-        except asyncio.TimeoutError:
-            logger.warning("⏱️ Genius timeout")
-            self.api_stats["genius"]["fail"] += 1
-        except Exception as e:
-            logger.error(f"❌ Genius error: {e}")
-            self.api_stats["genius"]["fail"] += 1
+            # 最初の結果を使用
+            song_url = hits[0]["result"]["url"]
         
-        return None
-    
-    def _extract_genius_lyrics(self, html: str) -> Optional[str]:
-        """GeniusのHTMLから歌詞を抽出（簡易版）"""
-        try:
-            # data-lyrics-container を探す
-            pattern = r'<div[^>]*data-lyrics-container[^>]*>(.*?)</div>'
-            matches = re.findall(pattern, html, re.DOTALL)
-            
-            if matches:
-                lyrics = ""
-                for match in matches:
-                    # HTMLタグを削除
-                    text = re.sub(r'<[^>]+>', '\n', match)
-                    lyrics += text
+        # 歌詞ページをスクレイピング（簡易版）
+        async with session.get(song_url) as lyrics_response:
+            if self._found(lyrics_response):
+                # 歌詞コンテナが閉じるまでだけ読んで抽出
+                lyrics = await self._read_lyrics(lyrics_response, GeniusLyricsExtractor())
                 
-                # クリーンアップ
-                lyrics = re.sub(r'\n+', '\n', lyrics)
-                lyrics = lyrics.strip()
-                
-                return lyrics if lyrics else None
-        except Exception as e:
-            logger.error(f"Error extracting Genius lyrics: {e}")
+                if lyrics:
+                    self.api_stats["genius"]["success"] += 1
+                    logger.info("✅ Found lyrics on Genius")
+                    
+                    return {
+                        "lyrics": lyrics,
+                        "source": "genius",
+                        "synced": False,
+                        "plain": lyrics
+                    }
         
+        self.api_stats["genius"]["fail"] += 1
         return None
     
     # ==========================================
@@ -222,64 +528,55 @@ class MultiLyricsAPI:
             logger.debug("Musixmatch API key not set")
             return None
         
-        try:
-            session = await self.get_session()
-            
-            # 曲を検索
-            search_url = "https://api.musixmatch.com/ws/1.1/track.search"
-            params = {
-                "q_track": track_title,
-                "q_artist": artist,
-                "apikey": MUSIXMATCH_API_KEY,
-                "page_size": 1
-            }
+        session = await self.get_session()
+        
+        # 曲を検索
+        search_url = "https://api.musixmatch.com/ws/1.1/track.search"
+        params = {
+            "q_track": track_title,
+            "q_artist": artist,
+            "apikey": MUSIXMATCH_API_KEY,
+            "page_size": 1
+        }
+        
+        async with session.get(search_url, params=params) as response:
+            if not self._found(response):
+                self.api_stats["musixmatch"]["fail"] += 1
+                return None
             
-            async with session.get(search_url, params=params, timeout=10) as response:
-                if response.status != 200:
-                    self.api_stats["musixmatch"]["fail"] += 1
-                    return None
-                
-                data = await response.json()
-                track_list = data.get("message", {}).get("body", {}).get("track_list", [])
-                
-                if not track_list:
-                    self.api_stats["musixmatch"]["fail"] += 1
-                    return None
-                
-                track_id = track_list[0]["track"]["track_id"]
-                
-                # 歌詞を取得
-                lyrics_url = "https://api.musixmatch.com/ws/1.1/track.lyrics.get"
-                params = {
-                    "track_id": track_id,
-                    "apikey": MUSIXMATCH_API_KEY
-                }
-                
-                async with session.get(lyrics_url, params=params, timeout=10) as lyrics_response:
-                    if lyrics_response.status == 200:
-                        lyrics_data = await lyrics_response.json()
-                        lyrics_body = lyrics_data.get("message", {}).get("body", {}).get("lyrics", {}).get("lyrics_body")
-                        
-                        if lyrics_body:
-                            self.api_stats["musixmatch"]["success"] += 1
-                            logger.info("✅ Found lyrics on Musixmatch")
-                            
-                            return {
-                                "lyrics": lyrics_body,
-                                "source": "musixmatch",
-                                "synced": False,
-                                "plain": lyrics_body
-                            }
+            data = await response.json()
+            track_list = data.get("message", {}).get("body", {}).get("track_list", [])
             
-            self.api_stats["musixmatch"]["fail"] += 1
+            if not track_list:
+                self.api_stats["musixmatch"]["fail"] += 1
+                return None
             
-        except asyncio.TimeoutError:
-            logger.warning("⏱️ Musixmatch timeout")
-            self.api_stats["musixmatch"]["fail"] += 1
-        except Exception as e:
-            logger.error(f"❌ Musixmatch error: {e}")
-            self.api_stats["musixmatch"]["fail"] += 1
+            track_id = track_list[0]["track"]["track_id"]
+        
+        # 歌詞を取得
+        lyrics_url = "https://api.musixmatch.com/ws/1.1/track.lyrics.get"
+        params = {
+            "track_id": track_id,
+            "apikey": MUSIXMATCH_API_KEY
+        }
+        
+        async with session.get(lyrics_url, params=params) as lyrics_response:
+            if self._found(lyrics_response):
+                lyrics_data = await lyrics_response.json()
+                lyrics_body = lyrics_data.get("message", {}).get("body", {}).get("lyrics", {}).get("lyrics_body")
+                
+                if lyrics_body:
+                    self.api_stats["musixmatch"]["success"] += 1
+                    logger.info("✅ Found lyrics on Musixmatch")
+                    
+                    return {
+                        "lyrics": lyrics_body,
+                        "source": "musixmatch",
+                        "synced": False,
+                        "plain": lyrics_body
+                    }
         
+        self.api_stats["musixmatch"]["fail"] += 1
         return None
     
     # ==========================================
@@ -287,66 +584,48 @@ class MultiLyricsAPI:
     # ==========================================
     async def _try_azlyrics(self, track_title: str, artist: str) -> Optional[Dict]:
         """AZLyricsから歌詞を取得（スクレイピング）"""
-        try:
-            session = await self.get_session()
-            
-            # URLを生成
-            clean_artist = re.sub(r'[^a-z0-9]', '', artist.lower())
-            clean_title = re.sub(r'[^a-z0-9]', '', track_title.lower())
-            url = f"https://www.azlyrics.com/lyrics/{clean_artist}/{clean_title}.html"
-            
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            }
-            
-            async with session.get(url, headers=headers, timeout=10) as response:
-                if response.status == 200:
-                    html = await response.text()
-                    
-                    # 歌詞を抽出
-                    lyrics = self._extract_azlyrics(html)
-                    
-                    if lyrics:
-                        self.api_stats["azlyrics"]["success"] += 1
-                        logger.info("✅ Found lyrics on AZLyrics")
-                        
-                        return {
-                            "lyrics": lyrics,
-                            "source": "azlyrics",
-                            "synced": False,
-                            "plain": lyrics
-                        }
-            
-            self.api_stats["azlyrics"]["fail"] += 1
-            
-        except asyncio.TimeoutError:
-            logger.warning("⏱️ AZLyrics timeout")
-            self.api_stats["azlyrics"]["fail"] += 1
-        except Exception as e:
-            logger.error(f"❌ AZLyrics error: {e}")
-            self.api_stats["azlyrics"]["fail"] += 1
+        session = await self.get_session()
         
-        return None
-    
-    def _extract_azlyrics(self, html: str) -> Optional[str]:
-        """AZLyricsのHTMLから歌詞を抽出"""
-        try:
-            # 歌詞部分を抽出
-            pattern = r'<!-- Usage of azlyrics.com content.*?-->(.*?)<!-- MxM banner -->'
-            match = re.search(pattern, html, re.DOTALL)
-            
-            if match:
-                lyrics = match.group(1)
-                # HTMLタグを削除
-                lyrics = re.sub(r'<[^>]+>', '', lyrics)
-                lyrics = lyrics.strip()
+        # URLを生成
+        clean_artist = re.sub(r'[^a-z0-9]', '', artist.lower())
+        clean_title = re.sub(r'[^a-z0-9]', '', track_title.lower())
+        url = f"https://www.azlyrics.com/lyrics/{clean_artist}/{clean_title}.html"
+        
+        headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+        }
+        
+        async with session.get(url, headers=headers) as response:
+            if self._found(response):
+                # 歌詞を抽出（歌詞の <div> が閉じたら読むのをやめる）
+                lyrics = await self._read_lyrics(response, AZLyricsExtractor())
                 
-                return lyrics if lyrics else None
-        except Exception as e:
-            logger.error(f"Error extracting AZLyrics: {e}")
+                if lyrics:
+                    self.api_stats["azlyrics"]["success"] += 1
+                    logger.info("✅ Found lyrics on AZLyrics")
+                    
+                    return {
+                        "lyrics": lyrics,
+                        "source": "azlyrics",
+                        "synced": False,
+                        "plain": lyrics
+                    }
         
+        self.api_stats["azlyrics"]["fail"] += 1
         return None
     
+    async def _read_lyrics(self, response, extractor) -> Optional[str]:
+        """レスポンス本文を上限付きで少しずつ読みながら歌詞を抽出"""
+        lyrics, received = await read_lyrics(response, extractor, max_bytes=self.html_max_bytes)
+        self.html_stats["pages"] += 1
+        self.html_stats["bytes_read"] += received
+        if extractor.done:
+            self.html_stats["stopped_early"] += 1
+        elif received >= self.html_max_bytes:
+            self.html_stats["truncated"] += 1
+            logger.warning(f"⚠️ Lyrics page exceeded {self.html_max_bytes} bytes: {response.url}")
+        return lyrics
+    
     # ==========================================
     # 統計情報
     # ==========================================
@@ -360,21 +639,54 @@ class MultiLyricsAPI:
                 "success": counts["success"],
                 "fail": counts["fail"],
                 "total": total,
-                "success_rate": f"{success_rate:.1f}%"
+                "success_rate": f"{success_rate:.1f}%",
+                **self.health[api].get_stats()
             }
         return stats
     
+    def get_lookup_stats(self) -> Dict:
+        """検索全体の統計（同時検索のまとめ込みなど）を取得"""
+        return {**self.lookup_stats, "inflight": len(self._inflight), "html": self.html_stats}
+    
+    def get_cache_stats(self) -> Dict:
+        """キャッシュのヒット・ミス・追い出しの統計を取得"""
+        return self.cache.get_stats() if self.cache else {}
+    
     def print_stats(self):
         """統計情報を表示"""
         logger.info("📊 Lyrics API Statistics:")
         for api, stats in self.get_stats().items():
-            logger.info(f"  {api}: {stats['success']}/{stats['total']} ({stats['success_rate']})")
+            logger.info(
+                f"  {api}: {stats['success']}/{stats['total']} ({stats['success_rate']}), "
+                f"p95={stats['latency_p95_ms']}ms, state={stats['state']}"
+            )
+        logger.info(f"  lookups: {self.get_lookup_stats()}")
+        if self.cache:
+            logger.info(f"  cache: {self.get_cache_stats()}")
 
 
 # ==========================================
 # グローバルインスタンス
 # ==========================================
-lyrics_api = MultiLyricsAPI()
+lyrics_api = MultiLyricsAPI(
+    mode=LYRICS_FETCH_MODE,
+    hedge_delay=LYRICS_HEDGE_DELAY,
+    priority=LYRICS_PROVIDER_PRIORITY,
+    adaptive=LYRICS_ADAPTIVE_ORDER,
+    html_max_bytes=LYRICS_HTML_MAX_BYTES,
+    rate_limits=LYRICS_PROVIDER_RATE_LIMITS,
+    pool_size=LYRICS_HTTP_POOL_SIZE,
+    per_host_limit=LYRICS_HTTP_PER_HOST,
+    keepalive_timeout=LYRICS_HTTP_KEEPALIVE,
+    dns_ttl=LYRICS_HTTP_DNS_TTL,
+    timeout=LYRICS_HTTP_TIMEOUT,
+    cache=LyricsCache(
+        max_bytes=LYRICS_CACHE_MAX_BYTES,
+        ttl=LYRICS_CACHE_TTL,
+        negative_ttl=LYRICS_CACHE_NEGATIVE_TTL,
+        store=SQLiteLyricsStore(LYRICS_CACHE_PATH) if LYRICS_CACHE_PATH else None
+    )
+)
 
 
 # ==========================================
@@ -1,33 +1,23 @@
 """
 Discord Bot - Playlist Manager統合
 プレイリスト機能のSupabase統合
-"""
-
-import os
-from supabase import create_client, Client
-from dotenv import load_dotenv
-
-load_dotenv()
 
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+supabase_client_updated と同じ接続プール（rest）を使う。
+各関数には非同期版（*_async）があり、Botのイベントループをブロックしない。
+同期版は既存コードとの互換性のための薄いラッパー。
+"""
 
-if not supabase_url or not supabase_key:
-    print("⚠️ Supabase credentials not found")
-    supabase = None
-else:
-    supabase: Client = create_client(supabase_url, supabase_key)
-    print("✅ Supabase connected (Playlist Manager)")
+from supabase_client_updated import rest
 
 
 # ==========================================
 # プレイリスト作成
 # ==========================================
-def create_playlist(user_id, user_name, playlist_name, description=None, is_public=False):
+async def create_playlist_async(user_id, user_name, playlist_name, description=None, is_public=False):
     """新しいプレイリストを作成"""
-    if not supabase:
+    if not rest:
         return None
-    
+
     try:
         data = {
             "user_id": user_id,
@@ -36,32 +26,40 @@ def create_playlist(user_id, user_name, playlist_name, description=None, is_publ
             "description": description,
             "is_public": is_public
         }
-        
-        result = supabase.table("playlists").insert(data).execute()
+
+        result = await rest.insert("playlists", data)
         print(f"✅ Playlist created: {playlist_name} by {user_name}")
-        return result.data[0] if result.data else None
-        
+        return result[0] if result else None
+
     except Exception as e:
         print(f"❌ Failed to create playlist: {e}")
         return None
 
 
+def create_playlist(*args, **kwargs):
+    """新しいプレイリストを作成（同期版）"""
+    if not rest:
+        return None
+    return rest.run_sync(create_playlist_async(*args, **kwargs))
+
+
 # ==========================================
 # プレイリストに曲を追加
 # ==========================================
-def add_track_to_playlist(
+async def add_track_to_playlist_async(
     playlist_id,
     track_title,
     track_url,
     added_by,
     added_by_id,
     duration_ms=0,
-    position=0
+    position=0,
+    artist=None
 ):
     """プレイリストに曲を追加"""
-    if not supabase:
+    if not rest:
         return None
-    
+
     try:
         data = {
             "playlist_id": playlist_id,
@@ -70,159 +68,187 @@ def add_track_to_playlist(
             "added_by": added_by,
             "added_by_id": added_by_id,
             "duration_ms": duration_ms,
-            "position": position
+            "position": position,
+            "artist": artist
         }
-        
-        result = supabase.table("playlist_tracks").insert(data).execute()
+
+        result = await rest.insert("playlist_tracks", data)
         print(f"✅ Track added to playlist: {track_title}")
-        return result.data[0] if result.data else None
-        
+        return result[0] if result else None
+
     except Exception as e:
         print(f"❌ Failed to add track: {e}")
         return None
 
 
+def add_track_to_playlist(*args, **kwargs):
+    """プレイリストに曲を追加（同期版）"""
+    if not rest:
+        return None
+    return rest.run_sync(add_track_to_playlist_async(*args, **kwargs))
+
+
 # ==========================================
 # ユーザーのプレイリストを取得
 # ==========================================
-def get_user_playlists(user_id):
+async def get_user_playlists_async(user_id):
     """ユーザーのプレイリスト一覧を取得"""
-    if not supabase:
+    if not rest:
         return []
-    
+
     try:
-        result = supabase.table("playlists")\
-            .select("*")\
-            .eq("user_id", user_id)\
-            .order("recorded_at", desc=True)\
-            .execute()
-        
-        return result.data if result.data else []
-        
+        return await rest.select("playlists", {
+            "user_id": f"eq.{user_id}",
+            "order": "recorded_at.desc"
+        })
+
     except Exception as e:
         print(f"❌ Failed to get playlists: {e}")
         return []
 
 
+def get_user_playlists(user_id):
+    """ユーザーのプレイリスト一覧を取得（同期版）"""
+    if not rest:
+        return []
+    return rest.run_sync(get_user_playlists_async(user_id))
+
+
 # ==========================================
 # プレイリストの曲を取得
 # ==========================================
-def get_playlist_tracks(playlist_id):
+async def get_playlist_tracks_async(playlist_id):
     """プレイリストの曲一覧を取得"""
-    if not supabase:
+    if not rest:
         return []
-    
+
     try:
-        result = supabase.table("playlist_tracks")\
-            .select("*")\
-            .eq("playlist_id", playlist_id)\
-            .order("position", desc=False)\
-            .execute()
-        
-        return result.data if result.data else []
-        
+        return await rest.select("playlist_tracks", {
+            "playlist_id": f"eq.{playlist_id}",
+            "order": "position.asc"
+        })
+
     except Exception as e:
         print(f"❌ Failed to get tracks: {e}")
         return []
 
 
+def get_playlist_tracks(playlist_id):
+    """プレイリストの曲一覧を取得（同期版）"""
+    if not rest:
+        return []
+    return rest.run_sync(get_playlist_tracks_async(playlist_id))
+
+
 # ==========================================
 # プレイリストを削除
 # ==========================================
-def delete_playlist(playlist_id):
+async def delete_playlist_async(playlist_id):
     """プレイリストを削除（曲も全て削除される）"""
-    if not supabase:
+    if not rest:
         return False
-    
+
     try:
-        result = supabase.table("playlists")\
-            .delete()\
-            .eq("id", playlist_id)\
-            .execute()
-        
+        await rest.delete("playlists", {"id": f"eq.{playlist_id}"})
         print(f"✅ Playlist deleted: {playlist_id}")
         return True
-        
+
     except Exception as e:
         print(f"❌ Failed to delete playlist: {e}")
         return False
 
 
+def delete_playlist(playlist_id):
+    """プレイリストを削除（同期版）"""
+    if not rest:
+        return False
+    return rest.run_sync(delete_playlist_async(playlist_id))
+
+
 # ==========================================
 # 曲を削除
 # ==========================================
-def delete_track(track_id):
+async def delete_track_async(track_id):
     """プレイリストから曲を削除"""
-    if not supabase:
+    if not rest:
         return False
-    
+
     try:
-        result = supabase.table("playlist_tracks")\
-            .delete()\
-            .eq("id", track_id)\
-            .execute()
-        
+        await rest.delete("playlist_tracks", {"id": f"eq.{track_id}"})
         print(f"✅ Track deleted: {track_id}")
         return True
-        
+
     except Exception as e:
         print(f"❌ Failed to delete track: {e}")
         return False
 
 
+def delete_track(track_id):
+    """プレイリストから曲を削除（同期版）"""
+    if not rest:
+        return False
+    return rest.run_sync(delete_track_async(track_id))
+
+
 # ==========================================
 # プレイリスト名を更新
 # ==========================================
-def update_playlist_name(playlist_id, new_name):
+async def update_playlist_name_async(playlist_id, new_name):
     """プレイリスト名を変更"""
-    if not supabase:
+    if not rest:
         return False
-    
+
     try:
-        result = supabase.table("playlists")\
-            .update({"playlist_name": new_name})\
-            .eq("id", playlist_id)\
-            .execute()
-        
+        await rest.update("playlists", {"playlist_name": new_name}, {"id": f"eq.{playlist_id}"})
         print(f"✅ Playlist name updated: {new_name}")
         return True
-        
+
     except Exception as e:
         print(f"❌ Failed to update playlist name: {e}")
         return False
 
 
+def update_playlist_name(playlist_id, new_name):
+    """プレイリスト名を変更（同期版）"""
+    if not rest:
+        return False
+    return rest.run_sync(update_playlist_name_async(playlist_id, new_name))
+
+
 # ==========================================
 # 曲名を更新
 # ==========================================
-def update_track_title(track_id, new_title):
+async def update_track_title_async(track_id, new_title):
     """曲名を変更"""
-    if not supabase:
+    if not rest:
         return False
-    
+
     try:
-        result = supabase.table("playlist_tracks")\
-            .update({"track_title": new_title})\
-            .eq("id", track_id)\
-            .execute()
-        
+        await rest.update("playlist_tracks", {"track_title": new_title}, {"id": f"eq.{track_id}"})
         print(f"✅ Track title updated: {new_title}")
         return True
-        
+
     except Exception as e:
         print(f"❌ Failed to update track title: {e}")
         return False
 
 
+def update_track_title(track_id, new_title):
+    """曲名を変更（同期版）"""
+    if not rest:
+        return False
+    return rest.run_sync(update_track_title_async(track_id, new_title))
+
+
 # ==========================================
 # テスト関数
 # ==========================================
 def test_playlist_manager():
     """Playlist Manager機能をテスト"""
-    if not supabase:
+    if not rest:
         print("❌ Supabase not connected")
         return False
-    
+
     try:
         # プレイリストを作成
         playlist = create_playlist(
@@ -232,14 +258,14 @@ def test_playlist_manager():
             description="This is a test playlist",
             is_public=False
         )
-        
+
         if not playlist:
             print("❌ Failed to create playlist")
             return False
-        
+
         playlist_id = playlist["id"]
         print(f"✅ Created playlist: {playlist_id}")
-        
+
         # 曲を追加
         track = add_track_to_playlist(
             playlist_id=playlist_id,
@@ -250,24 +276,24 @@ def test_playlist_manager():
             duration_ms=180000,
             position=0
         )
-        
+
         if not track:
             print("❌ Failed to add track")
             return False
-        
+
         print(f"✅ Added track: {track['id']}")
-        
+
         # プレイリストを取得
         playlists = get_user_playlists("test_user_123")
         print(f"✅ Found {len(playlists)} playlists")
-        
+
         # 曲を取得
         tracks = get_playlist_tracks(playlist_id)
         print(f"✅ Found {len(tracks)} tracks")
-        
+
         print("✅ Playlist Manager test successful!")
         return True
-        
+
     except Exception as e:
         print(f"❌ Playlist Manager test error: {e}")
         return False
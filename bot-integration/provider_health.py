@@ -0,0 +1,137 @@
+"""
+歌詞プロバイダーの健全性
+プロバイダーごとの応答時間ヒストグラムと直近の成功率から「成功までの期待時間」を求め、
+失敗が続くプロバイダーはサーキットブレーカーで一定時間呼ばないようにする
+"""
+
+import time
+from collections import deque
+from typing import Dict
+
+from metrics import Histogram
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderHealth:
+    """1プロバイダー分の統計とサーキットブレーカー
+
+    - closed: 通常どおり呼ぶ。連続 failure_threshold 回失敗すると open
+      （失敗はタイムアウト・HTTPエラー・例外のみ。「歌詞なし」の応答は正常な応答として連続失敗をリセットする）
+    - open: open_seconds の間は呼ばない
+    - half_open: 1件だけ試しに呼び（プローブ）、成功なら closed、失敗なら再び open
+      （再度 open になるたびに待ち時間を倍にする。上限 max_open_seconds）
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 50,
+        failure_threshold: int = 5,
+        open_seconds: float = 30.0,
+        max_open_seconds: float = 600.0
+    ):
+        """
+        Args:
+            window: 成功率を計算する直近の試行数
+            failure_threshold: open にする連続失敗回数
+            open_seconds: open にしてから最初のプローブまでの秒数
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+
+        self.latency_ms = Histogram()
+        # 直近の (成功したか, 応答時間ms)
+        self._outcomes: deque = deque(maxlen=window)
+        self._consecutive_failures = 0
+        self.state = CLOSED
+        self._open_seconds = open_seconds
+        self._opened_at = 0.0
+        self._probing = False
+
+        self.stats = {"opened": 0, "short_circuited": 0, "probes": 0}
+
+    # ==========================================
+    # サーキットブレーカー
+    # ==========================================
+    def available(self) -> bool:
+        """呼び出せる状態か（状態は変えない）"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return time.monotonic() - self._opened_at >= self._open_seconds
+        return not self._probing
+
+    def allow(self) -> bool:
+        """呼び出す直前に確認する。half_open ではプローブを1件だけ通す"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self._open_seconds:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            self.stats["probes"] += 1
+            return True
+        self.stats["short_circuited"] += 1
+        return False
+
+    def record(self, found: bool, latency_ms: float):
+        """正常な応答を記録（found=False は「歌詞なし」。成功率には含めるが失敗には数えない）"""
+        self._outcomes.append((found, latency_ms))
+        self.latency_ms.observe(latency_ms)
+        self._consecutive_failures = 0
+        if self.state != CLOSED:
+            self.state = CLOSED
+            self._open_seconds = self.base_open_seconds
+        self._probing = False
+
+    def record_failure(self, latency_ms: float):
+        """タイムアウト・HTTPエラー・例外を記録"""
+        self._outcomes.append((False, latency_ms))
+        self._consecutive_failures += 1
+        if self.state == HALF_OPEN:
+            self._open(backoff=True)
+        elif self.state == CLOSED and self._consecutive_failures >= self.failure_threshold:
+            self._open(backoff=False)
+        self._probing = False
+
+    def cancelled(self):
+        """結果が出る前にキャンセルされた（成功・失敗のどちらにも数えない）"""
+        self._probing = False
+
+    def _open(self, backoff: bool):
+        if backoff:
+            self._open_seconds = min(self.max_open_seconds, self._open_seconds * 2)
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.stats["opened"] += 1
+
+    # ==========================================
+    # 期待時間
+    # ==========================================
+    @property
+    def success_rate(self) -> float:
+        """直近の成功率（試行が少ないうちは 0.5 に寄せる）"""
+        successes = sum(1 for found, _ in self._outcomes if found)
+        return (successes + 1) / (len(self._outcomes) + 2)
+
+    def expected_time_ms(self, default_latency_ms: float = 1000.0) -> float:
+        """成功するまでの期待時間（直近の成功時の平均応答時間 / 成功率）"""
+        latencies = [latency for found, latency in self._outcomes if found]
+        latency = (sum(latencies) / len(latencies)) if latencies else default_latency_ms
+        return latency / self.success_rate
+
+    def get_stats(self) -> Dict:
+        latency = self.latency_ms.snapshot()
+        return {
+            **self.stats,
+            "state": self.state,
+            "recent_success_rate": f"{self.success_rate * 100:.1f}%",
+            "latency_p50_ms": round(latency["p50"]) if latency["p50"] is not None else None,
+            "latency_p95_ms": round(latency["p95"]) if latency["p95"] is not None else None,
+            "expected_time_ms": round(self.expected_time_ms())
+        }
@@ -0,0 +1,199 @@
+"""
+Gemini利用量のトークンバケット制限
+ユーザーごと・ギルドごとに「ウィンドウあたりのモデルトークン数」で上限を設け、
+モデルを呼ぶ前に拒否または待機させる
+"""
+
+import asyncio
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の概算（UTF-8で約4バイト = 1トークン）"""
+    return len(text.encode("utf-8")) // 4 + 1
+
+
+class RateLimitExceeded(Exception):
+    """上限に達しており、許容できる待ち時間内に空かない"""
+
+    def __init__(self, scope: str, retry_after: float):
+        self.scope = scope
+        self.retry_after = retry_after
+        super().__init__(f"{scope} rate limit exceeded, retry after {retry_after:.0f}s")
+
+
+class TokenBucket:
+    """容量 capacity、毎秒 rate ずつ回復するバケット（残量は負になりうる＝借り越し）"""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float, tokens: Optional[float] = None):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity if tokens is None else tokens
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def wait_time(self, cost: float) -> float:
+        """cost を払えるようになるまでの秒数（refill 済みで呼ぶ）"""
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+
+class Reservation:
+    """acquire() で確保したトークン。完了後に実際の使用量で精算する"""
+
+    __slots__ = ("keys", "costs")
+
+    def __init__(self, keys: Tuple, costs: Tuple):
+        self.keys = keys
+        self.costs = costs
+
+
+class GeminiRateLimiter:
+    """ユーザー・ギルド単位のトークンバケット制限
+
+    満タンに戻ったバケットは状態を持つ必要がないので削除する。保持するのは
+    直近のウィンドウ内に使用したユーザー・ギルドの分だけになる。
+
+    待機する場合は先にトークンを差し引いてから待つため、後から来たリクエストほど
+    長く待つことになり、到着順が保たれる。
+    """
+
+    def __init__(
+        self,
+        user_limit: int = 20000,
+        guild_limit: int = 200000,
+        window_seconds: float = 3600.0,
+        max_wait: float = 0.0,
+        prune_interval: float = 60.0
+    ):
+        """
+        Args:
+            user_limit: 1ユーザーがウィンドウあたりに使えるトークン数
+            guild_limit: 1ギルドがウィンドウあたりに使えるトークン数
+            window_seconds: ウィンドウの長さ（秒）。この時間で満タンまで回復する
+            max_wait: これ以内に空くなら待機し、超えるなら拒否する（秒、0 なら待たない）
+            prune_interval: 満タンのバケットを掃除する間隔（秒）
+        """
+        self.limits = {"user": user_limit, "guild": guild_limit}
+        self.window_seconds = window_seconds
+        self.max_wait = max_wait
+        self.prune_interval = prune_interval
+
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._last_prune = time.monotonic()
+        self.seeded = False
+
+        self.stats = {"allowed": 0, "queued": 0, "rejected": 0, "pruned": 0}
+
+    # ==========================================
+    # バケット管理
+    # ==========================================
+    def _bucket(self, key: Tuple[str, str], now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            limit = self.limits[key[0]]
+            bucket = self._buckets[key] = TokenBucket(limit, limit / self.window_seconds)
+        bucket.refill(now)
+        return bucket
+
+    def _prune(self, now: float):
+        if now - self._last_prune < self.prune_interval:
+            return
+        self._last_prune = now
+        full = [k for k, b in self._buckets.items() if b.refill(now) >= b.capacity]
+        for key in full:
+            del self._buckets[key]
+        self.stats["pruned"] += len(full)
+
+    def seed(self, usage: Iterable[Tuple[str, str, float, int]]):
+        """起動時に直近ウィンドウ内の使用量を再生して残量を復元する
+
+        Args:
+            usage: (scope, id, UNIX時刻, total_tokens) の列（時刻順）。
+                scope は "user" または "guild"
+        """
+        wall_now = time.time()
+        window_start = wall_now - self.window_seconds
+        # (scope, id) -> [残量, 最後に反映した時刻]
+        replay: Dict[Tuple[str, str], list] = {}
+        for scope, scope_id, timestamp, total_tokens in usage:
+            if scope not in self.limits or not total_tokens or timestamp < window_start:
+                continue
+            key = (scope, str(scope_id))
+            limit = self.limits[scope]
+            state = replay.setdefault(key, [limit, window_start])
+            state[0] = min(limit, state[0] + (timestamp - state[1]) * limit / self.window_seconds)
+            state[0] -= total_tokens
+            state[1] = timestamp
+
+        now = time.monotonic()
+        for key, (tokens, last) in replay.items():
+            bucket = self._bucket(key, now)
+            recovered = (wall_now - last) * bucket.rate
+            bucket.tokens = max(-bucket.capacity, min(bucket.capacity, tokens + recovered))
+        self.seeded = True
+
+    # ==========================================
+    # 確保・精算
+    # ==========================================
+    async def acquire(self, user_id, guild_id, estimated_tokens: int) -> Reservation:
+        """モデルを呼ぶ前にトークンを確保（必要なら max_wait まで待つ）
+
+        Raises:
+            RateLimitExceeded: max_wait 以内に確保できない場合
+        """
+        now = time.monotonic()
+        self._prune(now)
+
+        keys = (("user", str(user_id)), ("guild", str(guild_id)))
+        buckets = [self._bucket(key, now) for key in keys]
+        # 1回でバケット容量を超える要求は容量に切り詰める（永久に通らなくなるのを防ぐ）
+        costs = [min(estimated_tokens, b.capacity) for b in buckets]
+
+        wait = 0.0
+        for key, bucket, cost in zip(keys, buckets, costs):
+            bucket_wait = bucket.wait_time(cost)
+            if bucket_wait > self.max_wait:
+                self.stats["rejected"] += 1
+                raise RateLimitExceeded(key[0], bucket_wait)
+            wait = max(wait, bucket_wait)
+
+        for bucket, cost in zip(buckets, costs):
+            bucket.tokens -= cost
+
+        reservation = Reservation(keys, tuple(costs))
+        if wait > 0:
+            self.stats["queued"] += 1
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # 待っている間にキャンセルされたら確保した分を返す
+                self.settle(reservation, 0)
+                raise
+        self.stats["allowed"] += 1
+        return reservation
+
+    def settle(self, reservation: Reservation, actual_tokens: int):
+        """実際の使用量との差分を反映（少なければ返却、多ければ追加で差し引く）"""
+        now = time.monotonic()
+        for key, cost in zip(reservation.keys, reservation.costs):
+            bucket = self._bucket(key, now)
+            bucket.tokens = max(-bucket.capacity, min(bucket.capacity, bucket.tokens + cost - actual_tokens))
+
+    # ==========================================
+    # 統計情報
+    # ==========================================
+    def remaining(self, scope: str, scope_id) -> float:
+        bucket = self._buckets.get((scope, str(scope_id)))
+        if bucket is None:
+            return float(self.limits[scope])
+        return bucket.refill(time.monotonic())
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, "tracked_buckets": len(self._buckets)}
@@ -0,0 +1,110 @@
+"""
+Gemini応答キャッシュ
+正規化した質問・モデル・生成設定をキーに、メモリ上のLRU（TTL付き）と
+任意のSQLite永続層で応答を保持する（2層キャッシュ本体は tiered_cache）
+"""
+
+import hashlib
+import json
+import re
+import unicodedata
+from typing import Dict, Iterable, Optional
+
+from tiered_cache import SQLiteStore, TieredCache
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?？!！。.、,]+$")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """キャッシュキー用に質問を正規化（全角半角・大小文字・空白・末尾の記号を揃える）"""
+    text = unicodedata.normalize("NFKC", prompt).casefold()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+def cache_key(prompt: str, model: str, settings: Optional[Dict] = None) -> str:
+    """正規化した質問 + モデル + 生成設定のハッシュ"""
+    material = json.dumps(
+        [normalize_prompt(prompt), model, settings or {}],
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class SQLiteResponseStore(SQLiteStore):
+    """応答キャッシュの永続層（再起動後もヒットさせる）"""
+
+    def __init__(self, path: str):
+        super().__init__(path, table="response_cache")
+
+
+class ResponseCache:
+    """2層（メモリLRU → 永続層）の応答キャッシュ
+
+    キャッシュ本体は TieredCache。ここでは質問の正規化とギルドごとのオプトアウトを扱う。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl: float = 3600.0,
+        store: Optional[SQLiteResponseStore] = None,
+        disabled_guilds: Iterable[str] = ()
+    ):
+        """
+        Args:
+            max_entries: メモリ層の最大件数（超過時は最も古く使われたものから破棄）
+            ttl: 応答の有効期間（秒）
+            store: 永続層（None ならメモリのみ）
+            disabled_guilds: キャッシュを使わないギルドID
+        """
+        self.ttl = ttl
+        self._cache = TieredCache(max_entries=max_entries, store=store, label="Response cache")
+        self._disabled_guilds = {str(g) for g in disabled_guilds}
+        self.stats = {"bypassed": 0}
+
+    # ==========================================
+    # ギルドごとの設定
+    # ==========================================
+    def is_enabled(self, guild_id) -> bool:
+        return str(guild_id) not in self._disabled_guilds
+
+    def set_enabled(self, guild_id, enabled: bool):
+        """ギルドのキャッシュ利用を切り替える（オプトアウト）"""
+        if enabled:
+            self._disabled_guilds.discard(str(guild_id))
+        else:
+            self._disabled_guilds.add(str(guild_id))
+
+    # ==========================================
+    # 参照・保存
+    # ==========================================
+    async def get(self, guild_id, prompt: str, model: str, settings: Optional[Dict] = None) -> Optional[str]:
+        """キャッシュされた応答を返す。無効なギルドやミスなら None"""
+        if not self.is_enabled(guild_id):
+            self.stats["bypassed"] += 1
+            return None
+        _, response = await self._cache.get(cache_key(prompt, model, settings))
+        return response
+
+    async def put(self, guild_id, prompt: str, model: str, response: str, settings: Optional[Dict] = None):
+        """応答を保存（無効なギルドでは何もしない）"""
+        if not self.is_enabled(guild_id) or not response:
+            return
+        await self._cache.put(cache_key(prompt, model, settings), response, self.ttl)
+
+    def clear(self):
+        self._cache.clear()
+
+    # ==========================================
+    # 統計情報
+    # ==========================================
+    def get_stats(self) -> Dict:
+        return {
+            **self._cache.get_stats(),
+            **self.stats,
+            "hit_rate": self._cache.hit_rate,
+            "disabled_guilds": len(self._disabled_guilds)
+        }
@@ -0,0 +1,198 @@
+"""
+ギルドごとの再生セッション管理
+ボイス状態・再生・一時停止・曲の終了・停止イベントから状態を更新し、変更のあったギルドだけを通知する。
+変化の無いセッションも heartbeat 秒ごとに通知する（生存確認）
+"""
+
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+
+class GuildSession:
+    """1ギルド分の再生状態"""
+
+    __slots__ = (
+        "guild_id",
+        "channel_id",
+        "track_title",
+        "duration_ms",
+        "is_playing",
+        "voice_members_count",
+        "_position_base_ms",
+        "_position_at"
+    )
+
+    def __init__(self, guild_id: str, channel_id: Optional[int] = None):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.track_title: Optional[str] = None
+        self.duration_ms = 0
+        self.is_playing = False
+        self.voice_members_count = 0
+        self._position_base_ms = 0
+        self._position_at = time.monotonic()
+
+    @property
+    def position_ms(self) -> int:
+        """現在の再生位置（再生中は経過時間から計算）"""
+        position = self._position_base_ms
+        if self.is_playing:
+            position += int((time.monotonic() - self._position_at) * 1000)
+        if self.duration_ms:
+            position = min(position, self.duration_ms)
+        return position
+
+    def seek(self, position_ms: int):
+        """再生位置を設定"""
+        self._position_base_ms = position_ms
+        self._position_at = time.monotonic()
+
+    def to_fields(self) -> Dict:
+        """active_sessions の列に対応する辞書"""
+        return {
+            "track_title": self.track_title,
+            "position_ms": self.position_ms,
+            "duration_ms": self.duration_ms,
+            "is_playing": self.is_playing,
+            "voice_members_count": self.voice_members_count
+        }
+
+
+class SessionRegistry:
+    """イベント駆動でギルドの再生セッションを管理するレジストリ
+
+    ボイスチャンネルの人数はボイス状態の変化ごとに増減させるため、
+    定期的にメンバー一覧を走査する必要がない。
+    生存確認の対象も通知した順に並べて持つので、期限の来たものだけを先頭から取り出す。
+    """
+
+    def __init__(self, is_listener: Optional[Callable] = None, heartbeat: float = 30.0):
+        """
+        Args:
+            is_listener: メンバーを人数に数えるか判定する関数（既定: Bot以外）
+            heartbeat: 変化が無くてもセッションを通知する間隔（秒）
+        """
+        self.is_listener = is_listener or (lambda member: not member.bot)
+        self.heartbeat = heartbeat
+        self._sessions: Dict[str, GuildSession] = {}
+        # channel_id -> guild_id（ボイス状態イベントの照合用）
+        self._channels: Dict[int, str] = {}
+        self._dirty: set = set()
+        # guild_id -> 最後に通知した時刻（古い順）
+        self._reported_at: "OrderedDict[str, float]" = OrderedDict()
+
+    # ==========================================
+    # 再生イベント
+    # ==========================================
+    def start(self, guild_id: str, channel, track_title: str, duration_ms: int = 0):
+        """曲の再生開始（チャンネルの人数はここで1回だけ数える）"""
+        session = self._sessions.get(guild_id)
+        if session is None:
+            session = self._sessions[guild_id] = GuildSession(guild_id)
+
+        if session.channel_id != channel.id:
+            self._move(session, channel)
+
+        session.track_title = track_title
+        session.duration_ms = duration_ms
+        session.is_playing = True
+        session.seek(0)
+        self._dirty.add(guild_id)
+
+    def pause(self, guild_id: str):
+        """一時停止"""
+        session = self._sessions.get(guild_id)
+        if session and session.is_playing:
+            session.seek(session.position_ms)
+            session.is_playing = False
+            self._dirty.add(guild_id)
+
+    def resume(self, guild_id: str):
+        """再開"""
+        session = self._sessions.get(guild_id)
+        if session and not session.is_playing:
+            session.seek(session.position_ms)
+            session.is_playing = True
+            self._dirty.add(guild_id)
+
+    def end_track(self, guild_id: str):
+        """曲の再生終了（次の曲の start() か stop() までは曲なしの状態）"""
+        session = self._sessions.get(guild_id)
+        if session and session.track_title is not None:
+            session.track_title = None
+            session.duration_ms = 0
+            session.is_playing = False
+            session.seek(0)
+            self._dirty.add(guild_id)
+
+    def stop(self, guild_id: str) -> Optional[GuildSession]:
+        """再生停止（セッションを破棄）"""
+        session = self._sessions.pop(guild_id, None)
+        self._dirty.discard(guild_id)
+        self._reported_at.pop(guild_id, None)
+        if session and session.channel_id is not None:
+            self._channels.pop(session.channel_id, None)
+        return session
+
+    def _move(self, session: GuildSession, channel):
+        """Botが別のチャンネルに移動したときに人数を数え直す"""
+        if session.channel_id is not None:
+            self._channels.pop(session.channel_id, None)
+        session.channel_id = channel.id
+        self._channels[channel.id] = session.guild_id
+        session.voice_members_count = sum(1 for m in channel.members if self.is_listener(m))
+
+    # ==========================================
+    # ボイス状態イベント
+    # ==========================================
+    def on_voice_state_update(self, member, before, after):
+        """on_voice_state_update から呼ぶ。セッションのあるチャンネルの人数を増減"""
+        before_id = before.channel.id if before.channel else None
+        after_id = after.channel.id if after.channel else None
+        if before_id == after_id or not self.is_listener(member):
+            return
+
+        for channel_id, delta in ((before_id, -1), (after_id, 1)):
+            guild_id = self._channels.get(channel_id)
+            if guild_id is None:
+                continue
+            session = self._sessions[guild_id]
+            session.voice_members_count = max(0, session.voice_members_count + delta)
+            self._dirty.add(guild_id)
+
+    def on_bot_moved(self, guild_id: str, channel):
+        """Bot自身のボイスチャンネルが変わったとき（channel=None なら切断）"""
+        session = self._sessions.get(guild_id)
+        if session is None:
+            return
+        if channel is None:
+            self.stop(guild_id)
+            return
+        self._move(session, channel)
+        self._dirty.add(guild_id)
+
+    # ==========================================
+    # 参照
+    # ==========================================
+    def get(self, guild_id: str) -> Optional[GuildSession]:
+        return self._sessions.get(guild_id)
+
+    def pop_dirty(self) -> List[GuildSession]:
+        """前回以降に状態が変わったセッションと、heartbeat 秒以上通知していないセッションを取り出す"""
+        now = time.monotonic()
+        due = set(self._dirty)
+        for guild_id, reported_at in self._reported_at.items():
+            if now - reported_at < self.heartbeat:
+                break
+            due.add(guild_id)
+        self._dirty.clear()
+
+        sessions = [self._sessions[g] for g in due if g in self._sessions]
+        for session in sessions:
+            self._reported_at.pop(session.guild_id, None)
+            self._reported_at[session.guild_id] = now
+        return sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
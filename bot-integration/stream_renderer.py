@@ -0,0 +1,190 @@
+"""
+ストリーミング応答のDiscordメッセージ描画
+生成途中のテキストを1つのメッセージへ編集で反映する。編集はレート制限に合わせてまとめ、
+2000文字を超えた分は区切りの良い位置で次のメッセージに送る
+"""
+
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+DISCORD_MESSAGE_LIMIT = 2000
+CODE_FENCE = "```"
+
+
+def split_text(text: str, limit: int = DISCORD_MESSAGE_LIMIT) -> Tuple[str, str]:
+    """limit 文字以内の先頭部分と残りに分ける
+
+    改行 → 空白 → 強制の順で区切り位置を探す。コードブロックの途中で切る場合は
+    先頭部分でブロックを閉じ、残りで開き直す。
+    """
+    if len(text) <= limit:
+        return text, ""
+
+    # コードブロックを閉じる分の余裕を残す
+    budget = limit - len(CODE_FENCE) - 1
+    cut = text.rfind("\n", 0, budget)
+    if cut < budget // 2:
+        cut = text.rfind(" ", 0, budget)
+    if cut < budget // 2:
+        cut = budget
+
+    head, tail = text[:cut].rstrip(), text[cut:].lstrip("\n ")
+    if head.count(CODE_FENCE) % 2 == 1:
+        head += "\n" + CODE_FENCE
+        tail = CODE_FENCE + "\n" + tail
+    return head, tail
+
+
+def split_message(text: str, limit: int = DISCORD_MESSAGE_LIMIT) -> List[str]:
+    """テキストを limit 文字以内のメッセージに分割"""
+    parts = []
+    while len(text) > limit:
+        head, text = split_text(text, limit)
+        parts.append(head)
+    if text or not parts:
+        parts.append(text)
+    return parts
+
+
+class StreamingMessage:
+    """ストリーミングされるテキストをメッセージ編集で少しずつ表示する
+
+    append() は編集間隔が空いていればすぐに編集し、そうでなければ次の編集を
+    1回だけ予約する。予約中に届いたチャンクはその1回の編集にまとめられる。
+    """
+
+    def __init__(
+        self,
+        message,
+        send_fn: Callable[[str], Awaitable],
+        prefix: str = "",
+        min_edit_interval: float = 1.0,
+        limit: int = DISCORD_MESSAGE_LIMIT,
+        cursor: str = " ▌"
+    ):
+        """
+        Args:
+            message: 編集対象の最初のメッセージ（「考え中...」など）
+            send_fn: 溢れた分を新しいメッセージとして送る関数（例: ctx.send）
+            prefix: 最初のメッセージの先頭に付ける文字列
+            min_edit_interval: 同じメッセージを編集する最小間隔（秒）
+            limit: 1メッセージの最大文字数
+            cursor: 生成中に末尾へ表示する記号
+        """
+        self.send_fn = send_fn
+        self.min_edit_interval = min_edit_interval
+        self.limit = limit
+        self.cursor = cursor
+
+        self.messages = [message]
+        self._chunks: List[str] = []
+        self._text = prefix
+        self._rendered = None
+        self._last_edit = 0.0
+        self._scheduled: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._finished = False
+
+        self.stats = {"chunks": 0, "edits": 0, "messages": 1}
+
+    @property
+    def text(self) -> str:
+        """これまでに受け取った応答全体（prefix を除く）"""
+        return "".join(self._chunks)
+
+    @property
+    def finished(self) -> bool:
+        """finish() または abort() が呼ばれたか"""
+        return self._finished
+
+    # ==========================================
+    # 受信
+    # ==========================================
+    async def append(self, chunk: str):
+        """生成されたチャンクを追加"""
+        if not chunk or self._finished:
+            return
+        self._chunks.append(chunk)
+        self._text += chunk
+        self.stats["chunks"] += 1
+
+        if len(self._text) + len(self.cursor) > self.limit:
+            async with self._lock:
+                await self._roll_over()
+
+        loop = asyncio.get_running_loop()
+        wait = self._last_edit + self.min_edit_interval - loop.time()
+        if wait <= 0:
+            await self._render()
+        elif self._scheduled is None:
+            self._scheduled = asyncio.create_task(self._render_later(wait))
+
+    async def finish(self) -> str:
+        """最後の編集を行い（カーソルを消す）、応答全体を返す"""
+        self._finished = True
+        if self._scheduled is not None:
+            self._scheduled.cancel()
+            self._scheduled = None
+        async with self._lock:
+            await self._roll_over()
+            await self._edit(self._text if self._chunks else "（応答がありません）")
+        return self.text
+
+    async def abort(self, notice: str) -> str:
+        """生成が途中で失敗したときに finish() の代わりに呼ぶ
+
+        カーソルを消し、受け取った分の後ろに notice を表示する（何も受け取っていなければ notice だけ）。
+        """
+        self._finished = True
+        if self._scheduled is not None:
+            self._scheduled.cancel()
+            self._scheduled = None
+        async with self._lock:
+            self._text = f"{self._text}\n{notice}" if self._chunks else notice
+            await self._roll_over()
+            await self._edit(self._text)
+        return self.text
+
+    # ==========================================
+    # 描画
+    # ==========================================
+    async def _render_later(self, delay: float):
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            return
+        self._scheduled = None
+        await self._render()
+
+    async def _render(self):
+        async with self._lock:
+            if self._finished:
+                return
+            await self._edit(self._text + self.cursor)
+
+    async def _edit(self, content: str):
+        """現在のメッセージを編集（内容が変わっていなければ何もしない）"""
+        if content == self._rendered:
+            return
+        await self.messages[-1].edit(content=content)
+        self._rendered = content
+        self._last_edit = asyncio.get_running_loop().time()
+        self.stats["edits"] += 1
+
+    async def _roll_over(self):
+        """上限を超えた分を確定させ、続きを新しいメッセージに移す（ロック取得済みで呼ぶ）"""
+        reserve = 0 if self._finished else len(self.cursor)
+        while len(self._text) + reserve > self.limit:
+            head, tail = split_text(self._text, self.limit - reserve)
+            await self._edit(head)
+            if not tail:
+                self._text = head
+                break
+            self._text = tail
+            # 新しいメッセージには上限に収まる先頭部分だけを送る（残りは次の周回で編集・送信する）
+            first, rest = split_text(tail, self.limit - reserve)
+            content = first + ("" if rest or self._finished else self.cursor)
+            self.messages.append(await self.send_fn(content or "…"))
+            self._rendered = content or "…"
+            self._last_edit = asyncio.get_running_loop().time()
+            self.stats["messages"] += 1
@@ -1,11 +1,13 @@
 """
 Supabase Client for Discord Bot Dashboard
 ダッシュボードのスキーマに完全対応
+
+同期関数だけの最小構成（anon キーを使用）。Botには supabase_client_updated（非同期版・一括送信）を推奨
 """
 
 import os
-from supabase import create_client, Client
 from dotenv import load_dotenv
+from supabase_rest import SupabaseREST
 
 load_dotenv()
 
@@ -16,12 +18,9 @@ if not supabase_url or not supabase_key:
     print("⚠️ Warning: Supabase credentials not found in .env")
     supabase = None
 else:
-    try:
-        supabase: Client = create_client(supabase_url, supabase_key)
-        print("✅ Supabase client initialized")
-    except Exception as e:
-        print(f"❌ Failed to initialize Supabase client: {e}")
-        supabase = None
+    # 接続は最初のリクエスト時に開く
+    supabase = SupabaseREST(supabase_url, supabase_key)
+    print("✅ Supabase client initialized")
 
 
 # ==========================================
@@ -41,7 +40,7 @@ def send_system_stats(cpu_usage, ram_rss, ram_heap, ping_gateway, ping_lavalink=
             "ping_lavalink": int(ping_lavalink) if ping_lavalink else None
         }
         
-        result = supabase.table("system_stats").insert(data).execute()
+        result = supabase.run_sync(supabase.insert("system_stats", data))
         print(f"✅ System stats sent: CPU={cpu_usage:.1f}%, RAM={ram_rss:.1f}MB, Ping={ping_gateway}ms")
         return result
         
@@ -64,7 +63,7 @@ def log_bot_event(level, message):
             "message": str(message)
         }
         
-        result = supabase.table("bot_logs").insert(data).execute()
+        result = supabase.run_sync(supabase.insert("bot_logs", data))
         return result
         
     except Exception as e:
@@ -90,7 +89,7 @@ def log_gemini_usage(guild_id, user_id, prompt_tokens, completion_tokens, total_
             "model": str(model)
         }
         
-        result = supabase.table("gemini_usage").insert(data).execute()
+        result = supabase.run_sync(supabase.insert("gemini_usage", data))
         print(f"✅ Gemini usage logged: {total_tokens} tokens")
         return result
         
@@ -116,7 +115,7 @@ def log_music_play(guild_id, track_title, track_url, duration_ms, requested_by):
             "requested_by": str(requested_by)
         }
         
-        result = supabase.table("music_history").insert(data).execute()
+        result = supabase.run_sync(supabase.insert("music_history", data))
         print(f"✅ Music play logged: {track_title}")
         return result
         
@@ -142,7 +141,7 @@ def update_active_session(guild_id, track_title=None, position_ms=0, duration_ms
             "is_playing": bool(is_playing)
         }
         
-        result = supabase.table("active_sessions").upsert(data).execute()
+        result = supabase.run_sync(supabase.upsert("active_sessions", data))
         print(f"✅ Active session updated: {track_title}")
         return result
         
@@ -157,7 +156,9 @@ def remove_active_session(guild_id):
         return None
     
     try:
-        result = supabase.table("active_sessions").delete().eq("guild_id", str(guild_id)).execute()
+        result = supabase.run_sync(
+            supabase.delete("active_sessions", {"guild_id": f"eq.{guild_id}"})
+        )
         print(f"✅ Active session removed for guild {guild_id}")
         return result
         
@@ -175,14 +176,11 @@ def get_pending_commands():
         return []
     
     try:
-        result = supabase.table("command_queue")\
-            .select("*")\
-            .eq("status", "pending")\
-            .order("created_at", desc=False)\
-            .limit(10)\
-            .execute()
-        
-        return result.data if result.data else []
+        return supabase.run_sync(supabase.select("command_queue", {
+            "status": "eq.pending",
+            "order": "created_at.asc",
+            "limit": "10"
+        }))
         
     except Exception as e:
         print(f"❌ Failed to get pending commands: {e}")
@@ -195,10 +193,9 @@ def update_command_status(command_id, status):
         return None
     
     try:
-        result = supabase.table("command_queue")\
-            .update({"status": str(status)})\
-            .eq("id", str(command_id))\
-            .execute()
+        result = supabase.run_sync(
+            supabase.update("command_queue", {"status": str(status)}, {"id": f"eq.{command_id}"})
+        )
         
         return result
         
@@ -1,12 +1,24 @@
 """
 Discord Bot - Supabase統合クライアント
 完全なスキーマ対応版
+
+各関数には非同期版（*_async）があり、Botのイベントループをブロックしない。
+同期版は既存コードとの互換性のための薄いラッパー。
 """
 
+import asyncio
 import os
-from supabase import create_client, Client
+import socket
+import threading
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from active_session_sync import ActiveSessionSync
+from command_consumer import CommandConsumer, RealtimeCommandSource
+from command_dispatcher import CommandDispatcher
+from supabase_rest import SupabaseREST, is_rejected
+from telemetry_queue import TelemetryQueue
+from telemetry_spool import TelemetrySpool
+from usage_aggregator import UsageAggregator
 
 load_dotenv()
 
@@ -15,16 +27,158 @@ supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")  # service_role キーを
 
 if not supabase_url or not supabase_key:
     print("⚠️ Supabase credentials not found")
-    supabase = None
+    rest = None
 else:
-    supabase: Client = create_client(supabase_url, supabase_key)
+    rest = SupabaseREST(
+        supabase_url,
+        supabase_key,
+        pool_size=int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+    )
     print("✅ Supabase connected")
 
+# コマンドを確保するBotプロセスの識別子（複数プロセスで水平スケールする場合に使用）
+WORKER_ID = os.getenv("BOT_WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+COMMAND_LEASE_SECONDS = int(os.getenv("COMMAND_LEASE_SECONDS", "60"))
+
+
+# ==========================================
+# テレメトリ書き込みキュー
+# ==========================================
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "50"))
+TELEMETRY_FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "2.0"))
+TELEMETRY_SPOOL_PATH = os.getenv("TELEMETRY_SPOOL_PATH", "telemetry_spool.db")
+
+# gemini_usage の記録方式: "aggregate"（分ごとに集計して加算）または "raw"（1リクエスト1行）
+GEMINI_USAGE_MODE = os.getenv("GEMINI_USAGE_MODE", "aggregate")
+GEMINI_USAGE_FLUSH_INTERVAL = float(os.getenv("GEMINI_USAGE_FLUSH_INTERVAL", "15"))
+
+# system_stats の保持期間（日）。ロールアップの 1d は削除しない
+SYSTEM_STATS_RETENTION_DAYS = int(os.getenv("SYSTEM_STATS_RETENTION_DAYS", "7"))
+SYSTEM_STATS_ROLLUP_RETENTION_DAYS = {
+    "1m": int(os.getenv("SYSTEM_STATS_1M_RETENTION_DAYS", "2")),
+    "1h": int(os.getenv("SYSTEM_STATS_1H_RETENTION_DAYS", "90"))
+}
+
+
+def _insert_rows(table, rows):
+    """複数行を1回のリクエストでINSERT"""
+    rest.run_sync(rest.insert(table, rows, returning=False))
+
+
+def _bulk_insert(table, rows):
+    """キューのフラッシュ処理（障害中は送信せずスプールへ回す）"""
+    if telemetry_spool.degraded:
+        telemetry_spool.append(table, rows)
+        return
+    try:
+        _insert_rows(table, rows)
+    except Exception as e:
+        if not is_rejected(e):
+            raise
+        # 拒否された行を含むバッチは障害扱いにせず、再送時に行を切り分ける
+        _spool_failed_rows(table, rows, e)
+        return
+    print(f"✅ Flushed {len(rows)} rows to {table}")
+
+
+def _spool_failed_rows(table, rows, error=None):
+    """送信に失敗した行をディスクスプールに保存
+
+    拒否（4xx）の場合は障害として記録しない（他の行の送信は止めない）
+    """
+    if error is None or not is_rejected(error):
+        telemetry_spool.record_failure()
+    telemetry_spool.append(table, rows)
+    print(f"💾 Spooled {len(rows)} rows for {table}")
+
+
+def _add_gemini_usage(rows):
+    """集計済みの使用量を既存の行に加算（1回のRPC）"""
+    rest.run_sync(rest.rpc("add_gemini_usage", {"p_rows": rows}))
+
+
+telemetry_queue = None
+telemetry_spool = None
+usage_aggregator = None
+if rest:
+    telemetry_spool = TelemetrySpool(TELEMETRY_SPOOL_PATH, _insert_rows, is_rejected=is_rejected)
+
+    telemetry_queue = TelemetryQueue(
+        _bulk_insert,
+        max_batch_size=TELEMETRY_BATCH_SIZE,
+        flush_interval=TELEMETRY_FLUSH_INTERVAL,
+        on_failure=_spool_failed_rows
+    )
+
+    if GEMINI_USAGE_MODE == "aggregate":
+        usage_aggregator = UsageAggregator(
+            _add_gemini_usage,
+            flush_interval=GEMINI_USAGE_FLUSH_INTERVAL
+        )
+
+_telemetry_started = False
+_telemetry_start_lock = threading.Lock()
+
+
+def start_telemetry():
+    """フラッシュ・再送・集計のバックグラウンドスレッドを開始（2回目以降は何もしない）
+
+    インポートしただけではスレッドを起動しない。最初のログ送信時に自動で呼ばれるが、
+    前回のスプールをすぐに再送したい場合はBotの起動時に呼ぶ。
+    """
+    global _telemetry_started
+    if not rest or _telemetry_started:
+        return
+    with _telemetry_start_lock:
+        if _telemetry_started:
+            return
+        telemetry_spool.start()
+        telemetry_queue.start()
+        if usage_aggregator:
+            usage_aggregator.start()
+        _telemetry_started = True
+
+
+def _enqueue(table, data):
+    """行をテレメトリキューに追加（未開始ならスレッドを開始）"""
+    start_telemetry()
+    telemetry_queue.enqueue(table, data)
+
+
+def flush_telemetry():
+    """キューに残っているログを即座に送信（シャットダウン時に呼ぶ）"""
+    if usage_aggregator:
+        usage_aggregator.flush()
+    if telemetry_queue:
+        telemetry_queue.flush()
+
+
+def close_telemetry():
+    """フラッシュスレッドを停止し、残りのログを送信して接続を閉じる"""
+    if usage_aggregator:
+        usage_aggregator.close()
+    if telemetry_queue:
+        telemetry_queue.close()
+    if telemetry_spool:
+        telemetry_spool.close()
+    if rest:
+        rest.close()
+
+
+def get_telemetry_stats():
+    """キュー深さ・バッチサイズ・フラッシュ時間・スプールの統計を取得"""
+    if not telemetry_queue:
+        return {}
+    stats = {**telemetry_queue.get_stats(), "spool": telemetry_spool.get_stats()}
+    if usage_aggregator:
+        stats["gemini_usage"] = usage_aggregator.get_stats()
+    return stats
+
 
 # ==========================================
 # システム統計送信
 # ==========================================
-def send_system_stats(
+async def send_system_stats_async(
     cpu_usage,
     ram_usage,
     memory_rss,
@@ -35,12 +189,16 @@ def send_system_stats(
     guild_count=0,
     uptime=0,
     status='online',
-    bot_id='primary'
+    bot_id='primary',
+    window=None
 ):
-    """システム統計をSupabaseに送信"""
-    if not supabase:
+    """システム統計をSupabaseに送信
+
+    window: サンプラーのウィンドウ集計（cpu_usage_p95 などの列）。指定時はそのまま追加
+    """
+    if not rest:
         return
-    
+
     try:
         data = {
             "bot_id": bot_id,
@@ -55,24 +213,122 @@ def send_system_stats(
             "uptime": uptime,
             "status": status
         }
-        
-        result = supabase.table("system_stats").insert(data).execute()
+        if window:
+            data.update(window)
+
+        start_telemetry()
+        if telemetry_spool.degraded:
+            telemetry_spool.append("system_stats", [data])
+            return None
+
+        result = await rest.insert("system_stats", data)
         print(f"✅ System stats sent: CPU={cpu_usage:.1f}%, Status={status}")
         return result
-        
+
     except Exception as e:
         print(f"❌ Failed to send system stats: {e}")
+        _spool_failed_rows("system_stats", [data], e)
         return None
 
 
+def send_system_stats(*args, **kwargs):
+    """システム統計をSupabaseに送信（同期版）"""
+    if not rest:
+        return
+    return rest.run_sync(send_system_stats_async(*args, **kwargs))
+
+
+async def _prune_in_batches(function, params, batch_size, max_batches, pause):
+    """削除RPCを件数が batch_size 未満になるまで繰り返す"""
+    total = 0
+    for _ in range(max_batches):
+        deleted = await rest.rpc(function, {**params, "p_batch_size": batch_size}) or 0
+        total += deleted
+        if deleted < batch_size:
+            break
+        # 他のクエリにロックとI/Oを譲る
+        await asyncio.sleep(pause)
+    return total
+
+
+async def prune_system_stats_async(max_age_days=None, batch_size=5000, max_batches=100, pause=0.2):
+    """保持期間を過ぎた system_stats の生データと細かいロールアップを分割して削除
+
+    Returns:
+        {"system_stats": 削除件数, "1m": ..., "1h": ...}
+    """
+    if not rest:
+        return {}
+
+    result = {}
+    try:
+        result["system_stats"] = await _prune_in_batches(
+            "prune_system_stats",
+            {"p_max_age_days": max_age_days or SYSTEM_STATS_RETENTION_DAYS},
+            batch_size, max_batches, pause
+        )
+        for resolution, days in SYSTEM_STATS_ROLLUP_RETENTION_DAYS.items():
+            result[resolution] = await _prune_in_batches(
+                "prune_system_stats_rollups",
+                {"p_resolution": resolution, "p_max_age_days": days},
+                batch_size, max_batches, pause
+            )
+
+        if any(result.values()):
+            print(f"🧹 Pruned system stats: {result}")
+        return result
+
+    except Exception as e:
+        print(f"❌ Failed to prune system stats: {e}")
+        return result
+
+
+def prune_system_stats(*args, **kwargs):
+    """保持期間を過ぎた system_stats を削除（同期版）"""
+    if not rest:
+        return {}
+    return rest.run_sync(prune_system_stats_async(*args, **kwargs), timeout=300)
+
+
+async def get_system_stats_history_async(resolution="1h", since=None, bot_id="primary"):
+    """ロールアップ済みのシステム統計（avg / max / p95）を取得
+
+    Args:
+        resolution: '1m' / '1h' / '1d'
+        since: この時刻（ISO 8601）以降のバケットだけを返す
+    """
+    if not rest:
+        return []
+
+    params = {
+        "resolution": f"eq.{resolution}",
+        "bot_id": f"eq.{bot_id}",
+        "order": "bucket_start.asc"
+    }
+    if since:
+        params["bucket_start"] = f"gte.{since}"
+
+    try:
+        return await rest.select("system_stats_history", params)
+
+    except Exception as e:
+        print(f"❌ Failed to get system stats history: {e}")
+        return []
+
+
 # ==========================================
 # 会話ログ記録
 # ==========================================
+async def log_conversation_async(user_id, user_name, prompt, response):
+    """会話ログをキューに追加（バックグラウンドで一括送信）"""
+    return log_conversation(user_id, user_name, prompt, response)
+
+
 def log_conversation(user_id, user_name, prompt, response):
-    """会話ログをSupabaseに記録"""
-    if not supabase:
+    """会話ログをキューに追加（バックグラウンドで一括送信）"""
+    if not rest:
         return
-    
+
     try:
         data = {
             "user_id": user_id,
@@ -80,11 +336,10 @@ def log_conversation(user_id, user_name, prompt, response):
             "prompt": prompt,
             "response": response
         }
-        
-        result = supabase.table("conversation_logs").insert(data).execute()
-        print(f"✅ Conversation logged: {user_name}")
-        return result
-        
+
+        _enqueue("conversation_logs", data)
+        return data
+
     except Exception as e:
         print(f"❌ Failed to log conversation: {e}")
         return None
@@ -93,11 +348,16 @@ def log_conversation(user_id, user_name, prompt, response):
 # ==========================================
 # 音楽ログ記録（シンプル版）
 # ==========================================
+async def log_music_play_async(guild_id, song_title, requested_by, requested_by_id):
+    """音楽再生ログをキューに追加（music_logs）"""
+    return log_music_play(guild_id, song_title, requested_by, requested_by_id)
+
+
 def log_music_play(guild_id, song_title, requested_by, requested_by_id):
-    """音楽再生ログを記録（music_logs）"""
-    if not supabase:
+    """音楽再生ログをキューに追加（music_logs）"""
+    if not rest:
         return
-    
+
     try:
         data = {
             "guild_id": guild_id,
@@ -105,11 +365,10 @@ def log_music_play(guild_id, song_title, requested_by, requested_by_id):
             "requested_by": requested_by,
             "requested_by_id": requested_by_id
         }
-        
-        result = supabase.table("music_logs").insert(data).execute()
-        print(f"✅ Music play logged: {song_title}")
-        return result
-        
+
+        _enqueue("music_logs", data)
+        return data
+
     except Exception as e:
         print(f"❌ Failed to log music play: {e}")
         return None
@@ -118,11 +377,16 @@ def log_music_play(guild_id, song_title, requested_by, requested_by_id):
 # ==========================================
 # 音楽履歴記録（詳細版）
 # ==========================================
-def log_music_history(guild_id, track_title, track_url, duration_ms, requested_by, requested_by_id):
-    """音楽再生履歴を記録（music_history）"""
-    if not supabase:
+async def log_music_history_async(guild_id, track_title, track_url, duration_ms, requested_by, requested_by_id, artist=None):
+    """音楽再生履歴をキューに追加（music_history）"""
+    return log_music_history(guild_id, track_title, track_url, duration_ms, requested_by, requested_by_id, artist)
+
+
+def log_music_history(guild_id, track_title, track_url, duration_ms, requested_by, requested_by_id, artist=None):
+    """音楽再生履歴をキューに追加（music_history）"""
+    if not rest:
         return
-    
+
     try:
         data = {
             "guild_id": guild_id,
@@ -130,13 +394,13 @@ def log_music_history(guild_id, track_title, track_url, duration_ms, requested_b
             "track_url": track_url,
             "duration_ms": duration_ms,
             "requested_by": requested_by,
-            "requested_by_id": requested_by_id
+            "requested_by_id": requested_by_id,
+            "artist": artist
         }
-        
-        result = supabase.table("music_history").insert(data).execute()
-        print(f"✅ Music history logged: {track_title}")
-        return result
-        
+
+        _enqueue("music_history", data)
+        return data
+
     except Exception as e:
         print(f"❌ Failed to log music history: {e}")
         return None
@@ -145,6 +409,18 @@ def log_music_history(guild_id, track_title, track_url, duration_ms, requested_b
 # ==========================================
 # Gemini使用ログ
 # ==========================================
+async def log_gemini_usage_async(
+    guild_id,
+    user_id,
+    prompt_tokens,
+    completion_tokens,
+    total_tokens,
+    model="gemini-pro"
+):
+    """Gemini API使用ログをキューに追加"""
+    return log_gemini_usage(guild_id, user_id, prompt_tokens, completion_tokens, total_tokens, model)
+
+
 def log_gemini_usage(
     guild_id,
     user_id,
@@ -153,11 +429,25 @@ def log_gemini_usage(
     total_tokens,
     model="gemini-pro"
 ):
-    """Gemini API使用ログを記録"""
-    if not supabase:
+    """Gemini API使用ログを記録
+
+    集計モードでは (guild, user, model, 分) のカウンターに加算するだけで、
+    書き込みは一定間隔でまとめて行う。raw モードでは1リクエスト1行をキューに追加。
+    """
+    if not rest:
         return
-    
+
     try:
+        if usage_aggregator:
+            start_telemetry()
+            usage_aggregator.record(
+                guild_id, user_id, model,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=total_tokens
+            )
+            return None
+
         data = {
             "guild_id": guild_id,
             "user_id": user_id,
@@ -166,20 +456,42 @@ def log_gemini_usage(
             "total_tokens": total_tokens,
             "model": model
         }
-        
-        result = supabase.table("gemini_usage").insert(data).execute()
-        print(f"✅ Gemini usage logged: {total_tokens} tokens")
-        return result
-        
+
+        _enqueue("gemini_usage", data)
+        return data
+
     except Exception as e:
         print(f"❌ Failed to log Gemini usage: {e}")
         return None
 
 
+async def get_recent_gemini_usage_async(window_seconds):
+    """直近 window_seconds 秒の使用量を (scope, id, UNIX時刻, total_tokens) の列で取得
+
+    レート制限の起動時の復元（GeminiRateLimiter.seed）に使う。
+    """
+    if not rest:
+        return []
+
+    since = datetime.now(timezone.utc) - timedelta(seconds=window_seconds)
+    try:
+        rows = await rest.rpc("gemini_usage_since", {"p_since": since.isoformat()}) or []
+    except Exception as e:
+        print(f"❌ Failed to get recent Gemini usage: {e}")
+        return []
+
+    usage = []
+    for row in rows:
+        timestamp = datetime.fromisoformat(row["minute"].replace("Z", "+00:00")).timestamp()
+        usage.append(("user", row["user_id"], timestamp, row["total_tokens"]))
+        usage.append(("guild", row["guild_id"], timestamp, row["total_tokens"]))
+    return usage
+
+
 # ==========================================
 # アクティブセッション更新
 # ==========================================
-def update_active_session(
+async def update_active_session_async(
     guild_id,
     track_title=None,
     position_ms=0,
@@ -188,9 +500,9 @@ def update_active_session(
     voice_members_count=0
 ):
     """アクティブセッション情報を更新"""
-    if not supabase:
+    if not rest:
         return
-    
+
     try:
         data = {
             "guild_id": guild_id,
@@ -200,49 +512,124 @@ def update_active_session(
             "is_playing": is_playing,
             "voice_members_count": voice_members_count
         }
-        
-        result = supabase.table("active_sessions").upsert(data).execute()
+
+        result = await rest.upsert("active_sessions", data)
         print(f"✅ Active session updated: {track_title}")
         return result
-        
+
     except Exception as e:
         print(f"❌ Failed to update active session: {e}")
         return None
 
 
-def remove_active_session(guild_id):
+def update_active_session(*args, **kwargs):
+    """アクティブセッション情報を更新（同期版）"""
+    if not rest:
+        return
+    return rest.run_sync(update_active_session_async(*args, **kwargs))
+
+
+async def remove_active_session_async(guild_id):
     """アクティブセッションを削除"""
-    if not supabase:
+    if not rest:
         return
-    
+
+    await active_session_sync.forget(guild_id)
     try:
-        result = supabase.table("active_sessions").delete().eq("guild_id", guild_id).execute()
+        result = await rest.delete("active_sessions", {"guild_id": f"eq.{guild_id}"})
         print(f"✅ Active session removed for guild {guild_id}")
         return result
-        
+
     except Exception as e:
         print(f"❌ Failed to remove active session: {e}")
         return None
 
 
+def remove_active_session(guild_id):
+    """アクティブセッションを削除（同期版）"""
+    if not rest:
+        return
+    return rest.run_sync(remove_active_session_async(guild_id))
+
+
+# ==========================================
+# アクティブセッション差分同期
+# ==========================================
+async def _upsert_active_sessions(rows):
+    """複数ギルドのセッションを1回のリクエストでUPSERT"""
+    await rest.upsert("active_sessions", rows, returning=False)
+
+
+# 再生中のギルドの行は変化が無くてもこの間隔で updated_at を更新し、
+# ACTIVE_SESSION_TTL 秒以上更新されていない行（落ちたプロセスの行）は削除対象になる
+ACTIVE_SESSION_HEARTBEAT = float(os.getenv("ACTIVE_SESSION_HEARTBEAT", "60"))
+ACTIVE_SESSION_TTL = int(os.getenv("ACTIVE_SESSION_TTL", "300"))
+
+active_session_sync = ActiveSessionSync(
+    _upsert_active_sessions,
+    debounce=float(os.getenv("ACTIVE_SESSION_DEBOUNCE", "1.5")),
+    heartbeat=ACTIVE_SESSION_HEARTBEAT
+)
+
+
+def queue_active_session_update(guild_id, **fields):
+    """セッション状態を登録（変更されたフィールドだけがまとめて書き込まれる）
+
+    fields: track_title, position_ms, duration_ms, is_playing, voice_members_count
+    """
+    if not rest:
+        return
+    active_session_sync.update(guild_id, **fields)
+
+
+async def flush_active_sessions_async(force=False):
+    """デバウンス済みのセッション変更を1回の複数行UPSERTで書き込む"""
+    if not rest:
+        return 0
+    return await active_session_sync.flush(force=force)
+
+
+async def prune_stale_active_sessions_async(max_age_seconds=None):
+    """ACTIVE_SESSION_TTL 秒以上更新されていないセッション（落ちたプロセスの行）を削除"""
+    if not rest:
+        return 0
+
+    try:
+        removed = await rest.rpc("prune_stale_active_sessions", {
+            "p_max_age_seconds": max_age_seconds or ACTIVE_SESSION_TTL
+        }) or 0
+        if removed:
+            print(f"🧹 Removed {removed} stale active sessions")
+        return removed
+
+    except Exception as e:
+        print(f"❌ Failed to prune stale active sessions: {e}")
+        return 0
+
+
 # ==========================================
 # Botログ送信
 # ==========================================
+async def log_bot_event_async(level, message, scope="general"):
+    """Botログをキューに追加"""
+    return log_bot_event(level, message, scope)
+
+
 def log_bot_event(level, message, scope="general"):
-    """BotログをSupabaseに送信"""
-    if not supabase:
+    """Botログをキューに追加"""
+    if not rest:
         return
-    
+
     try:
         data = {
             "level": level.lower(),  # debug, info, warning, error, critical
             "message": message,
             "scope": scope
         }
-        
-        result = supabase.table("bot_logs").insert(data).execute()
-        return result
-        
+
+        _enqueue("bot_logs", data)
+        return data
+
     except Exception as e:
         print(f"❌ Failed to log event: {e}")
         return None
@@ -251,67 +638,175 @@ def log_bot_event(level, message, scope="general"):
 # ==========================================
 # コマンドキュー取得
 # ==========================================
-def get_pending_commands():
+async def get_pending_commands_async():
     """pending状態のコマンドを取得"""
-    if not supabase:
+    if not rest:
         return []
-    
+
     try:
-        result = supabase.table("command_queue")\
-            .select("*")\
-            .eq("status", "pending")\
-            .order("created_at", desc=False)\
-            .limit(10)\
-            .execute()
-        
-        return result.data if result.data else []
-        
+        return await rest.select("command_queue", {
+            "status": "eq.pending",
+            "order": "created_at.asc",
+            "limit": "10"
+        })
+
     except Exception as e:
         print(f"❌ Failed to get pending commands: {e}")
         return []
 
 
-def update_command_status(command_id, status, result=None, error=None):
-    """コマンドのステータスを更新"""
-    if not supabase:
+def get_pending_commands():
+    """pending状態のコマンドを取得（同期版）"""
+    if not rest:
+        return []
+    return rest.run_sync(get_pending_commands_async())
+
+
+async def claim_commands_async(limit=10, lease_seconds=None, worker_id=None):
+    """pending（またはリース期限切れ）のコマンドを最大 limit 件、1回の文で確保
+
+    確保した行は status='processing' になり、worker_id とリース期限が設定される。
+    期限内に完了しなかったコマンドは他のプロセスが再確保できる。
+    """
+    if not rest:
+        return []
+
+    try:
+        return await rest.rpc("claim_commands", {
+            "p_worker_id": worker_id or WORKER_ID,
+            "p_limit": limit,
+            "p_lease_seconds": lease_seconds or COMMAND_LEASE_SECONDS
+        }) or []
+
+    except Exception as e:
+        print(f"❌ Failed to claim commands: {e}")
+        return []
+
+
+def claim_commands(limit=10, lease_seconds=None, worker_id=None):
+    """コマンドを原子的に確保（同期版）"""
+    if not rest:
+        return []
+    return rest.run_sync(claim_commands_async(limit, lease_seconds, worker_id))
+
+
+async def update_command_status_async(command_id, status, result=None, error=None, worker_id=None):
+    """コマンドのステータスを更新
+
+    worker_id を指定すると、そのプロセスがまだ確保しているコマンドだけを更新する
+    （リース切れで他のプロセスに再確保された場合は何も更新しない）。
+    """
+    if not rest:
         return
-    
+
     try:
         data = {"status": status}
-        
+
         if result:
             data["result"] = result
-        
+
         if error:
             data["error"] = error
-        
+
         if status == "completed" or status == "failed":
             data["completed_at"] = datetime.now().isoformat()
-        
-        result = supabase.table("command_queue")\
-            .update(data)\
-            .eq("id", command_id)\
-            .execute()
-        
-        return result
-        
+
+        filters = {"id": f"eq.{command_id}"}
+        if worker_id:
+            filters["worker_id"] = f"eq.{worker_id}"
+
+        return await rest.update("command_queue", data, filters)
+
     except Exception as e:
         print(f"❌ Failed to update command status: {e}")
         return None
 
 
+async def update_command_statuses_async(updates, worker_id=None):
+    """複数コマンドのステータスを1回のリクエストで更新
+
+    updates: [{"id": ..., "status": ..., "result": ..., "error": ...}, ...]
+    失敗時は例外を送出する（呼び出し側で再試行するため）。
+    """
+    if not rest or not updates:
+        return 0
+    return await rest.rpc("update_command_statuses", {
+        "p_updates": updates,
+        "p_worker_id": worker_id
+    })
+
+
+async def renew_command_leases_async(command_ids, lease_seconds=None, worker_id=None):
+    """確保中のコマンドのリースをまとめて延長し、延長できたIDのリストを返す
+
+    失敗時は例外を送出する（呼び出し側で再試行するため）。
+    """
+    if not rest or not command_ids:
+        return []
+    rows = await rest.rpc("renew_command_leases", {
+        "p_ids": list(command_ids),
+        "p_worker_id": worker_id or WORKER_ID,
+        "p_lease_seconds": lease_seconds or COMMAND_LEASE_SECONDS
+    }) or []
+    return [row["id"] for row in rows]
+
+
+def update_command_status(command_id, status, result=None, error=None, worker_id=None):
+    """コマンドのステータスを更新（同期版）"""
+    if not rest:
+        return
+    return rest.run_sync(update_command_status_async(command_id, status, result, error, worker_id))
+
+
+def create_command_dispatcher(handler, max_concurrency=8):
+    """ギルド間は並行・ギルド内は順番にコマンドを実行するディスパッチャーを作成
+
+    handler の戻り値は result に、例外は error に保存され、ステータスはまとめて書き込まれる。
+    待機中・実行中のコマンドのリースは自動で延長される。
+    """
+    return CommandDispatcher(
+        handler,
+        lambda updates: update_command_statuses_async(updates, worker_id=WORKER_ID),
+        max_concurrency=max_concurrency,
+        renew_leases_fn=lambda ids: renew_command_leases_async(ids, worker_id=WORKER_ID),
+        lease_seconds=COMMAND_LEASE_SECONDS
+    )
+
+
+def create_command_consumer(handler, source=None, capacity=None):
+    """command_queue のINSERTを購読してハンドラーに渡すコンシューマーを作成
+
+    source を省略するとSupabase Realtimeを使用（テストでは LocalCommandSource を渡す）。
+    ハンドラーには claim_commands で確保済み（status='processing'）の行が渡される。
+    購読が切れている間は確保のポーリングに切り替わる。
+    capacity（例: CommandDispatcher.capacity）を渡すと、すぐに実行できる件数までしか確保しない。
+    """
+    if source is None:
+        if not rest:
+            return None
+        source = RealtimeCommandSource(supabase_url, supabase_key)
+    return CommandConsumer(
+        source,
+        lambda limit: claim_commands_async(limit=limit),
+        handler,
+        batch_size=10,
+        capacity=capacity,
+        reclaim_interval=COMMAND_LEASE_SECONDS
+    )
+
+
 # ==========================================
 # テスト関数
 # ==========================================
-def test_connection():
+async def test_connection_async():
     """Supabase接続をテスト"""
-    if not supabase:
+    if not rest:
         print("❌ Supabase not connected")
         return False
-    
+
     try:
         # システム統計をテスト送信
-        result = send_system_stats(
+        result = await send_system_stats_async(
             cpu_usage=50.0,
             ram_usage=60.0,
             memory_rss=128.5,
@@ -323,19 +818,28 @@ def test_connection():
             uptime=3600,
             status='online'
         )
-        
+
         if result:
             print("✅ Connection test successful!")
             return True
         else:
             print("❌ Connection test failed")
             return False
-            
+
     except Exception as e:
         print(f"❌ Connection test error: {e}")
         return False
 
 
+def test_connection():
+    """Supabase接続をテスト（同期版）"""
+    if not rest:
+        print("❌ Supabase not connected")
+        return False
+    return rest.run_sync(test_connection_async())
+
+
 if __name__ == "__main__":
     print("Testing Supabase connection...")
     test_connection()
+    close_telemetry()
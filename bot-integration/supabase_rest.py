@@ -0,0 +1,188 @@
+"""
+Supabase (PostgREST) 非同期クライアント
+共有のkeep-alive接続プールを専用I/Oスレッドのイベントループ上で保持する
+"""
+
+import asyncio
+import json
+import threading
+from typing import Any, Dict, List, Optional, Union
+
+import aiohttp
+
+Rows = Union[Dict, List[Dict]]
+
+
+class SupabaseRESTError(Exception):
+    """PostgRESTがエラーレスポンスを返した"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.message = message
+
+    @property
+    def rejected(self) -> bool:
+        """リクエスト自体が拒否された（制約違反など。同じ内容で送り直しても成功しない）"""
+        return 400 <= self.status < 500 and self.status not in (408, 429)
+
+
+def is_rejected(error: Exception) -> bool:
+    """送り直しても成功しない失敗か（タイムアウト・5xx・接続エラーは一時的な失敗）"""
+    return isinstance(error, SupabaseRESTError) and error.rejected
+
+
+class SupabaseREST:
+    """PostgREST APIを直接呼び出す軽量クライアント
+
+    aiohttpセッションは専用スレッドのイベントループに1つだけ作成され、
+    非同期呼び出し（Botのイベントループ）と同期呼び出し（通常のスレッド）の
+    両方から共有される。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        key: str,
+        pool_size: int = 20,
+        keepalive_timeout: float = 60.0,
+        timeout: float = 10.0
+    ):
+        self.base_url = f"{url.rstrip('/')}/rest/v1"
+        self.headers = {
+            "apikey": key,
+            "Authorization": f"Bearer {key}",
+            "Content-Type": "application/json"
+        }
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    # ==========================================
+    # I/Oループ管理
+    # ==========================================
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """専用I/Oスレッドを起動（初回のみ）"""
+        with self._start_lock:
+            if self._loop is None or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="supabase-io", daemon=True
+                )
+                self._thread.start()
+        return self._loop
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """接続プール付きセッションを取得（I/Oループ上で呼ぶ）"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def _dispatch(self, coro):
+        """コルーチンをI/Oループで実行し、呼び出し元のループで結果を待つ"""
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        return await asyncio.wrap_future(future)
+
+    def run_sync(self, coro, timeout: Optional[float] = None):
+        """コルーチンをI/Oループで実行し、完了までブロック（同期ラッパー用）"""
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        return future.result(timeout or self.timeout * 2)
+
+    async def _close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    def close(self):
+        """セッションを閉じてI/Oスレッドを停止"""
+        if self._loop is None or not self._thread.is_alive():
+            return
+        asyncio.run_coroutine_threadsafe(self._close(), self._loop).result(self.timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(self.timeout)
+
+    # ==========================================
+    # HTTPリクエスト
+    # ==========================================
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict] = None,
+        body: Any = None,
+        prefer: Optional[str] = None
+    ) -> Any:
+        session = await self._get_session()
+        headers = {"Prefer": prefer} if prefer else None
+        data = json.dumps(body, default=str) if body is not None else None
+
+        async with session.request(
+            method, f"{self.base_url}/{path}", params=params, data=data, headers=headers
+        ) as response:
+            text = await response.text()
+            if response.status >= 400:
+                raise SupabaseRESTError(response.status, text)
+            return json.loads(text) if text else None
+
+    async def select(self, table: str, params: Optional[Dict] = None) -> List[Dict]:
+        """行を取得（params はPostgRESTのクエリパラメータ、例: {"status": "eq.pending"}）"""
+        query = {"select": "*", **(params or {})}
+        return await self._dispatch(self._request("GET", table, params=query)) or []
+
+    async def insert(self, table: str, rows: Rows, returning: bool = True) -> List[Dict]:
+        """1行または複数行をINSERT"""
+        prefer = "return=representation" if returning else "return=minimal"
+        return await self._dispatch(
+            self._request("POST", table, body=rows, prefer=prefer)
+        ) or []
+
+    async def upsert(
+        self,
+        table: str,
+        rows: Rows,
+        on_conflict: Optional[str] = None,
+        returning: bool = True
+    ) -> List[Dict]:
+        """1行または複数行をUPSERT（主キーまたは on_conflict 列で重複判定）"""
+        params = {"on_conflict": on_conflict} if on_conflict else None
+        prefer = "resolution=merge-duplicates," + (
+            "return=representation" if returning else "return=minimal"
+        )
+        return await self._dispatch(
+            self._request("POST", table, params=params, body=rows, prefer=prefer)
+        ) or []
+
+    async def update(self, table: str, data: Dict, filters: Dict) -> List[Dict]:
+        """filters に一致する行を更新（例: {"id": "eq.<uuid>"}）"""
+        return await self._dispatch(
+            self._request(
+                "PATCH", table, params=filters, body=data, prefer="return=representation"
+            )
+        ) or []
+
+    async def delete(self, table: str, filters: Dict) -> List[Dict]:
+        """filters に一致する行を削除"""
+        return await self._dispatch(
+            self._request("DELETE", table, params=filters, prefer="return=representation")
+        ) or []
+
+    async def rpc(self, function: str, params: Optional[Dict] = None) -> Any:
+        """ストアドファンクションを呼び出す"""
+        return await self._dispatch(
+            self._request("POST", f"rpc/{function}", body=params or {})
+        )
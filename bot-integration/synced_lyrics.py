@@ -0,0 +1,99 @@
+"""
+タイムスタンプ付き歌詞（LRC形式）のインデックス
+タイムスタンプを整数配列、歌詞の行をタプルで持ち、再生位置から現在の行と次の行を二分探索で引く。
+多数のギルドで歌詞を追いかける表示でも、毎回LRCの文字列を走査しない
+"""
+
+import re
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+# [mm:ss], [mm:ss.xx], [mm:ss.xxx], [mm:ss:xx]
+_TIME_TAG = re.compile(r"\[(\d+):(\d{1,2})(?:[.:](\d{1,3}))?\]")
+_OFFSET_TAG = re.compile(r"^\[offset:\s*([+-]?\d+)\s*\]\s*$", re.IGNORECASE)
+
+Line = Tuple[int, str]
+
+
+class SyncedLyrics:
+    """再生位置で引ける歌詞
+
+    times[i] が lines[i] の開始時刻（ミリ秒、昇順）。
+    """
+
+    __slots__ = ("times", "lines")
+
+    def __init__(self, times: array, lines: Tuple[str, ...]):
+        self.times = times
+        self.lines = lines
+
+    @classmethod
+    def parse(cls, text: str) -> "SyncedLyrics":
+        """LRCの文字列を解析（1行に複数のタイムスタンプがあればそれぞれの時刻に展開）"""
+        offset = 0
+        entries: List[Line] = []
+        for raw in text.splitlines():
+            raw = raw.strip()
+            offset_match = _OFFSET_TAG.match(raw)
+            if offset_match:
+                offset = int(offset_match.group(1))
+                continue
+
+            stamps = []
+            position = 0
+            for match in _TIME_TAG.finditer(raw):
+                # タイムスタンプは行頭に続けて並ぶ
+                if match.start() != position:
+                    break
+                minutes, seconds, fraction = match.groups()
+                ms = int(fraction.ljust(3, "0")) if fraction else 0
+                stamps.append((int(minutes) * 60 + int(seconds)) * 1000 + ms)
+                position = match.end()
+            if not stamps:
+                # [ar:...] などのメタデータ行や、時刻の無い行
+                continue
+
+            line = raw[position:].strip()
+            entries.extend((stamp, line) for stamp in stamps)
+
+        # 同じ時刻の行は元の順番を保つ（sort は安定）
+        entries.sort(key=lambda entry: entry[0])
+        # offset が正なら歌詞を早く表示する（LRCの仕様）
+        times = array("i", (max(0, stamp - offset) for stamp, _ in entries))
+        return cls(times, tuple(line for _, line in entries))
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    # ==========================================
+    # 再生位置からの参照
+    # ==========================================
+    def index_at(self, position_ms: int) -> int:
+        """position_ms の時点で表示中の行の番号（最初の行より前なら -1）"""
+        return bisect_right(self.times, position_ms) - 1
+
+    def line(self, index: int) -> Optional[Line]:
+        """(開始時刻ms, 行) を返す。範囲外なら None"""
+        if 0 <= index < len(self.times):
+            return self.times[index], self.lines[index]
+        return None
+
+    def at(self, position_ms: int) -> Tuple[Optional[Line], Optional[Line]]:
+        """(現在の行, 次の行)"""
+        index = self.index_at(position_ms)
+        return self.line(index), self.line(index + 1)
+
+    def next_change_ms(self, position_ms: int) -> Optional[int]:
+        """次に表示が切り替わるまでのミリ秒（最後の行以降は None）"""
+        index = bisect_right(self.times, position_ms)
+        if index >= len(self.times):
+            return None
+        return self.times[index] - position_ms
+
+
+@lru_cache(maxsize=256)
+def parse_lrc(text: str) -> SyncedLyrics:
+    """同じLRCの再解析を避けるためのキャッシュ付き parse"""
+    return SyncedLyrics.parse(text)
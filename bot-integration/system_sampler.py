@@ -0,0 +1,155 @@
+"""
+システム統計サンプラー
+バックグラウンドスレッドでCPU・メモリ・Ping・イベントループ遅延を定期取得し、
+固定長のリングバッファに保持する
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+import psutil
+
+from metrics import summarize
+
+# リングバッファに保持する値
+SAMPLE_FIELDS = (
+    "timestamp",
+    "cpu_usage",
+    "ram_usage",
+    "memory_rss",
+    "memory_heap",
+    "ping_gateway",
+    "loop_lag"
+)
+
+# system_stats にウィンドウ集計（min / max / p95）を書き込む値
+WINDOW_COLUMNS = ("cpu_usage", "memory_rss", "ping_gateway", "loop_lag")
+
+
+class SystemSampler:
+    """イベントループをブロックせずにシステム統計を収集するサンプラー"""
+
+    def __init__(
+        self,
+        interval: float = 1.0,
+        window_seconds: float = 300.0,
+        latency_fn: Optional[Callable[[], float]] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None
+    ):
+        """
+        Args:
+            interval: サンプリング間隔（秒）
+            window_seconds: リングバッファに保持する期間（秒）
+            latency_fn: ゲートウェイのレイテンシ（秒）を返す関数（例: lambda: bot.latency）
+            loop: 遅延を計測するイベントループ
+        """
+        self.interval = interval
+        self.window_seconds = window_seconds
+        self.latency_fn = latency_fn
+        self.loop = loop
+
+        self._samples: deque = deque(maxlen=max(1, int(window_seconds / interval)))
+        self._process = psutil.Process()
+        self._loop_lag_ms = 0.0
+        self._probe_pending = False
+        self._probe_scheduled_at = 0.0
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ==========================================
+    # ライフサイクル
+    # ==========================================
+    def start(self):
+        """サンプリングスレッドを開始"""
+        if self._thread and self._thread.is_alive():
+            return
+        # 初回の cpu_percent(None) は常に0を返すので基準点を作っておく
+        psutil.cpu_percent(interval=None)
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="system-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """サンプリングスレッドを停止"""
+        self._stopped.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(self.interval * 2)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self._samples.append(self._collect())
+            except Exception as e:
+                print(f"❌ System sampler error: {e}")
+
+    # ==========================================
+    # サンプリング
+    # ==========================================
+    def _probe_loop(self):
+        """イベントループにコールバックを投入し、実行されるまでの遅延を計測"""
+        if self.loop is None or self.loop.is_closed():
+            return
+
+        if self._probe_pending:
+            # 前回の計測がまだ戻っていなければ、経過時間そのものが遅延の下限
+            waited_ms = (time.perf_counter() - self._probe_scheduled_at) * 1000
+            self._loop_lag_ms = max(self._loop_lag_ms, waited_ms)
+            return
+
+        scheduled = self._probe_scheduled_at = time.perf_counter()
+
+        def _callback():
+            self._loop_lag_ms = (time.perf_counter() - scheduled) * 1000
+            self._probe_pending = False
+
+        self._probe_pending = True
+        self.loop.call_soon_threadsafe(_callback)
+
+    def _collect(self) -> tuple:
+        self._probe_loop()
+
+        memory_info = self._process.memory_info()
+        latency = self.latency_fn() if self.latency_fn else 0.0
+        if latency is None or latency != latency:  # 未接続時は None / NaN
+            latency = 0.0
+
+        return (
+            time.time(),
+            psutil.cpu_percent(interval=None),
+            psutil.virtual_memory().percent,
+            memory_info.rss / (1024 * 1024),  # MB
+            memory_info.vms / (1024 * 1024),  # MB
+            latency * 1000,  # ms
+            self._loop_lag_ms
+        )
+
+    # ==========================================
+    # 参照
+    # ==========================================
+    def latest(self) -> Optional[Dict]:
+        """最新のサンプル（即時・ブロックなし）"""
+        if not self._samples:
+            return None
+        return dict(zip(SAMPLE_FIELDS, self._samples[-1]))
+
+    def summary(self, window_seconds: Optional[float] = None) -> Dict[str, Dict]:
+        """直近 window_seconds 秒の min / avg / max / p95 を計算"""
+        cutoff = time.time() - (window_seconds or self.window_seconds)
+        samples = [s for s in list(self._samples) if s[0] >= cutoff]
+        result = {"sample_count": len(samples)}
+        for index, field in enumerate(SAMPLE_FIELDS[1:], start=1):
+            result[field] = summarize(s[index] for s in samples)
+        return result
+
+    def window_columns(self, window_seconds: Optional[float] = None) -> Dict:
+        """summary() を system_stats の列名（cpu_usage_p95 など）に展開"""
+        summary = self.summary(window_seconds)
+        columns = {"sample_count": summary["sample_count"]}
+        for field in WINDOW_COLUMNS:
+            for stat in ("min", "max", "p95"):
+                columns[f"{field}_{stat}"] = summary[field][stat]
+        columns["loop_lag_avg"] = summary["loop_lag"]["avg"]
+        return columns
@@ -0,0 +1,161 @@
+"""
+テレメトリ書き込みキュー（write-behind）
+log_* ヘルパーの行をテーブルごとにまとめ、一括INSERTで送信する
+"""
+
+import atexit
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class TelemetryQueue:
+    """テーブルごとに行をバッファリングし、サイズまたは時間でフラッシュするキュー"""
+
+    def __init__(
+        self,
+        flush_fn: Callable[[str, List[Dict]], None],
+        max_batch_size: int = 50,
+        flush_interval: float = 2.0,
+        max_queue_size: int = 10000,
+        on_failure: Optional[Callable[[str, List[Dict]], None]] = None
+    ):
+        """
+        Args:
+            flush_fn: (table, rows) を受け取り一括INSERTする関数。失敗時は例外を送出
+            max_batch_size: 1テーブルあたりこの行数に達したら即時フラッシュ
+            flush_interval: 定期フラッシュの間隔（秒）
+            max_queue_size: 全テーブル合計の最大保持行数（超過分は古い行から破棄）
+            on_failure: フラッシュに失敗した行を受け取る関数（ディスクスプールなど）
+        """
+        self.flush_fn = flush_fn
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.on_failure = on_failure
+
+        self._buffers: Dict[str, List[Dict]] = {}
+        self._depth = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.stats = {
+            "enqueued": 0,
+            "flushed_rows": 0,
+            "dropped_rows": 0,
+            "failed_rows": 0,
+            "batches": 0,
+            "max_batch_size": 0,
+            "flush_time_total_ms": 0.0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0
+        }
+
+    # ==========================================
+    # ライフサイクル
+    # ==========================================
+    def start(self):
+        """バックグラウンドのフラッシュスレッドを開始し、終了時フラッシュを登録"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="telemetry-flusher", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def close(self, timeout: float = 10.0):
+        """スレッドを停止し、残っている行をすべてフラッシュ"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            self.flush()
+
+    # ==========================================
+    # キュー操作
+    # ==========================================
+    def enqueue(self, table: str, row: Dict):
+        """行をキューに追加（ネットワークI/Oは行わない）"""
+        with self._lock:
+            buffer = self._buffers.setdefault(table, [])
+            buffer.append(row)
+            self._depth += 1
+            self.stats["enqueued"] += 1
+
+            if self._depth > self.max_queue_size:
+                self._drop_oldest()
+
+            if len(buffer) >= self.max_batch_size:
+                self._wakeup.set()
+
+    def _drop_oldest(self):
+        """最も大きいバッファの先頭行を破棄（ロック取得済みで呼ぶ）"""
+        table = max(self._buffers, key=lambda t: len(self._buffers[t]))
+        self._buffers[table].pop(0)
+        self._depth -= 1
+        self.stats["dropped_rows"] += 1
+
+    def flush(self):
+        """全テーブルのバッファを一括INSERTで送信"""
+        with self._flush_lock:
+            with self._lock:
+                pending = self._buffers
+                self._buffers = {}
+                self._depth = 0
+
+            for table, rows in pending.items():
+                for start in range(0, len(rows), self.max_batch_size):
+                    self._flush_batch(table, rows[start:start + self.max_batch_size])
+
+    def _flush_batch(self, table: str, rows: List[Dict]):
+        started = time.perf_counter()
+        try:
+            self.flush_fn(table, rows)
+        except Exception as e:
+            self.stats["failed_rows"] += len(rows)
+            print(f"❌ Failed to flush {len(rows)} rows to {table}: {e}")
+            if self.on_failure:
+                self.on_failure(table, rows)
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stats["batches"] += 1
+        self.stats["flushed_rows"] += len(rows)
+        self.stats["max_batch_size"] = max(self.stats["max_batch_size"], len(rows))
+        self.stats["flush_time_total_ms"] += elapsed_ms
+        self.stats["last_flush_ms"] = elapsed_ms
+        self.stats["max_flush_ms"] = max(self.stats["max_flush_ms"], elapsed_ms)
+
+    # ==========================================
+    # 統計情報
+    # ==========================================
+    @property
+    def depth(self) -> int:
+        """現在キューに残っている行数"""
+        return self._depth
+
+    def get_stats(self) -> Dict:
+        """キュー深さ・バッチサイズ・フラッシュ時間の統計を取得"""
+        batches = self.stats["batches"]
+        with self._lock:
+            per_table = {table: len(rows) for table, rows in self._buffers.items()}
+        return {
+            **self.stats,
+            "queue_depth": self._depth,
+            "queue_depth_by_table": per_table,
+            "avg_batch_size": (self.stats["flushed_rows"] / batches) if batches else 0,
+            "avg_flush_ms": (self.stats["flush_time_total_ms"] / batches) if batches else 0
+        }
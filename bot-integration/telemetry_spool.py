@@ -0,0 +1,285 @@
+"""
+テレメトリのディスクスプール
+Supabaseに送れなかった行をSQLite（WALモード）に追記し、復旧後にまとめて再送する
+"""
+
+import json
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class TelemetrySpool:
+    """失敗・保留した行を保存するディスク上の追記専用キュー
+
+    メモリには最大 chunk_size × concurrency 行しか読み込まないため、
+    長時間の障害でもメモリ使用量は一定に保たれる。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        replay_fn: Callable[[str, List[Dict]], None],
+        chunk_size: int = 200,
+        concurrency: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 300.0,
+        max_rows: int = 1_000_000,
+        is_rejected: Optional[Callable[[Exception], bool]] = None,
+        max_rejected: int = 10_000
+    ):
+        """
+        Args:
+            path: SQLiteファイルのパス
+            replay_fn: (table, rows) を一括INSERTする関数。失敗時は例外を送出
+            chunk_size: 1回の再送で送る最大行数
+            concurrency: 同時に再送するチャンク数
+            base_delay: 再送失敗時のバックオフ初期値（秒）
+            max_delay: バックオフの上限（秒）
+            max_rows: スプールの最大行数（超過分は古い行から破棄）
+            is_rejected: 送り直しても成功しない失敗か（例: 4xx）を判定する関数。
+                該当するチャンクは二分して送り直し、拒否される行だけを rejected テーブルに隔離する
+            max_rejected: 隔離しておく行数の上限（超過分は古い行から削除）
+        """
+        self.path = path
+        self.replay_fn = replay_fn
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_rows = max_rows
+        self.is_rejected = is_rejected or (lambda error: False)
+        self.max_rejected = max_rejected
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " tbl TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rejected ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " tbl TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " error TEXT,"
+            " created_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+        # 行数はメモリ上で数える（COUNT(*) は起動時の1回だけ）
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._failures = 0
+
+        self.stats = {
+            "spooled_rows": 0,
+            "replayed_rows": 0,
+            "dropped_rows": 0,
+            "rejected_rows": 0,
+            "replay_failures": 0
+        }
+
+    # ==========================================
+    # 書き込み
+    # ==========================================
+    def append(self, table: str, rows: List[Dict]):
+        """行をスプールに追記"""
+        now = time.time()
+        records = [(table, json.dumps(row, default=str), now) for row in rows]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO spool (tbl, payload, created_at) VALUES (?, ?, ?)", records
+            )
+            self._rows += len(records)
+            self.stats["spooled_rows"] += len(records)
+            self._trim()
+        self._wakeup.set()
+
+    def _trim(self):
+        """最大行数を超えた古い行を破棄（ロック取得済みで呼ぶ）"""
+        overflow = self._rows - self.max_rows
+        if overflow > 0:
+            dropped = self._conn.execute(
+                "DELETE FROM spool WHERE id IN (SELECT id FROM spool ORDER BY id LIMIT ?)",
+                (overflow,)
+            ).rowcount
+            self._rows -= dropped
+            self.stats["dropped_rows"] += dropped
+
+    def pending_count(self) -> int:
+        """スプールに残っている行数"""
+        return self._rows
+
+    def record_failure(self):
+        """直接送信が失敗したことを記録（復旧するまで新しい行はスプールへ回す）"""
+        self._failures = max(self._failures, 1)
+
+    @property
+    def degraded(self) -> bool:
+        """バックエンドが応答していないと判断されているか"""
+        return self._failures > 0
+
+    # ==========================================
+    # 再送
+    # ==========================================
+    def start(self):
+        """バックグラウンドの再送スレッドを開始"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="telemetry-replayer", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout: float = 10.0):
+        """再送スレッドを停止（スプールの内容はディスクに残る）"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _read_chunks(self, limit: int) -> List[Tuple[str, List[int], List[Dict]]]:
+        """古い順に最大 limit 行を読み、テーブルごとのチャンクに分割"""
+        with self._lock:
+            records = self._conn.execute(
+                "SELECT id, tbl, payload FROM spool ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+
+        grouped: Dict[str, Tuple[List[int], List[Dict]]] = {}
+        for row_id, table, payload in records:
+            ids, rows = grouped.setdefault(table, ([], []))
+            ids.append(row_id)
+            rows.append(json.loads(payload))
+
+        chunks = []
+        for table, (ids, rows) in grouped.items():
+            for start in range(0, len(rows), self.chunk_size):
+                end = start + self.chunk_size
+                chunks.append((table, ids[start:end], rows[start:end]))
+        return chunks
+
+    def _replay_chunk(self, chunk: Tuple[str, List[int], List[Dict]]) -> bool:
+        table, ids, rows = chunk
+        try:
+            self.replay_fn(table, rows)
+        except Exception as e:
+            if self.is_rejected(e):
+                return self._isolate(table, ids, rows, e)
+            print(f"❌ Failed to replay {len(rows)} spooled rows to {table}: {e}")
+            return False
+
+        with self._lock:
+            # 再送中に _trim() で消された行は数えない
+            self._rows -= self._conn.executemany(
+                "DELETE FROM spool WHERE id = ?", [(i,) for i in ids]
+            ).rowcount
+        self.stats["replayed_rows"] += len(rows)
+        return True
+
+    def _isolate(self, table: str, ids: List[int], rows: List[Dict], error: Exception) -> bool:
+        """拒否されたチャンクを二分して送り直し、拒否される行だけを隔離する
+
+        拒否は障害ではないので失敗として数えない（degraded にならない）。
+        """
+        if len(rows) == 1:
+            self._quarantine(table, ids[0], rows[0], error)
+            return True
+        middle = len(rows) // 2
+        return (
+            self._replay_chunk((table, ids[:middle], rows[:middle]))
+            and self._replay_chunk((table, ids[middle:], rows[middle:]))
+        )
+
+    def _quarantine(self, table: str, row_id: int, row: Dict, error: Exception):
+        """行をスプールから rejected テーブルへ移す"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO rejected (tbl, payload, error, created_at) VALUES (?, ?, ?, ?)",
+                (table, json.dumps(row, default=str), str(error)[:1000], time.time())
+            )
+            self._rows -= self._conn.execute("DELETE FROM spool WHERE id = ?", (row_id,)).rowcount
+            self._conn.execute(
+                "DELETE FROM rejected WHERE id IN"
+                " (SELECT id FROM rejected ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                (self.max_rejected,)
+            )
+        self.stats["rejected_rows"] += 1
+        print(f"🚫 Quarantined a row rejected by {table}: {error}")
+
+    def rejected_rows(self, limit: int = 100) -> List[Tuple[str, Dict, str]]:
+        """隔離した行を新しい順に (table, row, error) で返す"""
+        with self._lock:
+            records = self._conn.execute(
+                "SELECT tbl, payload, error FROM rejected ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [(table, json.loads(payload), error) for table, payload, error in records]
+
+    def replay_once(self, executor: Optional[ThreadPoolExecutor] = None) -> bool:
+        """スプールを1ラウンド再送。全チャンク成功ならTrue
+
+        直前に失敗している場合は1チャンクだけでバックエンドの復旧を確認してから
+        並列再送に戻る（復旧直後に一斉送信しないため）。
+        """
+        probing = self.degraded
+        limit = self.chunk_size if probing else self.chunk_size * self.concurrency
+        chunks = self._read_chunks(limit)
+        if not chunks:
+            self._failures = 0
+            return True
+
+        if executor and not probing and len(chunks) > 1:
+            results = list(executor.map(self._replay_chunk, chunks))
+        else:
+            results = [self._replay_chunk(chunk) for chunk in chunks]
+
+        if all(results):
+            self._failures = 0
+            return True
+
+        self._failures += 1
+        self.stats["replay_failures"] += 1
+        return False
+
+    def _backoff_delay(self) -> float:
+        """フルジッター付き指数バックオフ（複数Botの同時再接続を分散）"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** min(self._failures, 16)))
+        return random.uniform(self.base_delay, ceiling)
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while not self._stopped.is_set():
+                if self.pending_count() == 0:
+                    self._wakeup.wait(self.max_delay)
+                    self._wakeup.clear()
+                    continue
+
+                if self.replay_once(executor):
+                    continue
+
+                # 失敗中は新規追記で起こされても待機を続ける
+                deadline = time.monotonic() + self._backoff_delay()
+                while not self._stopped.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._stopped.wait(remaining)
+
+    # ==========================================
+    # 統計情報
+    # ==========================================
+    def get_stats(self) -> Dict:
+        """スプールの統計を取得"""
+        return {
+            **self.stats,
+            "pending_rows": self.pending_count(),
+            "degraded": self.degraded,
+            "consecutive_failures": self._failures
+        }
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# テスト中は歌詞キャッシュの SQLite ファイルを作らない
+os.environ.setdefault("LYRICS_CACHE_PATH", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,75 @@
+import asyncio
+
+from active_session_sync import ActiveSessionSync
+
+
+def test_every_row_is_stamped_with_position():
+    async def main():
+        written = []
+
+        async def upsert(rows):
+            written.extend(rows)
+
+        sync = ActiveSessionSync(upsert, debounce=0)
+        sync.update("g", track_title="a", position_ms=1000, is_playing=True, voice_members_count=1)
+        await sync.flush(force=True)
+        sync.update("g", track_title="a", position_ms=1500, is_playing=True, voice_members_count=2)
+        await sync.flush(force=True)
+        assert len(written) == 2
+        assert all("updated_at" in row for row in written)
+        assert written[1]["voice_members_count"] == 2
+        assert written[1]["position_ms"] == 1500
+
+    asyncio.run(main())
+
+
+def test_forget_waits_for_inflight_flush():
+    async def main():
+        rows = {}
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def upsert(batch):
+            started.set()
+            await release.wait()
+            for row in batch:
+                rows[row["guild_id"]] = row
+
+        async def remove(guild_id):
+            await sync.forget(guild_id)
+            rows.pop(guild_id, None)
+
+        sync = ActiveSessionSync(upsert, debounce=0)
+        sync.update("g", track_title="a", position_ms=0, is_playing=True)
+        flush = asyncio.create_task(sync.flush(force=True))
+        await started.wait()
+        removal = asyncio.create_task(remove("g"))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(flush, removal)
+        assert rows == {}
+        assert sync.get_stats()["tracked_guilds"] == 0
+
+    asyncio.run(main())
+
+
+def test_unchanged_session_is_touched_on_heartbeat():
+    async def main():
+        written = []
+
+        async def upsert(rows):
+            written.extend(rows)
+
+        sync = ActiveSessionSync(upsert, debounce=0, heartbeat=60)
+        fields = {"track_title": "a", "position_ms": 0, "is_playing": False}
+        sync.update("g", **fields)
+        await sync.flush(force=True)
+        sync.update("g", **fields)
+        assert await sync.flush(force=True) == 0
+
+        sync._written_at["g"] -= 61
+        sync.update("g", **fields)
+        assert await sync.flush(force=True) == 1
+        assert set(written[-1]) == {"guild_id", "position_ms", "updated_at"}
+
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+import asyncio
+
+from command_consumer import CommandConsumer, LocalCommandSource
+from command_dispatcher import CommandDispatcher
+
+
+def _command(command_id, guild_id="g1"):
+    return {"id": command_id, "status": "processing", "payload": {"guild_id": guild_id}}
+
+
+def _dispatcher(handler, **kwargs):
+    statuses = []
+
+    async def flush(updates):
+        statuses.extend(updates)
+
+    return CommandDispatcher(handler, flush, flush_interval=0.01, **kwargs), statuses
+
+
+def _slow_handler(ran, delay=0.15):
+    async def handler(command):
+        ran.append(command["id"])
+        if command["id"] == "1":
+            await asyncio.sleep(delay)
+    return handler
+
+
+def test_queued_command_with_expired_lease_is_skipped():
+    async def main():
+        ran = []
+        dispatcher, statuses = _dispatcher(_slow_handler(ran), lease_seconds=0.05)
+        await dispatcher.submit(_command("1"))
+        await dispatcher.submit(_command("2"))
+        await dispatcher.drain()
+        assert ran == ["1"]
+        assert dispatcher.stats["lease_expired"] == 1
+        assert {u["id"]: u["status"] for u in statuses} == {"1": "completed"}
+
+    asyncio.run(main())
+
+
+def test_leases_are_renewed_while_queued():
+    async def main():
+        ran, renewed = [], []
+
+        async def renew(ids):
+            renewed.extend(ids)
+            return ids
+
+        dispatcher, _ = _dispatcher(_slow_handler(ran), lease_seconds=0.06, renew_leases_fn=renew)
+        await dispatcher.submit(_command("1"))
+        await dispatcher.submit(_command("2"))
+        await dispatcher.drain()
+        assert ran == ["1", "2"]
+        assert "2" in renewed
+        assert dispatcher.stats["lease_expired"] == 0
+
+    asyncio.run(main())
+
+
+def test_command_lost_to_another_worker_is_skipped():
+    async def main():
+        ran = []
+
+        async def renew(ids):
+            return [i for i in ids if i != "2"]
+
+        dispatcher, _ = _dispatcher(_slow_handler(ran), lease_seconds=0.06, renew_leases_fn=renew)
+        await dispatcher.submit(_command("1"))
+        await dispatcher.submit(_command("2"))
+        await dispatcher.drain()
+        assert ran == ["1"]
+        assert dispatcher.stats["lease_expired"] == 1
+
+    asyncio.run(main())
+
+
+def test_consumer_claims_only_free_capacity():
+    async def main():
+        limits = []
+        backlog = [_command(str(i), guild_id=str(i)) for i in range(10)]
+
+        async def claim(limit):
+            limits.append(limit)
+            claimed, backlog[:] = backlog[:limit], backlog[limit:]
+            return claimed
+
+        ran = []
+        dispatcher, _ = _dispatcher(_slow_handler(ran, delay=0.0), max_concurrency=3)
+        consumer = CommandConsumer(LocalCommandSource(), claim, dispatcher.submit, batch_size=10,
+                                   capacity=dispatcher.capacity)
+        assert await consumer._drain() == 3
+        assert limits == [3]
+        await dispatcher.drain()
+        while backlog:
+            await consumer._drain()
+            await dispatcher.drain()
+        assert sorted(ran, key=int) == [str(i) for i in range(10)]
+        assert max(limits) <= 3
+
+    asyncio.run(main())
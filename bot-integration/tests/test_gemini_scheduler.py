@@ -0,0 +1,71 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import gemini_scheduler
+from gemini_scheduler import DeadlineExceeded, GeminiScheduler
+
+
+def test_deadline_passing_in_queue_raises_deadline_exceeded(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(gemini_scheduler, "time", SimpleNamespace(monotonic=lambda: now[0]))
+
+    async def scenario():
+        scheduler = GeminiScheduler(max_concurrency=1)
+        release = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot("a"):
+                await release.wait()
+
+        async def waiter():
+            async with scheduler.slot("b", deadline=5):
+                pass
+
+        holding = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+
+        # ループが遅れて、枠が空く前に期限を過ぎた
+        now[0] = 10.0
+        release.set()
+        await holding
+        with pytest.raises(DeadlineExceeded):
+            await waiting
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.stats["expired"] == 1
+    assert scheduler.stats["abandoned"] == 0
+    assert scheduler.get_stats()["running"] == 0
+
+
+def test_cancelled_waiter_counts_as_abandoned():
+    async def scenario():
+        scheduler = GeminiScheduler(max_concurrency=1)
+        release = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot("a"):
+                await release.wait()
+
+        async def waiter():
+            async with scheduler.slot("b"):
+                pass
+
+        holding = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        release.set()
+        await holding
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.stats["abandoned"] == 1
+    assert scheduler.stats["granted"] == 1
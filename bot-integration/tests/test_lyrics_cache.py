@@ -0,0 +1,152 @@
+import asyncio
+
+import pytest
+
+from lyrics_cache import LyricsCache, SQLiteLyricsStore
+from multi_lyrics_api import MultiLyricsAPI, ProviderError, normalize_track_key
+from response_cache import ResponseCache, SQLiteResponseStore
+
+LYRICS = {"lyrics": "la la la", "source": "lrclib", "synced": False, "plain": "la la la"}
+
+
+def _api(providers, cache):
+    api = MultiLyricsAPI(cache=cache, mode="sequential")
+    api.adaptive = False
+    api.providers.update(providers)
+    return api
+
+
+def _counting(result=None, error=None):
+    calls = []
+
+    async def provider(title, artist):
+        calls.append(title)
+        if error is not None:
+            raise error
+        return result
+
+    provider.calls = calls
+    return provider
+
+
+def test_definitive_not_found_is_cached():
+    async def main():
+        providers = {name: _counting() for name in ("lrclib", "genius", "musixmatch", "azlyrics")}
+        cache = LyricsCache()
+        api = _api(providers, cache)
+        assert await api.fetch_lyrics("unknown", "nobody") is None
+        assert await cache.get(normalize_track_key("unknown", "nobody")) == (True, None)
+        assert await api.fetch_lyrics("unknown", "nobody") is None
+        assert all(len(p.calls) == 1 for p in providers.values())
+        assert cache.get_stats()["negative_hits"] == 2
+
+    asyncio.run(main())
+
+
+def test_transient_failure_is_not_cached():
+    async def main():
+        broken = _counting(error=asyncio.TimeoutError())
+        providers = {"lrclib": broken, "genius": _counting(), "musixmatch": _counting(), "azlyrics": _counting()}
+        cache = LyricsCache()
+        api = _api(providers, cache)
+        assert await api.fetch_lyrics("song", "artist") is None
+        assert await cache.get(normalize_track_key("song", "artist")) == (False, None)
+
+        with pytest.raises(ProviderError):
+            await api.fetch_lyrics("song", "artist", raise_errors=True)
+        assert len(broken.calls) == 2
+
+    asyncio.run(main())
+
+
+def test_miss_with_open_breaker_is_not_cached():
+    async def main():
+        providers = {name: _counting() for name in ("lrclib", "genius", "musixmatch", "azlyrics")}
+        cache = LyricsCache()
+        api = _api(providers, cache)
+        api.health["genius"]._open(backoff=False)
+
+        assert await api.fetch_lyrics("song", "artist") is None
+        assert await cache.get(normalize_track_key("song", "artist")) == (False, None)
+        with pytest.raises(ProviderError, match="genius"):
+            await api.fetch_lyrics("song", "artist", raise_errors=True)
+        assert providers["genius"].calls == []
+
+    asyncio.run(main())
+
+
+def test_found_after_failure_is_cached():
+    async def main():
+        providers = {
+            "lrclib": _counting(error=RuntimeError("boom")),
+            "genius": _counting(LYRICS),
+            "musixmatch": _counting(),
+            "azlyrics": _counting()
+        }
+        cache = LyricsCache()
+        api = _api(providers, cache)
+        assert await api.fetch_lyrics("song") == LYRICS
+        assert await cache.get(normalize_track_key("song")) == (True, LYRICS)
+
+    asyncio.run(main())
+
+
+def test_negative_entry_expires(tmp_path):
+    async def main():
+        cache = LyricsCache(negative_ttl=-1, store=SQLiteLyricsStore(str(tmp_path / "lyrics.db")))
+        await cache.put(("a", "b"), None)
+        assert await cache.get(("a", "b")) == (False, None)
+        assert cache.get_stats()["expired"] == 1
+
+    asyncio.run(main())
+
+
+def test_lyrics_store_survives_restart(tmp_path):
+    path = str(tmp_path / "lyrics.db")
+
+    async def main():
+        await LyricsCache(store=SQLiteLyricsStore(path)).put(("a", "b"), LYRICS)
+        await LyricsCache(store=SQLiteLyricsStore(path)).put(("c", "d"), None)
+
+        cache = LyricsCache(store=SQLiteLyricsStore(path))
+        assert await cache.get(("a", "b")) == (True, LYRICS)
+        assert await cache.get(("c", "d")) == (True, None)
+        stats = cache.get_stats()
+        assert stats["store_hits"] == 2
+        assert stats["negative_hits"] == 1
+
+    asyncio.run(main())
+
+
+def test_lyrics_cache_evicts_by_bytes():
+    async def main():
+        cache = LyricsCache(max_bytes=1000)
+        for i in range(20):
+            await cache.put((f"title {i}", ""), {**LYRICS, "lyrics": "x" * 100})
+        stats = cache.get_stats()
+        assert stats["bytes"] <= 1000
+        assert stats["evictions"] > 0
+        assert await cache.get(("title 19", "")) != (False, None)
+        assert await cache.get(("title 0", "")) == (False, None)
+
+    asyncio.run(main())
+
+
+def test_response_cache_lru_and_store(tmp_path):
+    path = str(tmp_path / "responses.db")
+
+    async def main():
+        cache = ResponseCache(max_entries=2, store=SQLiteResponseStore(path))
+        for prompt in ("a", "b", "c"):
+            await cache.put(1, prompt, "model", f"answer {prompt}")
+        stats = cache.get_stats()
+        assert stats["entries"] == 2 and stats["evictions"] == 1
+        # メモリから追い出された分は永続層から戻る
+        assert await cache.get(1, "a", "model") == "answer a"
+        assert cache.get_stats()["store_hits"] == 1
+
+        cache.set_enabled(2, False)
+        assert await cache.get(2, "a", "model") is None
+        assert cache.get_stats()["bypassed"] == 1
+
+    asyncio.run(main())
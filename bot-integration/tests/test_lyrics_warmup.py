@@ -0,0 +1,60 @@
+import asyncio
+import sqlite3
+
+import lyrics_warmup
+from lyrics_cache import LyricsCache
+from lyrics_warmup import LyricsWarmup, WarmupCheckpoint
+from multi_lyrics_api import MultiLyricsAPI, normalize_track_key
+
+
+class _FakeREST:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def select(self, table, params):
+        after = params.get("id", "gt.")[3:]
+        return [row for row in self.rows if row["id"] > after][:int(params["limit"])]
+
+
+def _api(monkeypatch):
+    api = MultiLyricsAPI(cache=LyricsCache(), mode="sequential")
+    api.adaptive = False
+
+    async def missing(title, artist):
+        return None
+
+    for name in api.priority:
+        api.providers[name] = missing
+    monkeypatch.setattr(lyrics_warmup, "lyrics_api", api)
+    return api
+
+
+def test_done_stays_under_sqlite_variable_limit(tmp_path):
+    checkpoint = WarmupCheckpoint(str(tmp_path / "warmup.db"))
+    checkpoint._conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    keys = [(f"title {i}", "artist") for i in range(600)]
+    checkpoint.commit_page("music_history", None, [(key, None) for key in keys[:300]])
+    assert checkpoint.done(keys) == set(keys[:300])
+
+
+def test_miss_with_open_breaker_is_retried(tmp_path, monkeypatch):
+    api = _api(monkeypatch)
+    api.health["genius"]._open(backoff=False)
+    checkpoint = WarmupCheckpoint(str(tmp_path / "warmup.db"))
+    rows = [{"id": "1", "track_title": "Song", "artist": "Artist"}]
+    warmup = LyricsWarmup(_FakeREST(rows), checkpoint)
+
+    asyncio.run(warmup.run(["music_history"]))
+    assert warmup.stats["retry"] == 1
+    assert warmup.stats["missing"] == 0
+    key = normalize_track_key("Song", "Artist")
+    assert checkpoint.done([key]) == set()
+    assert checkpoint.cursor("music_history") is None
+
+    # 全プロバイダーが「見つからない」と答えたときだけ記録する
+    api.health["genius"].state = "closed"
+    warmup = LyricsWarmup(_FakeREST(rows), checkpoint)
+    asyncio.run(warmup.run(["music_history"]))
+    assert warmup.stats["missing"] == 1
+    assert checkpoint.done([key]) == {key}
+    assert checkpoint.cursor("music_history") == "1"
@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+from multi_lyrics_api import MultiLyricsAPI, ProviderError
+from provider_health import CLOSED, HALF_OPEN, OPEN, ProviderHealth
+
+
+def _expire(health: ProviderHealth):
+    health._opened_at = time.monotonic() - health._open_seconds
+
+
+def test_not_found_does_not_open_breaker():
+    health = ProviderHealth("x", failure_threshold=3)
+    for _ in range(10):
+        assert health.allow()
+        health.record(False, 50)
+    assert health.state == CLOSED
+    assert health.success_rate < 0.5
+
+
+def test_not_found_resets_failure_streak():
+    health = ProviderHealth("x", failure_threshold=3)
+    health.record_failure(50)
+    health.record_failure(50)
+    health.record(False, 50)
+    health.record_failure(50)
+    health.record_failure(50)
+    assert health.state == CLOSED
+    health.record_failure(50)
+    assert health.state == OPEN
+
+
+def test_half_open_probe_and_backoff():
+    health = ProviderHealth("x", failure_threshold=2, open_seconds=10, max_open_seconds=30)
+    health.record_failure(50)
+    health.record_failure(50)
+    assert health.state == OPEN
+    assert not health.available()
+    assert not health.allow()
+
+    _expire(health)
+    assert health.available()
+    assert health.allow()
+    assert health.state == HALF_OPEN
+    # プローブは1件だけ
+    assert not health.allow()
+
+    health.record_failure(50)
+    assert health.state == OPEN
+    assert health._open_seconds == 20
+
+    _expire(health)
+    assert health.allow()
+    health.record_failure(50)
+    assert health._open_seconds == 30
+
+    _expire(health)
+    assert health.allow()
+    # 「歌詞なし」でも正常な応答なので閉じる
+    health.record(False, 50)
+    assert health.state == CLOSED
+    assert health._open_seconds == 10
+
+
+def test_cancelled_probe_releases_slot():
+    health = ProviderHealth("x", failure_threshold=1)
+    health.record_failure(50)
+    _expire(health)
+    assert health.allow()
+    health.cancelled()
+    assert health.allow()
+
+
+def _api(providers):
+    api = MultiLyricsAPI(mode="sequential")
+    api.providers.update(providers)
+    return api
+
+
+def test_unknown_tracks_keep_providers_available():
+    async def not_found(title, artist):
+        return None
+
+    async def main():
+        api = _api({name: not_found for name in ("lrclib", "genius", "musixmatch", "azlyrics")})
+        for i in range(20):
+            assert await api.fetch_lyrics(f"obscure {i}") is None
+        assert sorted(api.provider_order()) == sorted(api.priority)
+        assert all(h.state == CLOSED for h in api.health.values())
+
+    asyncio.run(main())
+
+
+def test_provider_errors_open_breaker():
+    async def broken(title, artist):
+        raise asyncio.TimeoutError()
+
+    async def not_found(title, artist):
+        return None
+
+    async def main():
+        api = _api({"lrclib": broken, "genius": not_found, "musixmatch": not_found, "azlyrics": not_found})
+        api.adaptive = False
+        for i in range(5):
+            await api.fetch_lyrics(f"track {i}")
+        assert api.health["lrclib"].state == OPEN
+        assert "lrclib" not in api.provider_order()
+        assert api.health["genius"].state == CLOSED
+
+    asyncio.run(main())
+
+
+def test_call_provider_wraps_errors():
+    async def broken(title, artist):
+        raise RuntimeError("boom")
+
+    async def main():
+        api = _api({"lrclib": broken})
+        try:
+            await api._call_provider("lrclib", "a", "b")
+        except ProviderError:
+            pass
+        else:
+            raise AssertionError("ProviderError expected")
+        assert api.health["lrclib"]._consecutive_failures == 1
+
+    asyncio.run(main())
@@ -0,0 +1,25 @@
+import asyncio
+
+import pytest
+
+from rate_limiter import GeminiRateLimiter
+
+
+def test_cancelled_wait_returns_reserved_tokens():
+    async def main():
+        limiter = GeminiRateLimiter(user_limit=100, guild_limit=1000, window_seconds=100, max_wait=60)
+        reservation = await limiter.acquire("u", "g", 100)
+        limiter.settle(reservation, 100)
+
+        # 100トークン分は約100秒待つので、待っている間にキャンセルする
+        waiting = asyncio.create_task(limiter.acquire("u", "g", 50))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        return limiter
+
+    limiter = asyncio.run(main())
+    assert limiter.remaining("user", "u") == pytest.approx(0, abs=1)
+    assert limiter.remaining("guild", "g") == pytest.approx(900, abs=1)
+    assert limiter.stats["allowed"] == 1
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+import session_registry
+from session_registry import SessionRegistry
+
+
+def _channel(channel_id=1, members=2):
+    return SimpleNamespace(id=channel_id, members=[SimpleNamespace(bot=False)] * members)
+
+
+def test_unchanged_sessions_are_reported_on_heartbeat(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(session_registry.time, "monotonic", lambda: clock[0])
+
+    registry = SessionRegistry(heartbeat=30)
+    registry.start("a", _channel(1), "song")
+    assert [s.guild_id for s in registry.pop_dirty()] == ["a"]
+    clock[0] += 10
+    registry.start("b", _channel(2), "song")
+    assert [s.guild_id for s in registry.pop_dirty()] == ["b"]
+    assert registry.pop_dirty() == []
+
+    clock[0] += 21
+    assert [s.guild_id for s in registry.pop_dirty()] == ["a"]
+    assert registry.pop_dirty() == []
+    clock[0] += 10
+    assert [s.guild_id for s in registry.pop_dirty()] == ["b"]
+
+
+def test_track_end_clears_track_until_next_start():
+    registry = SessionRegistry()
+    registry.start("a", _channel(), "song", 1000)
+    registry.pop_dirty()
+
+    registry.end_track("a")
+    session, = registry.pop_dirty()
+    assert session.to_fields()["track_title"] is None
+    assert not session.is_playing
+
+    registry.start("a", _channel(), "next", 2000)
+    session, = registry.pop_dirty()
+    assert session.track_title == "next" and session.is_playing
+
+
+def test_stopped_session_is_not_reported():
+    registry = SessionRegistry(heartbeat=0)
+    registry.start("a", _channel(), "song")
+    registry.pop_dirty()
+    registry.stop("a")
+    assert registry.pop_dirty() == []
+    assert len(registry) == 0
@@ -0,0 +1,106 @@
+import asyncio
+
+from stream_renderer import CODE_FENCE, StreamingMessage, split_message, split_text
+
+
+class FakeMessage:
+    def __init__(self, content: str, log: list):
+        self.content = content
+        self.log = log
+        log.append(content)
+
+    async def edit(self, content: str):
+        self.content = content
+        self.log.append(content)
+
+
+def _stream(limit: int = 2000):
+    log = []
+
+    async def send(content):
+        return FakeMessage(content, log)
+
+    stream = StreamingMessage(FakeMessage("🤔 考え中...", log), send, min_edit_interval=0, limit=limit)
+    return stream, log
+
+
+def test_split_text_prefers_newline():
+    text = "a" * 30 + "\n" + "b" * 30
+    head, tail = split_text(text, 40)
+    assert head == "a" * 30
+    assert tail == "b" * 30
+
+
+def test_split_text_reopens_code_fence():
+    text = CODE_FENCE + "py\n" + "\n".join(f"line {i}" for i in range(100)) + "\n" + CODE_FENCE
+    parts = split_message(text, 200)
+    assert all(len(part) <= 200 for part in parts)
+    assert all(part.count(CODE_FENCE) % 2 == 0 for part in parts)
+
+
+def test_split_message_short_text():
+    assert split_message("") == [""]
+    assert split_message("hello") == ["hello"]
+
+
+def test_large_chunk_never_exceeds_limit():
+    async def main():
+        stream, log = _stream()
+        await stream.append("x" * 5000)
+        await stream.append("y" * 3000)
+        text = await stream.finish()
+        assert text == "x" * 5000 + "y" * 3000
+        assert all(len(content) <= 2000 for content in log)
+        final = "".join(message.content for message in stream.messages)
+        assert final == text
+
+    asyncio.run(main())
+
+
+def test_many_small_chunks():
+    async def main():
+        stream, log = _stream(limit=100)
+        words = [f"word{i} " for i in range(200)]
+        for word in words:
+            await stream.append(word)
+        text = await stream.finish()
+        assert text == "".join(words)
+        assert all(len(content) <= 100 for content in log)
+        assert not any(message.content.endswith("▌") for message in stream.messages)
+        assert "".join(message.content for message in stream.messages).replace(" ", "") == text.replace(" ", "")
+
+    asyncio.run(main())
+
+
+def test_empty_response():
+    async def main():
+        stream, _ = _stream()
+        await stream.finish()
+        assert stream.messages[0].content == "（応答がありません）"
+
+    asyncio.run(main())
+
+
+def test_abort_without_output_replaces_placeholder():
+    async def main():
+        stream, log = _stream()
+        await stream.abort("❌ error")
+        assert stream.finished
+        assert stream.messages[-1].content == "❌ error"
+        await stream.append("late")
+        assert stream.messages[-1].content == "❌ error"
+
+    asyncio.run(main())
+
+
+def test_abort_keeps_partial_output_within_limit():
+    async def main():
+        stream, log = _stream(limit=100)
+        await stream.append("x" * 95)
+        assert stream.text == "x" * 95
+        await stream.abort("❌ error")
+        assert all(len(content) <= 100 for content in log)
+        assert stream.messages[-1].content.endswith("❌ error")
+        assert "▌" not in stream.messages[-1].content
+
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from telemetry_spool import TelemetrySpool
+
+
+def _spool(tmp_path, replay_fn=None, **kwargs):
+    sent = []
+
+    def record(table, rows):
+        sent.append((table, rows))
+
+    return TelemetrySpool(str(tmp_path / "spool.db"), replay_fn or record, **kwargs), sent
+
+
+def test_trim_drops_oldest_rows(tmp_path):
+    spool, _ = _spool(tmp_path, max_rows=5)
+    spool.append("t", [{"n": i} for i in range(4)])
+    spool.append("t", [{"n": i} for i in range(4, 8)])
+    assert spool.pending_count() == 5
+    assert spool.stats["dropped_rows"] == 3
+    chunks = spool._read_chunks(10)
+    assert [row["n"] for _, _, rows in chunks for row in rows] == [3, 4, 5, 6, 7]
+
+
+def test_row_count_survives_restart(tmp_path):
+    spool, _ = _spool(tmp_path)
+    spool.append("t", [{"n": i} for i in range(3)])
+    spool.close()
+    reopened, _ = _spool(tmp_path)
+    assert reopened.pending_count() == 3
+
+
+def test_replay_in_order_by_table(tmp_path):
+    spool, sent = _spool(tmp_path, chunk_size=2, concurrency=2)
+    spool.append("a", [{"n": 1}, {"n": 2}, {"n": 3}])
+    spool.append("b", [{"n": 4}])
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        while spool.pending_count():
+            assert spool.replay_once(executor)
+    assert sorted((table, [row["n"] for row in rows]) for table, rows in sent) == [
+        ("a", [1, 2]), ("a", [3]), ("b", [4])
+    ]
+    assert spool.stats["replayed_rows"] == 4
+    assert not spool.degraded
+
+
+def test_failed_replay_keeps_rows_and_probes(tmp_path):
+    healthy = []
+
+    def replay(table, rows):
+        if not healthy:
+            raise ConnectionError("down")
+
+    spool, _ = _spool(tmp_path, replay_fn=replay, chunk_size=2, concurrency=4)
+    spool.append("t", [{"n": i} for i in range(6)])
+    assert not spool.replay_once()
+    assert spool.degraded
+    assert spool.pending_count() == 6
+
+    # 復旧直後は1チャンクだけ送って確認する
+    healthy.append(True)
+    assert spool.replay_once()
+    assert spool.pending_count() == 4
+    assert not spool.degraded
+
+
+def test_rejected_row_does_not_block_later_rows(tmp_path):
+    sent = []
+
+    def replay(table, rows):
+        if any(row["n"] == "bad" for row in rows):
+            raise ValueError("violates check constraint")
+        sent.extend(row["n"] for row in rows)
+
+    spool, _ = _spool(
+        tmp_path, replay_fn=replay, chunk_size=8, concurrency=1,
+        is_rejected=lambda error: isinstance(error, ValueError)
+    )
+    spool.append("bot_logs", [{"n": 0}, {"n": 1}, {"n": "bad"}, {"n": 3}, {"n": 4}])
+    assert spool.replay_once()
+    assert sent == [0, 1, 3, 4]
+    assert spool.pending_count() == 0
+    assert not spool.degraded
+    assert spool.stats["rejected_rows"] == 1
+    assert spool.rejected_rows() == [("bot_logs", {"n": "bad"}, "violates check constraint")]
+
+    # 後から来た行もそのまま送られる
+    spool.append("bot_logs", [{"n": 5}])
+    assert spool.replay_once()
+    assert sent[-1] == 5
+
+
+def test_rejected_row_found_while_probing_ends_degraded_mode(tmp_path):
+    def replay(table, rows):
+        if any(row["n"] == "bad" for row in rows):
+            raise ValueError("bad request")
+
+    spool, _ = _spool(
+        tmp_path, replay_fn=replay, chunk_size=4,
+        is_rejected=lambda error: isinstance(error, ValueError)
+    )
+    spool.record_failure()
+    spool.append("t", [{"n": "bad"}, {"n": 1}, {"n": 2}])
+    assert spool.replay_once()
+    assert not spool.degraded
+    assert spool.pending_count() == 0
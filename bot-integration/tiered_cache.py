@@ -0,0 +1,187 @@
+"""
+2層キャッシュ（メモリLRU → SQLite）
+応答キャッシュと歌詞キャッシュで共通の部分。値はJSONにできるもの（None も保存できる）
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class SQLiteStore:
+    """キャッシュの永続層（key -> payload, expires_at。payload が NULL の行は値が None）"""
+
+    def __init__(self, path: str, table: str):
+        self.table = table
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " key TEXT PRIMARY KEY,"
+            " payload TEXT,"
+            " expires_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[Optional[str], float]]:
+        """(payload, expires_at)。無い・期限切れなら None（期限切れの行は削除）"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT payload, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[1] <= time.time():
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+        return row
+
+    def put(self, key: str, payload: Optional[str], expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, payload, expires_at) VALUES (?, ?, ?)",
+                (key, payload, expires_at)
+            )
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),)
+            ).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class TieredCache:
+    """メモリLRU（件数・バイト数で上限）と任意の永続層の2層キャッシュ
+
+    メモリ層はイベントループ上でそのまま参照し、永続層へのアクセスだけを
+    スレッドに逃がす。永続層でヒットした値はメモリ層に昇格する。
+    get() は (ヒットしたか, 値) を返す（None が保存されている場合は (True, None)）。
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        store: Optional[SQLiteStore] = None,
+        label: str = "Cache"
+    ):
+        """
+        Args:
+            max_entries: メモリ層の最大件数（None なら件数では制限しない）
+            max_bytes: メモリ層の合計バイト数の上限（None ならバイト数では制限しない）
+            store: 永続層（None ならメモリのみ）
+            label: ログに表示する名前
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.store = store
+        self.label = label
+
+        # key -> (value, expires_at, size)
+        self._entries: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+
+        self.stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "store_hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evictions": 0,
+            "stores": 0
+        }
+
+    # ==========================================
+    # 参照・保存
+    # ==========================================
+    async def get(self, key: str) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at, _ = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                self.stats["memory_hits"] += 1
+                return True, value
+            self._discard(key)
+            self.stats["expired"] += 1
+
+        if self.store is not None:
+            try:
+                row = await asyncio.to_thread(self.store.get, key)
+            except Exception as e:
+                print(f"⚠️ {self.label} store read failed: {e}")
+                row = None
+            if row is not None:
+                payload, expires_at = row
+                value = json.loads(payload) if payload is not None else None
+                self._remember(key, value, expires_at, _size(payload))
+                self.stats["hits"] += 1
+                self.stats["store_hits"] += 1
+                return True, value
+
+        self.stats["misses"] += 1
+        return False, None
+
+    async def put(self, key: str, value: Any, ttl: float):
+        """値を ttl 秒保存"""
+        payload = json.dumps(value, ensure_ascii=False) if value is not None else None
+        expires_at = time.time() + ttl
+        self._remember(key, value, expires_at, _size(payload))
+        self.stats["stores"] += 1
+
+        if self.store is not None:
+            try:
+                await asyncio.to_thread(self.store.put, key, payload, expires_at)
+            except Exception as e:
+                print(f"⚠️ {self.label} store write failed: {e}")
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    # ==========================================
+    # メモリ層
+    # ==========================================
+    def _remember(self, key: str, value: Any, expires_at: float, size: int):
+        # キーとタプルの分の概算を足す
+        size += len(key) + 64
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        self._discard(key)
+        self._entries[key] = (value, expires_at, size)
+        self._bytes += size
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.stats["evictions"] += 1
+
+    def _discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    # ==========================================
+    # 統計情報
+    # ==========================================
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return (self.stats["hits"] / lookups) if lookups else 0
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, "entries": len(self._entries), "bytes": self._bytes}
+
+
+def _size(payload: Optional[str]) -> int:
+    return len(payload.encode("utf-8")) if payload else 0
@@ -0,0 +1,167 @@
+"""
+Gemini使用量のインプロセス集計
+(guild, user, model, 分) ごとにトークン数とリクエスト数を加算し、
+一定間隔で集計済みの行をまとめて書き込む
+"""
+
+import atexit
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+COUNTER_FIELDS = ("request_count", "prompt_tokens", "completion_tokens", "total_tokens")
+
+
+class UsageAggregator:
+    """使用量カウンターをメモリ上で集計し、間隔ごとに一括で加算書き込みするアグリゲーター
+
+    1リクエスト1行ではなく、1分バケットごとに1行だけ書き込む。書き込みは
+    加算（既存の行があれば足し込む）なので、同じバケットを複数回フラッシュしてもよい。
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[Dict]], None],
+        flush_interval: float = 15.0,
+        bucket_seconds: int = 60,
+        max_keys: int = 50000
+    ):
+        """
+        Args:
+            flush_fn: 集計行のリストを受け取り加算UPSERTする関数。失敗時は例外を送出
+            flush_interval: フラッシュ間隔（秒）
+            bucket_seconds: 集計バケットの幅（秒）
+            max_keys: この数のカウンターが溜まったら即時フラッシュ（2倍を超える新しいキーは破棄）
+        """
+        self.flush_fn = flush_fn
+        self.flush_interval = flush_interval
+        self.bucket_seconds = bucket_seconds
+        self.max_keys = max_keys
+
+        self._counters: Dict[Tuple, List[int]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.stats = {
+            "recorded": 0,
+            "flushed_rows": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "dropped_keys": 0
+        }
+
+    # ==========================================
+    # ライフサイクル
+    # ==========================================
+    def start(self):
+        """フラッシュスレッドを開始し、終了時フラッシュを登録"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="usage-aggregator", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def close(self, timeout: float = 10.0):
+        """スレッドを停止し、残りのカウンターを書き込む"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            self.flush()
+
+    # ==========================================
+    # 集計
+    # ==========================================
+    def _bucket(self, timestamp: float) -> str:
+        start = int(timestamp // self.bucket_seconds * self.bucket_seconds)
+        return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(start))
+
+    def record(
+        self,
+        guild_id,
+        user_id,
+        model: str,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        total_tokens: int = 0,
+        timestamp: Optional[float] = None
+    ):
+        """1リクエスト分の使用量を加算（ネットワークI/Oは行わない）"""
+        key = (str(guild_id), str(user_id), model, self._bucket(timestamp or time.time()))
+        with self._lock:
+            self._add(key, (1, prompt_tokens or 0, completion_tokens or 0, total_tokens or 0))
+            self.stats["recorded"] += 1
+            if len(self._counters) >= self.max_keys:
+                self._wakeup.set()
+
+    def _add(self, key: Tuple, values) -> bool:
+        """カウンターに加算（ロック取得済みで呼ぶ）。上限で追加できなければ False"""
+        counter = self._counters.get(key)
+        if counter is None:
+            if len(self._counters) >= self.max_keys * 2:
+                self.stats["dropped_keys"] += 1
+                return False
+            counter = self._counters[key] = [0] * len(COUNTER_FIELDS)
+        for index, value in enumerate(values):
+            counter[index] += value
+        return True
+
+    def flush(self) -> int:
+        """集計済みのカウンターを1回で書き込む。失敗した分はカウンターに戻す"""
+        with self._flush_lock:
+            with self._lock:
+                pending = self._counters
+                self._counters = {}
+            if not pending:
+                return 0
+
+            rows = [
+                {
+                    "guild_id": guild_id,
+                    "user_id": user_id,
+                    "model": model,
+                    "bucket_start": bucket_start,
+                    **dict(zip(COUNTER_FIELDS, values))
+                }
+                for (guild_id, user_id, model, bucket_start), values in pending.items()
+            ]
+            try:
+                self.flush_fn(rows)
+            except Exception as e:
+                self.stats["failed_flushes"] += 1
+                print(f"❌ Failed to flush {len(rows)} Gemini usage rows: {e}")
+                # 次のフラッシュで再送（その間の加算とはマージされる）
+                with self._lock:
+                    for key, values in pending.items():
+                        self._add(key, values)
+                return 0
+
+            self.stats["flushes"] += 1
+            self.stats["flushed_rows"] += len(rows)
+            return len(rows)
+
+    # ==========================================
+    # 統計情報
+    # ==========================================
+    def get_stats(self) -> Dict:
+        with self._lock:
+            keys = len(self._counters)
+        recorded = self.stats["recorded"]
+        return {
+            **self.stats,
+            "pending_keys": keys,
+            # 1行あたりのリクエスト数（書き込み削減率の目安）
+            "requests_per_row": (recorded / self.stats["flushed_rows"]) if self.stats["flushed_rows"] else 0
+        }
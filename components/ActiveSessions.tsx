@@ -3,6 +3,7 @@
 import { useEffect, useState } from 'react'
 import { getActiveSessions } from '@/lib/supabase'
 import { Database } from '@/lib/database.types'
+import { estimatePositionMs } from '@/lib/utils'
 
 type ActiveSession = Database['public']['Tables']['active_sessions']['Row']
 
@@ -40,9 +41,15 @@ export default function ActiveSessions() {
       </div>
       <div className="divide-y">
         {sessions.map((session) => {
-          const progress = (session.position_ms / session.duration_ms) * 100
-          const posMin = Math.floor(session.position_ms / 60000)
-          const posSec = Math.floor((session.position_ms % 60000) / 1000)
+          const positionMs = estimatePositionMs(
+            session.position_ms,
+            session.duration_ms,
+            session.is_playing,
+            session.updated_at
+          )
+          const progress = (positionMs / session.duration_ms) * 100
+          const posMin = Math.floor(positionMs / 60000)
+          const posSec = Math.floor((positionMs % 60000) / 1000)
           const durMin = Math.floor(session.duration_ms / 60000)
           const durSec = Math.floor((session.duration_ms % 60000) / 1000)
 
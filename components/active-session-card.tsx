@@ -5,6 +5,7 @@ import { Button } from "@/components/ui/button";
 import { Badge } from "@/components/ui/badge";
 import { Play, Pause, SkipForward } from "lucide-react";
 import { supabase } from "@/lib/supabase";
+import { estimatePositionMs } from "@/lib/utils";
 import { toast } from "sonner";
 
 interface ActiveSessionCardProps {
@@ -13,6 +14,7 @@ interface ActiveSessionCardProps {
   positionMs: number | null;
   durationMs: number | null;
   isPlaying: boolean | null;
+  updatedAt?: string | null;
 }
 
 export function ActiveSessionCard({
@@ -21,8 +23,10 @@ export function ActiveSessionCard({
   positionMs,
   durationMs,
   isPlaying,
+  updatedAt,
 }: ActiveSessionCardProps) {
-  const progress = positionMs && durationMs ? (positionMs / durationMs) * 100 : 0;
+  const currentMs = estimatePositionMs(positionMs, durationMs, isPlaying, updatedAt);
+  const progress = durationMs ? (currentMs / durationMs) * 100 : 0;
 
   const sendCommand = async (command: string, payload?: any) => {
     const { error } = await supabase
@@ -64,7 +68,7 @@ export function ActiveSessionCard({
               />
             </div>
             <div className="flex justify-between text-xs text-slate-500">
-              <span>{formatTime(positionMs || 0)}</span>
+              <span>{formatTime(currentMs)}</span>
               <span>{formatTime(durationMs || 0)}</span>
             </div>
           </div>
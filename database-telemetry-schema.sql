@@ -0,0 +1,455 @@
+-- ==========================================
+-- テレメトリ拡張スキーマ
+-- ==========================================
+-- database-updated.sql の実行後に実行してください
+
+-- ==========================================
+-- system_stats: 5分ウィンドウの集計値
+-- ==========================================
+-- cpu_usage / memory_rss / ping_gateway には平均値が入り、
+-- 以下の列に同じウィンドウの最小・最大・p95が入る
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS sample_count INTEGER DEFAULT 0;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS cpu_usage_min REAL;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS cpu_usage_max REAL;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS cpu_usage_p95 REAL;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS memory_rss_min REAL;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS memory_rss_max REAL;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS memory_rss_p95 REAL;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS ping_gateway_min REAL;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS ping_gateway_max REAL;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS ping_gateway_p95 REAL;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS loop_lag_avg REAL;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS loop_lag_min REAL;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS loop_lag_max REAL;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS loop_lag_p95 REAL;
+
+-- Geminiスケジューラーの実行枠の待ち時間・処理時間（ミリ秒、同じウィンドウ内）
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS gemini_requests INTEGER DEFAULT 0;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS gemini_queue_wait_p50 REAL;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS gemini_queue_wait_p95 REAL;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS gemini_queue_wait_max REAL;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS gemini_service_p50 REAL;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS gemini_service_p95 REAL;
+ALTER TABLE system_stats ADD COLUMN IF NOT EXISTS gemini_service_max REAL;
+
+-- ==========================================
+-- command_queue: 複数Botプロセスによる原子的な確保
+-- ==========================================
+ALTER TABLE command_queue ADD COLUMN IF NOT EXISTS worker_id TEXT;
+ALTER TABLE command_queue ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ;
+ALTER TABLE command_queue ADD COLUMN IF NOT EXISTS attempts INTEGER DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_command_queue_pending
+  ON command_queue(created_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_command_queue_lease
+  ON command_queue(lease_expires_at) WHERE status = 'processing';
+
+-- pending（またはリース期限切れの processing）のコマンドを最大 p_limit 件確保する。
+-- FOR UPDATE SKIP LOCKED により、同時に呼んだ他のプロセスとは重複しない。
+CREATE OR REPLACE FUNCTION claim_commands(
+  p_worker_id TEXT,
+  p_limit INTEGER DEFAULT 10,
+  p_lease_seconds INTEGER DEFAULT 60
+)
+RETURNS SETOF command_queue
+LANGUAGE sql
+AS $$
+  UPDATE command_queue AS c
+  SET status = 'processing',
+      worker_id = p_worker_id,
+      lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+      attempts = COALESCE(c.attempts, 0) + 1,
+      updated_at = NOW()
+  WHERE c.id IN (
+    SELECT id FROM command_queue
+    WHERE status = 'pending'
+       OR (status = 'processing' AND lease_expires_at < NOW())
+    ORDER BY created_at
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  )
+  RETURNING c.*;
+$$;
+
+-- 複数コマンドのステータス遷移を1回の文で反映する。
+-- p_updates: [{"id": "...", "status": "completed", "result": null, "error": null}, ...]
+-- p_worker_id を指定すると、そのプロセスが確保しているコマンドだけを更新する。
+CREATE OR REPLACE FUNCTION update_command_statuses(
+  p_updates JSONB,
+  p_worker_id TEXT DEFAULT NULL
+)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+  WITH u AS (
+    SELECT * FROM jsonb_to_recordset(p_updates)
+      AS x(id UUID, status TEXT, result TEXT, error TEXT)
+  ), updated AS (
+    UPDATE command_queue AS c
+    SET status = u.status,
+        result = COALESCE(u.result, c.result),
+        error = COALESCE(u.error, c.error),
+        completed_at = CASE WHEN u.status IN ('completed', 'failed') THEN NOW() ELSE c.completed_at END,
+        lease_expires_at = CASE WHEN u.status IN ('completed', 'failed') THEN NULL ELSE c.lease_expires_at END,
+        updated_at = NOW()
+    FROM u
+    WHERE c.id = u.id
+      AND (p_worker_id IS NULL OR c.worker_id = p_worker_id)
+    RETURNING 1
+  )
+  SELECT COUNT(*)::INTEGER FROM updated;
+$$;
+
+-- 待機中・実行中のコマンドのリースをまとめて延長し、延長できたIDを返す。
+-- 期限切れで他のプロセスに再確保されたコマンドは延長されない（呼び出し側で実行を取りやめる）。
+CREATE OR REPLACE FUNCTION renew_command_leases(
+  p_ids UUID[],
+  p_worker_id TEXT,
+  p_lease_seconds INTEGER DEFAULT 60
+)
+RETURNS TABLE (id UUID)
+LANGUAGE sql
+AS $$
+  UPDATE command_queue AS c
+  SET lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+      updated_at = NOW()
+  WHERE c.id = ANY(p_ids)
+    AND c.worker_id = p_worker_id
+    AND c.status = 'processing'
+  RETURNING c.id;
+$$;
+
+-- ==========================================
+-- system_stats: 1分 / 1時間 / 1日のロールアップ
+-- ==========================================
+-- system_stats へのINSERTごとにトリガーで該当バケットを加算更新する。
+-- グラフはロールアップを読むので、生データの行数に関係なく一定のコストで描画できる。
+--
+-- p95 は固定幅ヒストグラムから求める（最後のビンはそれ以上の値をすべて含む）:
+--   cpu_usage     2%   × 50ビン（0-100%）
+--   memory_rss    32MB × 64ビン（0-2GB）
+--   ping_gateway  10ms × 50ビン（0-500ms）
+--   ping_lavalink 10ms × 50ビン（0-500ms）
+CREATE TABLE IF NOT EXISTS system_stats_rollups (
+  resolution TEXT NOT NULL CHECK (resolution IN ('1m', '1h', '1d')),
+  bot_id TEXT NOT NULL DEFAULT 'primary',
+  bucket_start TIMESTAMPTZ NOT NULL,
+  samples INTEGER NOT NULL DEFAULT 0,
+  cpu_usage_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  cpu_usage_max REAL,
+  cpu_usage_hist INTEGER[],
+  memory_rss_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  memory_rss_max REAL,
+  memory_rss_hist INTEGER[],
+  ping_gateway_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  ping_gateway_max REAL,
+  ping_gateway_hist INTEGER[],
+  ping_lavalink_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  ping_lavalink_max REAL,
+  ping_lavalink_hist INTEGER[],
+  updated_at TIMESTAMPTZ DEFAULT NOW(),
+  PRIMARY KEY (resolution, bot_id, bucket_start)
+);
+
+-- 他のテレメトリテーブルと同じく読み取りだけを公開（書き込みはトリガーとサービスロールのみ）
+ALTER TABLE system_stats_rollups ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow anonymous read access" ON system_stats_rollups;
+CREATE POLICY "Allow anonymous read access" ON system_stats_rollups FOR SELECT USING (true);
+
+CREATE INDEX IF NOT EXISTS idx_system_stats_recorded_at ON system_stats(recorded_at);
+
+-- ヒストグラムに1件加算（範囲外の値は両端のビンに入れる）
+CREATE OR REPLACE FUNCTION stats_hist_add(
+  p_hist INTEGER[],
+  p_value DOUBLE PRECISION,
+  p_bin_width DOUBLE PRECISION,
+  p_bins INTEGER
+)
+RETURNS INTEGER[]
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+DECLARE
+  h INTEGER[] := COALESCE(p_hist, array_fill(0, ARRAY[p_bins]));
+  i INTEGER;
+BEGIN
+  IF p_value IS NULL THEN
+    RETURN h;
+  END IF;
+  i := LEAST(p_bins, GREATEST(1, floor(p_value / p_bin_width)::INTEGER + 1));
+  h[i] := h[i] + 1;
+  RETURN h;
+END;
+$$;
+
+-- ヒストグラムから p パーセンタイル（0-1）を求める。
+-- 該当ビンの上端を返すが、実際の最大値は超えない。
+CREATE OR REPLACE FUNCTION stats_hist_percentile(
+  p_hist INTEGER[],
+  p_bin_width DOUBLE PRECISION,
+  p_max DOUBLE PRECISION,
+  p DOUBLE PRECISION DEFAULT 0.95
+)
+RETURNS DOUBLE PRECISION
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+DECLARE
+  total INTEGER := 0;
+  target INTEGER;
+  seen INTEGER := 0;
+  i INTEGER;
+BEGIN
+  IF p_hist IS NULL THEN
+    RETURN NULL;
+  END IF;
+  SELECT COALESCE(SUM(v), 0) INTO total FROM unnest(p_hist) AS v;
+  IF total = 0 THEN
+    RETURN NULL;
+  END IF;
+
+  target := GREATEST(1, ceil(p * total)::INTEGER);
+  FOR i IN 1 .. array_length(p_hist, 1) LOOP
+    seen := seen + p_hist[i];
+    IF seen >= target THEN
+      IF i = array_length(p_hist, 1) THEN
+        RETURN p_max;
+      END IF;
+      RETURN LEAST(i * p_bin_width, COALESCE(p_max, i * p_bin_width));
+    END IF;
+  END LOOP;
+  RETURN p_max;
+END;
+$$;
+
+-- 1行分を3つの解像度のバケットに加算する。
+-- max は行にウィンドウ最大値（*_max）があればそれを使い、無ければ行の値を使う。
+CREATE OR REPLACE FUNCTION system_stats_rollup_add(s system_stats)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  res TEXT;
+  unit TEXT;
+  ts TIMESTAMPTZ := COALESCE(s.recorded_at, NOW());
+BEGIN
+  FOREACH res IN ARRAY ARRAY['1m', '1h', '1d'] LOOP
+    unit := CASE res WHEN '1m' THEN 'minute' WHEN '1h' THEN 'hour' ELSE 'day' END;
+
+    INSERT INTO system_stats_rollups AS r (
+      resolution, bot_id, bucket_start, samples,
+      cpu_usage_sum, cpu_usage_max, cpu_usage_hist,
+      memory_rss_sum, memory_rss_max, memory_rss_hist,
+      ping_gateway_sum, ping_gateway_max, ping_gateway_hist,
+      ping_lavalink_sum, ping_lavalink_max, ping_lavalink_hist
+    )
+    VALUES (
+      res, COALESCE(s.bot_id, 'primary'), date_trunc(unit, ts), 1,
+      COALESCE(s.cpu_usage, 0), COALESCE(s.cpu_usage_max, s.cpu_usage),
+      stats_hist_add(NULL, s.cpu_usage, 2, 50),
+      COALESCE(s.memory_rss, 0), COALESCE(s.memory_rss_max, s.memory_rss),
+      stats_hist_add(NULL, s.memory_rss, 32, 64),
+      COALESCE(s.ping_gateway, 0), COALESCE(s.ping_gateway_max, s.ping_gateway),
+      stats_hist_add(NULL, s.ping_gateway, 10, 50),
+      COALESCE(s.ping_lavalink, 0), s.ping_lavalink,
+      stats_hist_add(NULL, s.ping_lavalink, 10, 50)
+    )
+    ON CONFLICT (resolution, bot_id, bucket_start) DO UPDATE SET
+      samples = r.samples + 1,
+      cpu_usage_sum = r.cpu_usage_sum + EXCLUDED.cpu_usage_sum,
+      cpu_usage_max = GREATEST(r.cpu_usage_max, EXCLUDED.cpu_usage_max),
+      cpu_usage_hist = stats_hist_add(r.cpu_usage_hist, s.cpu_usage, 2, 50),
+      memory_rss_sum = r.memory_rss_sum + EXCLUDED.memory_rss_sum,
+      memory_rss_max = GREATEST(r.memory_rss_max, EXCLUDED.memory_rss_max),
+      memory_rss_hist = stats_hist_add(r.memory_rss_hist, s.memory_rss, 32, 64),
+      ping_gateway_sum = r.ping_gateway_sum + EXCLUDED.ping_gateway_sum,
+      ping_gateway_max = GREATEST(r.ping_gateway_max, EXCLUDED.ping_gateway_max),
+      ping_gateway_hist = stats_hist_add(r.ping_gateway_hist, s.ping_gateway, 10, 50),
+      ping_lavalink_sum = r.ping_lavalink_sum + EXCLUDED.ping_lavalink_sum,
+      ping_lavalink_max = GREATEST(r.ping_lavalink_max, EXCLUDED.ping_lavalink_max),
+      ping_lavalink_hist = stats_hist_add(r.ping_lavalink_hist, s.ping_lavalink, 10, 50),
+      updated_at = NOW();
+  END LOOP;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION system_stats_rollup_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  PERFORM system_stats_rollup_add(NEW);
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_system_stats_rollup ON system_stats;
+CREATE TRIGGER trg_system_stats_rollup
+  AFTER INSERT ON system_stats
+  FOR EACH ROW EXECUTE FUNCTION system_stats_rollup_trigger();
+
+-- 既存データからロールアップを作る場合（初回のみ、必要なら実行）:
+-- SELECT system_stats_rollup_add(s) FROM system_stats s ORDER BY recorded_at;
+
+-- グラフ用ビュー（resolution と bucket_start で絞り込んで使う）
+CREATE OR REPLACE VIEW system_stats_history AS
+SELECT
+  resolution,
+  bot_id,
+  bucket_start,
+  samples,
+  cpu_usage_sum / NULLIF(samples, 0) AS cpu_usage_avg,
+  cpu_usage_max,
+  stats_hist_percentile(cpu_usage_hist, 2, cpu_usage_max) AS cpu_usage_p95,
+  memory_rss_sum / NULLIF(samples, 0) AS memory_rss_avg,
+  memory_rss_max,
+  stats_hist_percentile(memory_rss_hist, 32, memory_rss_max) AS memory_rss_p95,
+  ping_gateway_sum / NULLIF(samples, 0) AS ping_gateway_avg,
+  ping_gateway_max,
+  stats_hist_percentile(ping_gateway_hist, 10, ping_gateway_max) AS ping_gateway_p95,
+  ping_lavalink_sum / NULLIF(samples, 0) AS ping_lavalink_avg,
+  ping_lavalink_max,
+  stats_hist_percentile(ping_lavalink_hist, 10, ping_lavalink_max) AS ping_lavalink_p95
+FROM system_stats_rollups;
+
+-- ==========================================
+-- system_stats: 保持期間
+-- ==========================================
+-- p_max_age_days より古い生データを最大 p_batch_size 行削除し、削除件数を返す。
+-- 1回の削除を小さく保つため、呼び出し側で件数が p_batch_size 未満になるまで繰り返す。
+CREATE OR REPLACE FUNCTION prune_system_stats(
+  p_max_age_days INTEGER DEFAULT 7,
+  p_batch_size INTEGER DEFAULT 5000
+)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+  WITH doomed AS (
+    SELECT id FROM system_stats
+    WHERE recorded_at < NOW() - make_interval(days => p_max_age_days)
+    ORDER BY recorded_at
+    LIMIT p_batch_size
+  ), deleted AS (
+    DELETE FROM system_stats AS s
+    USING doomed
+    WHERE s.id = doomed.id
+    RETURNING 1
+  )
+  SELECT COUNT(*)::INTEGER FROM deleted;
+$$;
+
+-- 指定解像度のロールアップのうち古いものを削除（1m / 1h は短期間だけ保持する）
+CREATE OR REPLACE FUNCTION prune_system_stats_rollups(
+  p_resolution TEXT,
+  p_max_age_days INTEGER,
+  p_batch_size INTEGER DEFAULT 5000
+)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+  WITH doomed AS (
+    SELECT resolution, bot_id, bucket_start FROM system_stats_rollups
+    WHERE resolution = p_resolution
+      AND bucket_start < NOW() - make_interval(days => p_max_age_days)
+    ORDER BY bucket_start
+    LIMIT p_batch_size
+  ), deleted AS (
+    DELETE FROM system_stats_rollups AS r
+    USING doomed
+    WHERE r.resolution = doomed.resolution
+      AND r.bot_id = doomed.bot_id
+      AND r.bucket_start = doomed.bucket_start
+    RETURNING 1
+  )
+  SELECT COUNT(*)::INTEGER FROM deleted;
+$$;
+
+-- ==========================================
+-- gemini_usage: 分単位の集計行
+-- ==========================================
+-- Botは (guild, user, model, 分) ごとに使用量をメモリ上で集計し、add_gemini_usage で加算する。
+-- 集計行は bucket_start に分の先頭、request_count にリクエスト数が入る。
+-- 1リクエスト1行の raw モードの行は bucket_start が NULL、request_count が 1。
+ALTER TABLE gemini_usage ADD COLUMN IF NOT EXISTS request_count INTEGER DEFAULT 1;
+ALTER TABLE gemini_usage ADD COLUMN IF NOT EXISTS bucket_start TIMESTAMPTZ;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_gemini_usage_bucket
+  ON gemini_usage(guild_id, user_id, model, bucket_start);
+
+-- p_rows: [{"guild_id", "user_id", "model", "bucket_start",
+--           "request_count", "prompt_tokens", "completion_tokens", "total_tokens"}, ...]
+-- 同じバケットの行が既にあれば各カウンターを足し込む。
+CREATE OR REPLACE FUNCTION add_gemini_usage(p_rows JSONB)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+  WITH upserted AS (
+    INSERT INTO gemini_usage AS g (
+      guild_id, user_id, model, bucket_start, recorded_at,
+      request_count, prompt_tokens, completion_tokens, total_tokens
+    )
+    SELECT guild_id, user_id, model, bucket_start, bucket_start,
+           request_count, prompt_tokens, completion_tokens, total_tokens
+    FROM jsonb_to_recordset(p_rows) AS x(
+      guild_id TEXT,
+      user_id TEXT,
+      model TEXT,
+      bucket_start TIMESTAMPTZ,
+      request_count INTEGER,
+      prompt_tokens INTEGER,
+      completion_tokens INTEGER,
+      total_tokens INTEGER
+    )
+    ON CONFLICT (guild_id, user_id, model, bucket_start) DO UPDATE SET
+      request_count = g.request_count + EXCLUDED.request_count,
+      prompt_tokens = g.prompt_tokens + EXCLUDED.prompt_tokens,
+      completion_tokens = g.completion_tokens + EXCLUDED.completion_tokens,
+      total_tokens = g.total_tokens + EXCLUDED.total_tokens
+    RETURNING 1
+  )
+  SELECT COUNT(*)::INTEGER FROM upserted;
+$$;
+
+-- 起動時のレート制限の復元用: p_since 以降のユーザー・ギルド・分ごとのトークン使用量（時刻順）
+CREATE OR REPLACE FUNCTION gemini_usage_since(p_since TIMESTAMPTZ)
+RETURNS TABLE (guild_id TEXT, user_id TEXT, minute TIMESTAMPTZ, total_tokens BIGINT)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT g.guild_id,
+         g.user_id,
+         date_trunc('minute', COALESCE(g.bucket_start, g.recorded_at)) AS minute,
+         SUM(g.total_tokens)::BIGINT
+  FROM gemini_usage AS g
+  WHERE COALESCE(g.bucket_start, g.recorded_at) >= p_since
+  GROUP BY 1, 2, 3
+  ORDER BY 3;
+$$;
+
+-- ==========================================
+-- active_sessions: 生存確認
+-- ==========================================
+-- Botは再生中のギルドの行を変化が無くても定期的に更新する（updated_at）。
+-- p_max_age_seconds 以上更新されていない行（落ちたプロセスが残した行）を削除し、削除件数を返す。
+CREATE INDEX IF NOT EXISTS idx_active_sessions_updated_at ON active_sessions(updated_at);
+
+CREATE OR REPLACE FUNCTION prune_stale_active_sessions(
+  p_max_age_seconds INTEGER DEFAULT 300
+)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+  WITH deleted AS (
+    DELETE FROM active_sessions
+    WHERE updated_at < NOW() - make_interval(secs => p_max_age_seconds)
+    RETURNING 1
+  )
+  SELECT COUNT(*)::INTEGER FROM deleted;
+$$;
+
+-- ==========================================
+-- 歌詞キャッシュのウォームアップ: アーティスト
+-- ==========================================
+-- lyrics_warmup.py は曲名とアーティストで歌詞を検索する（不明な場合は NULL のまま）
+ALTER TABLE music_history ADD COLUMN IF NOT EXISTS artist TEXT;
+ALTER TABLE IF EXISTS playlist_tracks ADD COLUMN IF NOT EXISTS artist TEXT;
@@ -26,6 +26,27 @@ export interface Database {
           recorded_at: string
           updated_at: string
           created_at: string
+          sample_count: number | null
+          cpu_usage_min: number | null
+          cpu_usage_max: number | null
+          cpu_usage_p95: number | null
+          memory_rss_min: number | null
+          memory_rss_max: number | null
+          memory_rss_p95: number | null
+          ping_gateway_min: number | null
+          ping_gateway_max: number | null
+          ping_gateway_p95: number | null
+          loop_lag_avg: number | null
+          loop_lag_min: number | null
+          loop_lag_max: number | null
+          loop_lag_p95: number | null
+          gemini_requests: number | null
+          gemini_queue_wait_p50: number | null
+          gemini_queue_wait_p95: number | null
+          gemini_queue_wait_max: number | null
+          gemini_service_p50: number | null
+          gemini_service_p95: number | null
+          gemini_service_max: number | null
         }
         Insert: {
           id?: string
@@ -43,6 +64,27 @@ export interface Database {
           recorded_at?: string
           updated_at?: string
           created_at?: string
+          sample_count?: number | null
+          cpu_usage_min?: number | null
+          cpu_usage_max?: number | null
+          cpu_usage_p95?: number | null
+          memory_rss_min?: number | null
+          memory_rss_max?: number | null
+          memory_rss_p95?: number | null
+          ping_gateway_min?: number | null
+          ping_gateway_max?: number | null
+          ping_gateway_p95?: number | null
+          loop_lag_avg?: number | null
+          loop_lag_min?: number | null
+          loop_lag_max?: number | null
+          loop_lag_p95?: number | null
+          gemini_requests?: number | null
+          gemini_queue_wait_p50?: number | null
+          gemini_queue_wait_p95?: number | null
+          gemini_queue_wait_max?: number | null
+          gemini_service_p50?: number | null
+          gemini_service_p95?: number | null
+          gemini_service_max?: number | null
         }
         Update: {
           id?: string
@@ -60,6 +102,27 @@ export interface Database {
           recorded_at?: string
           updated_at?: string
           created_at?: string
+          sample_count?: number | null
+          cpu_usage_min?: number | null
+          cpu_usage_max?: number | null
+          cpu_usage_p95?: number | null
+          memory_rss_min?: number | null
+          memory_rss_max?: number | null
+          memory_rss_p95?: number | null
+          ping_gateway_min?: number | null
+          ping_gateway_max?: number | null
+          ping_gateway_p95?: number | null
+          loop_lag_avg?: number | null
+          loop_lag_min?: number | null
+          loop_lag_max?: number | null
+          loop_lag_p95?: number | null
+          gemini_requests?: number | null
+          gemini_queue_wait_p50?: number | null
+          gemini_queue_wait_p95?: number | null
+          gemini_queue_wait_max?: number | null
+          gemini_service_p50?: number | null
+          gemini_service_p95?: number | null
+          gemini_service_max?: number | null
         }
       }
       conversation_logs: {
@@ -165,6 +228,8 @@ export interface Database {
           total_tokens: number
           model: string
           recorded_at: string
+          request_count: number
+          bucket_start: string | null
           created_at: string
         }
         Insert: {
@@ -176,6 +241,8 @@ export interface Database {
           total_tokens?: number
           model?: string
           recorded_at?: string
+          request_count?: number
+          bucket_start?: string | null
           created_at?: string
         }
         Update: {
@@ -187,6 +254,8 @@ export interface Database {
           total_tokens?: number
           model?: string
           recorded_at?: string
+          request_count?: number
+          bucket_start?: string | null
           created_at?: string
         }
       }
@@ -354,5 +423,27 @@ export interface Database {
         }
       }
     }
+    Views: {
+      system_stats_history: {
+        Row: {
+          resolution: '1m' | '1h' | '1d'
+          bot_id: string
+          bucket_start: string
+          samples: number
+          cpu_usage_avg: number | null
+          cpu_usage_max: number | null
+          cpu_usage_p95: number | null
+          memory_rss_avg: number | null
+          memory_rss_max: number | null
+          memory_rss_p95: number | null
+          ping_gateway_avg: number | null
+          ping_gateway_max: number | null
+          ping_gateway_p95: number | null
+          ping_lavalink_avg: number | null
+          ping_lavalink_max: number | null
+          ping_lavalink_p95: number | null
+        }
+      }
+    }
   }
 }
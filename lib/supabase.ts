@@ -47,6 +47,29 @@ export async function getLatestSystemStats() {
   return data
 }
 
+// グラフ用: ロールアップ済みの avg / max / p95（生データの行数に依存しない）
+export async function getSystemStatsHistory(
+  resolution: '1m' | '1h' | '1d' = '1h',
+  since?: Date,
+  botId = 'primary'
+) {
+  let query = supabase
+    .from('system_stats_history')
+    .select('*')
+    .eq('resolution', resolution)
+    .eq('bot_id', botId)
+    .order('bucket_start', { ascending: true })
+
+  if (since) {
+    query = query.gte('bucket_start', since.toISOString())
+  }
+
+  const { data, error } = await query
+
+  if (error) throw error
+  return data
+}
+
 export async function getConversationLogs(limit = 50) {
   const { data, error } = await supabase
     .from('conversation_logs')
@@ -4,3 +4,22 @@ import { twMerge } from "tailwind-merge";
 export function cn(...inputs: ClassValue[]) {
   return twMerge(clsx(inputs));
 }
+
+/**
+ * 再生中のセッションの現在位置を推定する。
+ * Botは位置のずれが小さい間は position_ms を書き込まないため、
+ * 最後に書き込まれた位置（updated_at 時点）からの経過時間を足す。
+ */
+export function estimatePositionMs(
+  positionMs: number | null,
+  durationMs: number | null,
+  isPlaying: boolean | null,
+  updatedAt?: string | null,
+  now: number = Date.now()
+): number {
+  let position = positionMs || 0;
+  if (isPlaying && updatedAt) {
+    position += Math.max(0, now - new Date(updatedAt).getTime());
+  }
+  return durationMs ? Math.min(position, durationMs) : position;
+}